@@ -0,0 +1 @@
+"""Management module for Chat application."""
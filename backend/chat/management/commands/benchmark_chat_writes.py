@@ -0,0 +1,95 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import OperationalError, close_old_connections, connection
+
+from chat.models import ChatHistory, ChatMessage
+
+DEFAULT_CONCURRENCY = "1,8,32"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures how many chat answers per second the configured database can "
+        "record when many chats complete at once."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add command arguments."""
+        parser.add_argument(
+            "--concurrency",
+            default=DEFAULT_CONCURRENCY,
+            help="Comma-separated numbers of concurrent writers to test.",
+        )
+        parser.add_argument(
+            "--answers",
+            type=int,
+            default=2000,
+            help="Number of answers recorded per concurrency level.",
+        )
+        parser.add_argument(
+            "--unbatched",
+            action="store_true",
+            help="Write each row in its own transaction, as before the writes "
+            "made when an answer completes were batched.",
+        )
+
+    def handle(self, *args, **kwargs) -> None:  # noqa: ARG002
+        """Handle the command."""
+        levels = [int(level) for level in kwargs["concurrency"].split(",")]
+        self.batched = not kwargs["unbatched"]
+        self.stdout.write(
+            f"Database: {connection.vendor}, "
+            f"{'batched' if self.batched else 'unbatched'} writes.",
+        )
+        self.stdout.write(
+            f"{'writers':>8} {'answers/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}",
+        )
+        for level in levels:
+            histories = ChatHistory.objects.bulk_create(
+                [ChatHistory(title="") for _ in range(kwargs["answers"])],
+            )
+            try:
+                started_at = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=level) as executor:
+                    latencies = list(executor.map(self.record_answer, histories))
+                elapsed = time.perf_counter() - started_at
+            finally:
+                ChatHistory.objects.filter(pk__in=[h.pk for h in histories]).delete()
+
+            completed = [latency for latency in latencies if latency is not None]
+            p50, p99 = np.percentile(completed, [50, 99]) if completed else (0, 0)
+            self.stdout.write(
+                f"{level:>8} {len(completed) / elapsed:>10.0f} {p50:>8.1f} "
+                f"{p99:>8.1f} {len(latencies) - len(completed):>7}",
+            )
+
+    def record_answer(self, chat_history: ChatHistory) -> float | None:
+        """Write the rows of one answer, returning the latency in ms or None on error.
+
+        The user message is written when the question arrives, and the bot response
+        and title when the answer completes.
+        """
+        close_old_connections()
+        started_at = time.perf_counter()
+        try:
+            ChatMessage.objects.create(
+                chat_history=chat_history,
+                role=ChatMessage.Role.USER,
+                content="What is the average salary in the engineering department?",
+            )
+            if self.batched:
+                chat_history.save_bot_response("The average salary is 85,000.")
+            else:
+                ChatMessage.objects.create(
+                    chat_history=chat_history,
+                    role=ChatMessage.Role.BOT,
+                    content="The average salary is 85,000.",
+                )
+                chat_history.title = chat_history.derived_title
+                chat_history.save(update_fields=["title"])
+        except OperationalError:
+            return None
+        return (time.perf_counter() - started_at) * 1000
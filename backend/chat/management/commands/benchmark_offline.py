@@ -0,0 +1,401 @@
+import asyncio
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+import pandas as pd
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.test import RequestFactory, override_settings
+
+from chat.management.commands.load_test_stream import StreamResult
+from chat.models import ChatHistory
+from chat.views import astream_llm_response_view, stream_llm_response_view
+from rag.clients import RAGClient
+from rag.fakes import FakeOpenAIClient, FakePineconeClient
+
+DEFAULT_ROWS = "10000"
+DEFAULT_STREAMS = "1,10,100"
+# Rows indexed before the stream benchmark when no ingest run is requested.
+STREAM_DATASET_ROWS = 1000
+DEPARTMENTS = ("Engineering", "Finance", "HR", "IT", "Marketing", "Operations", "Sales")
+MEMORY_SAMPLE_INTERVAL = 0.05
+# Options every command has, left out of the results.
+BASE_OPTIONS = (
+    "verbosity", "settings", "pythonpath", "traceback", "no_color", "force_color",
+    "skip_checks",
+)  # fmt: skip
+
+
+class MemorySampler:
+    """Samples the resident memory of the process while the block runs."""
+
+    def __init__(self, interval: float = MEMORY_SAMPLE_INTERVAL) -> None:
+        """Initialize a sampler reading the memory every `interval` seconds."""
+        self.interval = interval
+        self.baseline_mb = self.peak_mb = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def __enter__(self) -> Self:
+        """Start sampling."""
+        self.baseline_mb = self.peak_mb = resident_memory_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Stop sampling."""
+        self._stopped.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, resident_memory_mb())
+
+    @property
+    def growth_mb(self) -> float:
+        """Return the peak memory above the memory at the start, in MB."""
+        return self.peak_mb - self.baseline_mb
+
+    def _sample(self) -> None:
+        """Keep the highest memory seen until stopped."""
+        while not self._stopped.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, resident_memory_mb())
+
+
+def resident_memory_mb() -> float:
+    """Return the resident memory of this process, in MB.
+
+    Without /proc, e.g. on macOS, the peak resident memory is returned instead.
+    """
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+    except OSError:
+        import resource  # noqa: PLC0415
+
+        # macOS reports bytes.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**20
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+@contextmanager
+def environment(**values: str) -> Iterator[None]:
+    """Set environment variables within the block."""
+    previous = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def git_commit() -> str | None:
+    """Return the commit the code runs from, if it is a git checkout."""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+    except FileNotFoundError:
+        return None
+    return result.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks ingest and chat streaming offline, with deterministic local "
+        "fakes of the OpenAI and Pinecone clients. Indexes synthetic datasets with "
+        "embed_dataset, then drives the stream view with concurrent SSE clients, "
+        "reporting throughput, time to first token and memory. Chat messages are "
+        "written to the configured database and deleted afterwards."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add command arguments."""
+        parser.add_argument(
+            "--rows",
+            default=DEFAULT_ROWS,
+            help="Comma-separated synthetic dataset sizes to index, e.g. "
+            "10000,100000,1000000. Empty to skip the ingest benchmark.",
+        )
+        parser.add_argument(
+            "--streams",
+            default=DEFAULT_STREAMS,
+            help="Comma-separated numbers of concurrent streams. Empty to skip the "
+            "stream benchmark.",
+        )
+        parser.add_argument(
+            "--async-view",
+            action="store_true",
+            help="Drive the async stream view instead of the WSGI one.",
+        )
+        parser.add_argument(
+            "--pipelined",
+            action="store_true",
+            help="Enable CHAT_PIPELINED_RETRIEVAL, e.g. to compare the time to first "
+            "token of a general-knowledge --query with and without it.",
+        )
+        parser.add_argument(
+            "--query",
+            default="Who works in the Engineering department and what do they do?",
+        )
+        parser.add_argument("--dimension", type=int, default=64)
+        parser.add_argument("--embedding-latency-ms", type=float, default=50)
+        parser.add_argument("--query-latency-ms", type=float, default=30)
+        parser.add_argument("--upsert-latency-ms", type=float, default=20)
+        parser.add_argument("--first-token-ms", type=float, default=300)
+        parser.add_argument(
+            "--tokens-per-second",
+            type=float,
+            default=50,
+            help="Generation rate after the first token. 0 for no delay.",
+        )
+        parser.add_argument("--answer-tokens", type=int, default=60)
+        parser.add_argument("--batch-size", type=int, default=256)
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output",
+            help="Write the results, with the commit and options, to this JSON file.",
+        )
+
+    def handle(self, *args, **kwargs) -> None:  # noqa: ARG002
+        """Handle the command."""
+        try:
+            row_counts = [int(rows) for rows in kwargs["rows"].split(",") if rows]
+            stream_counts = [int(level) for level in kwargs["streams"].split(",") if level]
+        except ValueError:
+            msg = "--rows and --streams must be comma-separated integers."
+            raise CommandError(msg) from None
+        if min([*row_counts, *stream_counts, kwargs["dimension"]], default=1) < 1:
+            msg = "Dataset sizes, stream counts and the dimension must be positive."
+            raise CommandError(msg)
+
+        rag_app_config = apps.get_app_config("rag")
+        previous_client = (
+            rag_app_config.rag_client if rag_app_config.rag_client_loaded else None
+        )
+        results = {
+            "commit": git_commit(),
+            "options": {
+                key: value for key, value in kwargs.items() if key not in BASE_OPTIONS
+            },
+            "ingest": [],
+            "streams": [],
+        }
+        with (
+            override_settings(CHAT_PIPELINED_RETRIEVAL=kwargs["pipelined"]),
+            tempfile.TemporaryDirectory() as tmp_dir,
+            environment(
+                EMBEDDING_MODEL=os.getenv("EMBEDDING_MODEL", "fake-embedding"),
+                EMBEDDING_CACHE_BACKEND="none",
+                RESPONSE_CACHE_ENABLED="false",
+                RAG_RETRIEVAL_MODE="inprocess",
+                RAG_INPROCESS_MAX_PENDING=str(max(stream_counts, default=1)),
+                EMPLOYEE_TABLE_PATH=str(Path(tmp_dir) / "employee_table.npz"),
+                LEXICAL_INDEX_PATH=str(Path(tmp_dir) / "lexical_index.npz"),
+            ),
+        ):
+            rag_client = RAGClient(
+                openai=FakeOpenAIClient(
+                    dimension=kwargs["dimension"],
+                    embedding_latency=kwargs["embedding_latency_ms"] / 1000,
+                    first_token_latency=kwargs["first_token_ms"] / 1000,
+                    tokens_per_second=kwargs["tokens_per_second"],
+                    answer_tokens=kwargs["answer_tokens"],
+                ),
+                vector_store=self.build_vector_store(kwargs),
+            )
+            rag_app_config.rag_client = rag_client
+            try:
+                if row_counts:
+                    self.stdout.write(
+                        f"{'rows':>8} {'seconds':>8} {'rows/s':>9} "
+                        f"{'embedding requests':>19} {'memory MB':>10}",
+                    )
+                for rows in row_counts or [STREAM_DATASET_ROWS]:
+                    rag_client.vector_store = self.build_vector_store(kwargs)
+                    result = self.benchmark_ingest(rag_client, rows, Path(tmp_dir), kwargs)
+                    if row_counts:
+                        results["ingest"].append(result)
+                        self.stdout.write(
+                            f"{rows:>8} {result['seconds']:>8.1f} "
+                            f"{result['rows_per_second']:>9.0f} "
+                            f"{result['embedding_requests']:>19} "
+                            f"{result['memory_mb']:>10.0f}",
+                        )
+
+                if stream_counts:
+                    results["streams"] = self.benchmark_streams(stream_counts, kwargs)
+            finally:
+                rag_app_config.rag_client = previous_client
+
+        if kwargs["output"]:
+            Path(kwargs["output"]).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Results written to {kwargs['output']}.")
+
+    @staticmethod
+    def build_vector_store(options: dict) -> FakePineconeClient:
+        """Build an empty fake vector index."""
+        return FakePineconeClient(
+            dimension=options["dimension"],
+            query_latency=options["query_latency_ms"] / 1000,
+            upsert_latency=options["upsert_latency_ms"] / 1000,
+        )
+
+    def benchmark_ingest(
+        self,
+        rag_client: RAGClient,
+        rows: int,
+        tmp_dir: Path,
+        options: dict,
+    ) -> dict:
+        """Index a synthetic dataset of `rows` employees with `embed_dataset`."""
+        dataset_path = tmp_dir / f"employees_{rows}.csv"
+        rng = np.random.default_rng(options["seed"])
+        pd.DataFrame(
+            {
+                "Name": [f"Employee_{i}" for i in range(rows)],
+                "Department": rng.choice(DEPARTMENTS, rows),
+                "Salary": rng.integers(30_000, 200_000, rows),
+            },
+        ).to_csv(dataset_path, index=False)
+
+        stats = rag_client.openai.stats
+        requests_before = stats["embedding_requests"]
+        with MemorySampler() as memory:
+            started_at = time.perf_counter()
+            call_command(
+                "embed_dataset",
+                dataset=str(dataset_path),
+                manifest=str(tmp_dir / f"employees_{rows}.manifest.json"),
+                batch_size=options["batch_size"],
+                concurrency=options["concurrency"],
+            )
+            elapsed = time.perf_counter() - started_at
+        return {
+            "rows": rows,
+            "seconds": elapsed,
+            "rows_per_second": rows / elapsed,
+            "embedding_requests": stats["embedding_requests"] - requests_before,
+            "memory_mb": memory.growth_mb,
+        }
+
+    def benchmark_streams(self, levels: list[int], options: dict) -> list[dict]:
+        """Open rounds of concurrent streams, one per concurrency level."""
+        chat_history = ChatHistory.objects.create(title="Offline benchmark")
+        params = {"query": options["query"], "chat_history_id": chat_history.id}
+        results = []
+        self.stdout.write(
+            f"\n{'streams':>8} {'ok':>6} {'ttft p50':>9} {'ttft p99':>9} "
+            f"{'total p50':>10} {'streams/s':>10} {'memory MB':>10}",
+        )
+        try:
+            for level in levels:
+                with MemorySampler() as memory:
+                    started_at = time.perf_counter()
+                    if options["async_view"]:
+                        streams = asyncio.run(self.run_async_streams(level, params))
+                    else:
+                        with ThreadPoolExecutor(max_workers=level) as executor:
+                            streams = list(
+                                executor.map(
+                                    lambda _: self.read_stream(params),
+                                    range(level),
+                                ),
+                            )
+                    wall_time = time.perf_counter() - started_at
+                results.append(self.summarize(level, streams, wall_time, memory))
+        finally:
+            chat_history.delete()
+        return results
+
+    def read_stream(self, params: dict) -> StreamResult:
+        """Read a stream of the WSGI view to the end."""
+        started_at = time.perf_counter()
+        result = StreamResult(ok=False)
+        try:
+            response = stream_llm_response_view(
+                RequestFactory().get("/api/chats/stream/", params),
+            )
+            for event in response.streaming_content:
+                self.read_event(result, event, started_at)
+        finally:
+            connection.close()
+        result.duration = time.perf_counter() - started_at
+        return result
+
+    async def run_async_streams(self, level: int, params: dict) -> list[StreamResult]:
+        """Read `level` streams of the async view at once."""
+        return await asyncio.gather(*(self.aread_stream(params) for _ in range(level)))
+
+    async def aread_stream(self, params: dict) -> StreamResult:
+        """Read a stream of the async view to the end."""
+        started_at = time.perf_counter()
+        result = StreamResult(ok=False)
+        response = await astream_llm_response_view(
+            RequestFactory().get("/api/chats/stream/", params),
+        )
+        async for event in response.streaming_content:
+            self.read_event(result, event, started_at)
+        result.duration = time.perf_counter() - started_at
+        return result
+
+    @staticmethod
+    def read_event(result: StreamResult, event: bytes, started_at: float) -> None:
+        """Record the first answer event and the end of a stream."""
+        if event.startswith(b"id: "):
+            event = event.partition(b"\n")[2]
+        if event.startswith(b"event: status"):
+            return
+        if event.startswith(b"data: [DONE]"):
+            result.ok = True
+        elif not result.time_to_first_token:
+            result.time_to_first_token = time.perf_counter() - started_at
+
+    def summarize(
+        self,
+        level: int,
+        streams: list[StreamResult],
+        wall_time: float,
+        memory: MemorySampler,
+    ) -> dict:
+        """Write one row of the stream results table and return it."""
+        ok = [stream for stream in streams if stream.ok]
+        if ok:
+            ttft_p50, ttft_p99 = np.percentile(
+                [stream.time_to_first_token * 1000 for stream in ok],
+                [50, 99],
+            )
+            total_p50 = np.percentile([stream.duration * 1000 for stream in ok], 50)
+        else:
+            ttft_p50 = ttft_p99 = total_p50 = float("nan")
+        result = {
+            "streams": level,
+            "ok": len(ok),
+            "ttft_p50_ms": float(ttft_p50),
+            "ttft_p99_ms": float(ttft_p99),
+            "total_p50_ms": float(total_p50),
+            "streams_per_second": len(ok) / wall_time,
+            "memory_mb": memory.growth_mb,
+        }
+        self.stdout.write(
+            f"{level:>8} {len(ok):>6} {ttft_p50:>9.0f} {ttft_p99:>9.0f} "
+            f"{total_p50:>10.0f} {result['streams_per_second']:>10.1f} "
+            f"{memory.growth_mb:>10.0f}",
+        )
+        return result
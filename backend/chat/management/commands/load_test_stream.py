@@ -0,0 +1,128 @@
+import asyncio
+import time
+from dataclasses import dataclass
+
+import httpx
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+DEFAULT_URL = "http://localhost:8000/api/chats/"
+DEFAULT_CONCURRENCY = "10,100,500,1000"
+
+
+@dataclass
+class StreamResult:
+    ok: bool
+    time_to_first_token: float = 0.0
+    duration: float = 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Opens many concurrent chat streams against a running server and reports "
+        "how time to first token and throughput scale with concurrency. Run it "
+        "against the WSGI and the ASGI deployment to compare them."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add command arguments."""
+        parser.add_argument(
+            "--url",
+            default=DEFAULT_URL,
+            help="Base URL of the chat API.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            default=DEFAULT_CONCURRENCY,
+            help="Comma-separated numbers of concurrent streams to test.",
+        )
+        parser.add_argument(
+            "--query",
+            default="What is the average salary in the engineering department?",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=120,
+            help="Seconds after which a stream counts as failed.",
+        )
+
+    def handle(self, *args, **kwargs) -> None:  # noqa: ARG002
+        """Handle the command."""
+        levels = [int(level) for level in kwargs["concurrency"].split(",")]
+        asyncio.run(self.run(kwargs["url"].rstrip("/"), levels, kwargs))
+
+    async def run(self, url: str, levels: list[int], options: dict) -> None:
+        """Run one round of concurrent streams per concurrency level."""
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with httpx.AsyncClient(limits=limits, timeout=options["timeout"]) as client:
+            try:
+                response = await client.post(
+                    f"{url}/histories/create/",
+                    data={"title": "Load test"},
+                )
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                msg = f"Could not create a chat history at {url}: {e}"
+                raise CommandError(msg) from e
+            params = {"query": options["query"], "chat_history_id": response.json()["id"]}
+
+            self.stdout.write(
+                f"{'streams':>8} {'ok':>6} {'ttft p50':>9} {'ttft p99':>9} "
+                f"{'total p50':>10} {'wall s':>7} {'streams/s':>10}",
+            )
+            for level in levels:
+                started_at = time.perf_counter()
+                results = await asyncio.gather(
+                    *(
+                        self.open_stream(client, f"{url}/stream/", params)
+                        for _ in range(level)
+                    ),
+                )
+                self.write_row(level, results, time.perf_counter() - started_at)
+
+    async def open_stream(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        params: dict,
+    ) -> StreamResult:
+        """Read one stream to the end, timing its first token and its duration."""
+        started_at = time.perf_counter()
+        result = StreamResult(ok=False)
+        try:
+            async with client.stream("GET", url, params=params) as response:
+                if response.status_code != httpx.codes.OK:
+                    return result
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line.removeprefix("event: ")
+                    if not line:
+                        event = None
+                    if event == "status" or not line.startswith("data: "):
+                        continue
+                    if not result.time_to_first_token:
+                        result.time_to_first_token = time.perf_counter() - started_at
+                    if line == "data: [DONE]":
+                        result.ok = True
+        except httpx.HTTPError:
+            return result
+        result.duration = time.perf_counter() - started_at
+        return result
+
+    def write_row(self, level: int, results: list[StreamResult], wall_time: float) -> None:
+        """Write one row of the results table."""
+        ok = [result for result in results if result.ok]
+        if ok:
+            ttft_p50, ttft_p99 = np.percentile(
+                [result.time_to_first_token * 1000 for result in ok],
+                [50, 99],
+            )
+            total_p50 = np.percentile([result.duration * 1000 for result in ok], 50)
+        else:
+            ttft_p50 = ttft_p99 = total_p50 = float("nan")
+        self.stdout.write(
+            f"{level:>8} {len(ok):>6} {ttft_p50:>9.0f} {ttft_p99:>9.0f} "
+            f"{total_p50:>10.0f} {wall_time:>7.1f} {len(ok) / wall_time:>10.1f}",
+        )
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0002_chat_history_created_at_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["chat_history", "created_at", "id"],
+                name="chat_message_history_time_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:22
+
+import re
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0003_chat_message_history_time_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chathistory",
+            name="namespace",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                max_length=64,
+                validators=[
+                    django.core.validators.RegexValidator(
+                        re.compile("\\A[A-Za-z0-9][A-Za-z0-9_-]{0,63}\\Z"),
+                    ),
+                ],
+            ),
+        ),
+    ]
@@ -1,12 +1,47 @@
-from django.db import models
+from django.core.validators import RegexValidator
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Substr
 from django.utils import timezone
 
+from rag.namespaces import DEFAULT_NAMESPACE, NAMESPACE_PATTERN
+
+DERIVED_TITLE_LENGTH = 50
+
+
+class ChatHistoryQuerySet(models.QuerySet):
+    def with_first_user_message(self) -> "ChatHistoryQuerySet":
+        """Annotate histories with the start of their first user message.
+
+        `derived_title` reads the annotation instead of querying the messages of
+        every history, so a list of histories is fetched in a single query.
+        """
+        first_user_message = (
+            ChatMessage.objects.filter(
+                chat_history=OuterRef("pk"),
+                role=ChatMessage.Role.USER,
+            )
+            .order_by("pk")
+            .values(excerpt=Substr("content", 1, DERIVED_TITLE_LENGTH))[:1]
+        )
+        return self.annotate(first_user_message=Subquery(first_user_message))
+
 
 class ChatHistory(models.Model):
     title = models.CharField(max_length=200)
-    created_at = models.DateTimeField(default=timezone.now)
+    # The dataset the chat is about, indexed with `embed_dataset --namespace`.
+    namespace = models.CharField(
+        max_length=64,
+        blank=True,
+        default=DEFAULT_NAMESPACE,
+        db_index=True,
+        validators=[RegexValidator(NAMESPACE_PATTERN)],
+    )
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ChatHistoryQuerySet.as_manager()
+
     def __str__(self) -> str:
         """Return a string representation of the chat history."""
         return self.title
@@ -16,12 +51,36 @@ class ChatHistory(models.Model):
         """Derived title from first message if empty."""
         if self.title:
             return self.title
-        if self.messages.exists():
-            first_user_message = self.messages.filter(role=ChatMessage.Role.USER).first()
-            if first_user_message:
-                return first_user_message.content[:50] + "..."
+        if hasattr(self, "first_user_message"):
+            first_user_message = self.first_user_message
+        else:
+            message = (
+                self.messages.filter(role=ChatMessage.Role.USER).order_by("pk").first()
+            )
+            first_user_message = message.content if message else None
+        if first_user_message is not None:
+            return first_user_message[:DERIVED_TITLE_LENGTH] + "..."
         return "New Chat"
 
+    @transaction.atomic
+    def save_bot_response(self, content: str) -> "ChatMessage":
+        """Save a bot response and update the title if empty, in one transaction.
+
+        The writes made when an answer completes share one commit, and on SQLite one
+        hold of the write lock.
+        """
+        message = ChatMessage.objects.create(
+            chat_history=self,
+            role=ChatMessage.Role.BOT,
+            content=content,
+        )
+        if self.title in ["", "New Chat"]:
+            title = self.derived_title
+            if title != self.title:
+                self.title = title
+                self.save(update_fields=["title"])
+        return message
+
 
 class ChatMessage(models.Model):
     class Role(models.TextChoices):
@@ -37,6 +96,14 @@ class ChatMessage(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["chat_history", "created_at", "id"],
+                name="chat_message_history_time_idx",
+            ),
+        ]
+
     def __str__(self) -> str:
         """Return a string representation of the chat message."""
         return f"{self.role}: {self.content[:50]}..."
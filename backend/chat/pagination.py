@@ -0,0 +1,122 @@
+from django.db.models import Q, QuerySet, Subquery
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
+
+
+class ChatHistoryCursorPagination(CursorPagination):
+    """Newest-first pages of chat histories.
+
+    The cursor encodes the position in the `created_at` index, so every page costs
+    one bounded query however deep the client pages.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+class MessageKeysetPagination(BasePagination):
+    """Pages of a conversation's messages, oldest first, addressed by message ID.
+
+    Without a cursor the latest page is returned. `before=<id>` pages back through
+    older messages, `after=<id>` fetches messages newer than a known one, and
+    `since=<ISO 8601 timestamp>` those created after a point in time. Adjacent
+    pages are linked from the `Link` header, so the body stays a plain list.
+    """
+
+    page_size = 100
+    page_size_query_param = "limit"
+    max_page_size = 500
+
+    def paginate_queryset(
+        self,
+        queryset: QuerySet,
+        request: Request,
+        view: APIView | None = None,  # noqa: ARG002
+    ) -> list:
+        """Return one page of messages, filtered by the cursor parameters."""
+        self.request = request
+        self.limit = self.get_limit(request)
+        before = request.query_params.get("before")
+        after = request.query_params.get("after")
+        since = request.query_params.get("since")
+
+        if before:
+            queryset = queryset.filter(self.keyset_filter(queryset, before, "lt"))
+        if after:
+            queryset = queryset.filter(self.keyset_filter(queryset, after, "gt"))
+        if since:
+            since_datetime = parse_datetime(since)
+            if since_datetime is None:
+                msg = {"since": "Expected an ISO 8601 timestamp."}
+                raise ValidationError(msg)
+            queryset = queryset.filter(created_at__gt=since_datetime)
+
+        # Read newest first unless asked for what follows a known position, so the
+        # default page and `before` pages end at the newest matching message.
+        self.newest_first = not (after or since)
+        ordering = ("-created_at", "-id") if self.newest_first else ("created_at", "id")
+        messages = list(queryset.order_by(*ordering)[: self.limit + 1])
+        self.has_more = len(messages) > self.limit
+        messages = messages[: self.limit]
+        if self.newest_first:
+            messages.reverse()
+
+        self.has_older = self.has_more if self.newest_first else bool(messages)
+        self.has_newer = bool(before and messages) or (
+            not self.newest_first and self.has_more
+        )
+        self.messages = messages
+        return messages
+
+    def get_paginated_response(self, data: list) -> Response:
+        """Return the page as a list, with links to the adjacent pages."""
+        links = []
+        if self.has_older:
+            links.append(f'<{self.get_link("before", self.messages[0].pk)}>; rel="prev"')
+        if self.has_newer:
+            links.append(f'<{self.get_link("after", self.messages[-1].pk)}>; rel="next"')
+        headers = {"Link": ", ".join(links)} if links else None
+        return Response(data, headers=headers)
+
+    def get_limit(self, request: Request) -> int:
+        """Return the page size requested with `limit`, capped at `max_page_size`."""
+        try:
+            limit = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(limit, 1), self.max_page_size)
+
+    def get_link(self, cursor: str, message_id: int) -> str:
+        """Build the URL of the page on the `cursor` side of a message."""
+        url = self.request.build_absolute_uri()
+        for param in ("before", "after", "since"):
+            url = remove_query_param(url, param)
+        url = replace_query_param(url, self.page_size_query_param, self.limit)
+        return replace_query_param(url, cursor, message_id)
+
+    @staticmethod
+    def keyset_filter(queryset: QuerySet, cursor: str, lookup: str) -> Q:
+        """Match messages ordered before (`lt`) or after (`gt`) the cursor message.
+
+        Messages are ordered by (created_at, id). The cursor's created_at is read in
+        the same query, so a page is one range scan of the composite index.
+        """
+        try:
+            cursor_id = int(cursor)
+        except ValueError as e:
+            msg = {"before" if lookup == "lt" else "after": "Expected a message ID."}
+            raise ValidationError(msg) from e
+        cursor_created_at = Subquery(
+            queryset.model.objects.filter(pk=cursor_id).values("created_at")[:1],
+        )
+        return Q(**{f"created_at__{lookup}": cursor_created_at}) | Q(
+            created_at=cursor_created_at,
+            **{f"id__{lookup}": cursor_id},
+        )
@@ -0,0 +1,212 @@
+"""Buffers of the events of SSE streams, so clients can resume them after reconnecting."""
+
+import asyncio
+import contextlib
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+LAST_EVENT_ID_HEADER = "Last-Event-ID"
+
+DEFAULT_STREAM_BUFFER_TTL = 300
+DEFAULT_STREAM_BUFFER_MAX_EVENTS = 4096
+DEFAULT_STREAM_BUFFER_MAX_STREAMS = 1000
+
+
+def format_event_id(stream_id: str, seq: int) -> str:
+    """Return the SSE event ID of the `seq`-th event of a stream."""
+    return f"{stream_id}:{seq}"
+
+
+def parse_event_id(event_id: str) -> tuple[str, int] | None:
+    """Return the stream and sequence number of an event ID, or None if malformed."""
+    stream_id, _, seq = event_id.strip().partition(":")
+    if not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+@dataclass
+class StreamEvents:
+    """The events of a stream after a given one.
+
+    `complete` is False when some of the events asked for were dropped from the
+    buffer, and `done` is True when the stream has ended after `events`.
+    """
+
+    events: list[tuple[int, str]]
+    done: bool
+    complete: bool = True
+
+
+@dataclass
+class _BufferedStream:
+    chat_history_id: int
+    expires_at: float
+    events: deque = field(default_factory=deque)
+    last_seq: int = 0
+    done: bool = False
+    condition: threading.Condition | None = None
+    waiters: list = field(default_factory=list)
+
+
+class StreamBuffer:
+    """In-memory buffer of the events of recent streams, with their sequence numbers.
+
+    A stream keeps its last `max_events` events until `ttl` seconds after its last
+    one, and at most `max_streams` streams are kept, dropping the least recently
+    active first. Readers may wait for new events from any thread, or from any event
+    loop with `aread`. Streams are only visible to the process that buffers them.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_STREAM_BUFFER_TTL,
+        max_events: int = DEFAULT_STREAM_BUFFER_MAX_EVENTS,
+        max_streams: int = DEFAULT_STREAM_BUFFER_MAX_STREAMS,
+    ) -> None:
+        """Initialize an empty buffer."""
+        self.ttl = ttl
+        self.max_events = max_events
+        self.max_streams = max_streams
+        self._streams: OrderedDict[str, _BufferedStream] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of buffered streams."""
+        return len(self._streams)
+
+    def create(self, chat_history_id: int) -> str:
+        """Start buffering a new stream of a chat, returning its ID."""
+        stream_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            while len(self._streams) >= self.max_streams:
+                _, dropped = self._streams.popitem(last=False)
+                self._notify(dropped)
+            self._streams[stream_id] = _BufferedStream(
+                chat_history_id=chat_history_id,
+                expires_at=time.monotonic() + self.ttl,
+                events=deque(maxlen=self.max_events),
+                condition=threading.Condition(self._lock),
+            )
+        return stream_id
+
+    def append(self, stream_id: str, frame: str) -> int:
+        """Add the next event of a stream, returning its sequence number."""
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is None:
+                return 0
+            stream.last_seq += 1
+            stream.events.append((stream.last_seq, frame))
+            self._touch(stream_id, stream)
+            self._notify(stream)
+            return stream.last_seq
+
+    def close(self, stream_id: str) -> None:
+        """Mark a stream as ended, waking its readers."""
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is not None:
+                stream.done = True
+                self._touch(stream_id, stream)
+                self._notify(stream)
+
+    def read(
+        self,
+        stream_id: str,
+        chat_history_id: int,
+        after: int,
+        max_wait: float = 0.0,
+    ) -> StreamEvents | None:
+        """Return the events of a chat's stream after the `after`-th one.
+
+        Waits up to `max_wait` seconds for one if there is none yet. Returns None if
+        the stream is unknown, has expired, or belongs to another chat.
+        """
+        deadline = time.monotonic() + max_wait
+        with self._lock:
+            while True:
+                stream = self._get(stream_id, chat_history_id)
+                if stream is None:
+                    return None
+                remaining = deadline - time.monotonic()
+                if stream.done or stream.last_seq > after or remaining <= 0:
+                    return self._events_after(stream, after)
+                stream.condition.wait(remaining)
+
+    async def aread(
+        self,
+        stream_id: str,
+        chat_history_id: int,
+        after: int,
+        max_wait: float = 0.0,
+    ) -> StreamEvents | None:
+        """Asynchronous version of `read`, waiting without holding a thread."""
+        with self._lock:
+            stream = self._get(stream_id, chat_history_id)
+            if stream is None:
+                return None
+            if stream.done or stream.last_seq > after or max_wait <= 0:
+                return self._events_after(stream, after)
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            stream.waiters.append((loop, waiter))
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(waiter, max_wait)
+        with self._lock:
+            stream = self._get(stream_id, chat_history_id)
+            return None if stream is None else self._events_after(stream, after)
+
+    def _get(self, stream_id: str, chat_history_id: int) -> _BufferedStream | None:
+        """Return a live stream of a chat, with the lock held."""
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.chat_history_id != chat_history_id:
+            return None
+        if stream.expires_at <= time.monotonic():
+            del self._streams[stream_id]
+            return None
+        return stream
+
+    def _events_after(self, stream: _BufferedStream, after: int) -> StreamEvents:
+        """Return the buffered events of a stream after the `after`-th one."""
+        first_seq = stream.events[0][0] if stream.events else stream.last_seq + 1
+        start = max(after + 1 - first_seq, 0)
+        return StreamEvents(
+            events=list(itertools.islice(stream.events, start, None)),
+            done=stream.done,
+            complete=after + 1 >= first_seq,
+        )
+
+    def _touch(self, stream_id: str, stream: _BufferedStream) -> None:
+        """Extend the life of an active stream, with the lock held."""
+        stream.expires_at = time.monotonic() + self.ttl
+        self._streams.move_to_end(stream_id)
+
+    def _expire(self) -> None:
+        """Drop the streams that have expired, with the lock held."""
+        now = time.monotonic()
+        while self._streams:
+            stream_id, stream = next(iter(self._streams.items()))
+            if stream.expires_at > now:
+                break
+            del self._streams[stream_id]
+            self._notify(stream)
+
+    def _notify(self, stream: _BufferedStream) -> None:
+        """Wake the readers waiting on a stream, with the lock held."""
+        stream.condition.notify_all()
+        for loop, waiter in stream.waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, waiter)
+        stream.waiters.clear()
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    """Resolve a reader's future, unless it has timed out meanwhile."""
+    if not waiter.done():
+        waiter.set_result(None)
@@ -8,8 +8,8 @@ class ChatMessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ChatMessage
-        fields = ["role", "content", "created_at"]
-        read_only_fields = ["role", "content", "created_at"]
+        fields = ["id", "role", "content", "created_at"]
+        read_only_fields = ["id", "role", "content", "created_at"]
 
 
 class ChatHistorySerializer(serializers.ModelSerializer):
@@ -17,4 +17,4 @@ class ChatHistorySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ChatHistory
-        fields = ["id", "title", "created_at"]
+        fields = ["id", "title", "namespace", "created_at"]
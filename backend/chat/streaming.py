@@ -0,0 +1,177 @@
+"""Helpers for Server-Sent Events (SSE) streams."""
+
+import asyncio
+import threading
+import time
+from collections.abc import AsyncIterable, AsyncIterator, Iterable, Iterator
+from dataclasses import dataclass
+from queue import Empty, Queue
+
+
+def format_sse(data: str, event: str | None = None) -> str:
+    """Format an SSE event.
+
+    Each line of `data` gets its own `data:` field, so clients reassemble tokens that
+    contain newlines instead of ending the event early.
+    """
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def with_event_id(frame: str, event_id: str) -> str:
+    """Add an ID to a formatted SSE event, sent back by reconnecting clients."""
+    return f"id: {event_id}\n{frame}"
+
+
+def coalesce_tokens(
+    tokens: Iterable[str],
+    max_chars: int,
+    max_delay: float,
+) -> Iterator[str]:
+    """Group tokens into larger chunks, each sent as a single SSE frame.
+
+    The first token is sent at once. Later tokens are buffered until they reach
+    `max_chars` characters or the first buffered one has waited `max_delay`
+    seconds, whichever comes first, even if the model stalls meanwhile: tokens are
+    read on a thread of their own and the wait for the next one times out at the
+    deadline. The remainder is flushed when the tokens run out. `max_chars` of 0 or
+    less disables coalescing.
+    """
+    if max_chars <= 0:
+        yield from tokens
+        return
+
+    queue, stop = _read_tokens_in_thread(tokens)
+    buffer = _TokenBuffer(max_chars, max_delay)
+    try:
+        while True:
+            try:
+                item = queue.get(timeout=buffer.time_left())
+            except Empty:
+                yield buffer.flush()
+                continue
+            if item is _END or isinstance(item, _TokenError):
+                break
+            if chunk := buffer.add(item):
+                yield chunk
+        if buffer:
+            yield buffer.flush()
+        if isinstance(item, _TokenError):
+            raise item.error
+    finally:
+        stop.set()
+
+
+async def acoalesce_tokens(
+    tokens: AsyncIterable[str],
+    max_chars: int,
+    max_delay: float,
+) -> AsyncIterator[str]:
+    """Asynchronous version of `coalesce_tokens`.
+
+    The next token is awaited with `asyncio.wait_for`, timing out at the deadline of
+    the buffered ones. The pending read is shielded, so a timeout does not cancel it.
+    """
+    iterator = aiter(tokens)
+    buffer = _TokenBuffer(max_chars, max_delay)
+    pending = asyncio.ensure_future(anext(iterator, _END))
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(asyncio.shield(pending), buffer.time_left())
+            except TimeoutError:
+                yield buffer.flush()
+                continue
+            except Exception as e:  # noqa: BLE001
+                item = _TokenError(e)
+            if item is _END or isinstance(item, _TokenError):
+                break
+            pending = asyncio.ensure_future(anext(iterator, _END))
+            if chunk := buffer.add(item):
+                yield chunk
+        if buffer:
+            yield buffer.flush()
+        if isinstance(item, _TokenError):
+            raise item.error
+    finally:
+        pending.cancel()
+
+
+def _read_tokens_in_thread(tokens: Iterable[str]) -> tuple[Queue, threading.Event]:
+    """Read tokens into a queue on a thread, ending with `_END`.
+
+    An error of the token source is queued as a `_TokenError`. Setting the returned
+    event stops the thread after the token being read.
+    """
+    queue = Queue()
+    stop = threading.Event()
+
+    def read_tokens() -> None:
+        try:
+            for token in tokens:
+                queue.put(token)
+                if stop.is_set():
+                    break
+        except Exception as e:  # noqa: BLE001
+            queue.put(_TokenError(e))
+            return
+        queue.put(_END)
+
+    threading.Thread(target=read_tokens, name="sse-coalesce", daemon=True).start()
+    return queue, stop
+
+
+_END = object()
+
+
+@dataclass
+class _TokenError:
+    """An error raised by the token source, passed to the coalescing generator."""
+
+    error: Exception
+
+
+class _TokenBuffer:
+    """Tokens waiting to be sent together, with the deadline of the first one."""
+
+    def __init__(self, max_chars: int, max_delay: float) -> None:
+        """Initialize an empty buffer, which sends the first token on its own."""
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self.tokens = []
+        self.chars = 0
+        self.deadline = None
+        self.first = True
+
+    def __bool__(self) -> bool:
+        """Return whether tokens are buffered."""
+        return bool(self.tokens)
+
+    def add(self, token: str) -> str | None:
+        """Buffer a token, returning the chunk to send if one is due.
+
+        Without a positive `max_chars`, every token is sent on its own.
+        """
+        if self.first or self.max_chars <= 0:
+            self.first = False
+            return token
+        if not self.tokens:
+            self.deadline = time.monotonic() + self.max_delay
+        self.tokens.append(token)
+        self.chars += len(token)
+        return self.flush() if self.chars >= self.max_chars else None
+
+    def time_left(self) -> float | None:
+        """Return the seconds until the buffered tokens are due, None if there are none."""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+    def flush(self) -> str:
+        """Empty the buffer, returning its tokens as one chunk."""
+        chunk = "".join(self.tokens)
+        self.tokens.clear()
+        self.chars = 0
+        self.deadline = None
+        return chunk
@@ -0,0 +1,41 @@
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import TestCase
+
+from chat.models import ChatHistory, ChatMessage
+
+
+class SaveBotResponseTests(TestCase):
+    def setUp(self) -> None:
+        """Create an untitled chat with a first question."""
+        self.chat = ChatHistory.objects.create(title="")
+        ChatMessage.objects.create(
+            chat_history=self.chat,
+            role=ChatMessage.Role.USER,
+            content="What is the median salary in IT?",
+        )
+
+    def test_saves_the_answer_and_derives_the_title(self) -> None:
+        """An untitled chat is named after its first question with the answer."""
+        message = self.chat.save_bot_response("It is $105,000.")
+        self.assertEqual(message.role, ChatMessage.Role.BOT)
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.title, "What is the median salary in IT?...")
+
+    def test_keeps_an_existing_title(self) -> None:
+        """Chats with a title keep it."""
+        self.chat.title = "Salaries"
+        self.chat.save()
+        self.chat.save_bot_response("It is $105,000.")
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.title, "Salaries")
+
+    def test_rolls_back_the_answer_if_the_title_fails_to_save(self) -> None:
+        """The answer and the title are written in one transaction."""
+        with (
+            mock.patch.object(ChatHistory, "save", side_effect=DatabaseError),
+            self.assertRaises(DatabaseError),
+        ):
+            self.chat.save_bot_response("It is $105,000.")
+        self.assertFalse(self.chat.messages.filter(role=ChatMessage.Role.BOT).exists())
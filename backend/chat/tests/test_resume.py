@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chat.resume import StreamBuffer, format_event_id, parse_event_id
+
+CHAT_ID = 1
+OTHER_CHAT_ID = 2
+
+
+class EventIdTests(SimpleTestCase):
+    def test_round_trips_event_ids(self) -> None:
+        """Event IDs carry the stream and the sequence number of the event."""
+        self.assertEqual(parse_event_id(format_event_id("abc", 7)), ("abc", 7))
+
+    def test_rejects_malformed_event_ids(self) -> None:
+        """IDs without a stream or a numeric sequence number are not parsed."""
+        for event_id in ["", "abc", ":3", "abc:", "abc:x", "abc:-1"]:
+            with self.subTest(event_id=event_id):
+                self.assertIsNone(parse_event_id(event_id))
+
+
+class StreamBufferTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Create a buffer with a stream of a chat."""
+        self.buffer = StreamBuffer(ttl=60, max_events=3, max_streams=2)
+        self.stream_id = self.buffer.create(CHAT_ID)
+
+    def test_returns_the_events_after_the_last_one_read(self) -> None:
+        """A reader gets the events it missed, numbered from 1."""
+        for frame in ["a", "b", "c"]:
+            self.buffer.append(self.stream_id, frame)
+        self.buffer.close(self.stream_id)
+        events = self.buffer.read(self.stream_id, CHAT_ID, after=1)
+        self.assertEqual(events.events, [(2, "b"), (3, "c")])
+        self.assertTrue(events.done)
+        self.assertTrue(events.complete)
+
+    def test_reports_dropped_events(self) -> None:
+        """Events beyond `max_events` are dropped, and readers missing them told."""
+        for frame in ["a", "b", "c", "d"]:
+            self.buffer.append(self.stream_id, frame)
+        self.assertFalse(self.buffer.read(self.stream_id, CHAT_ID, after=0).complete)
+        events = self.buffer.read(self.stream_id, CHAT_ID, after=1)
+        self.assertTrue(events.complete)
+        self.assertEqual(events.events, [(2, "b"), (3, "c"), (4, "d")])
+
+    def test_hides_streams_from_other_chats(self) -> None:
+        """A stream can only be resumed from the chat it answers."""
+        self.buffer.append(self.stream_id, "a")
+        self.assertIsNone(self.buffer.read(self.stream_id, OTHER_CHAT_ID, after=0))
+        self.assertIsNone(self.buffer.read("unknown", CHAT_ID, after=0))
+
+    def test_expires_idle_streams(self) -> None:
+        """Streams without events for `ttl` seconds are dropped."""
+        self.buffer.append(self.stream_id, "a")
+        later = time.monotonic() + 61
+        with mock.patch("chat.resume.time.monotonic", return_value=later):
+            self.assertIsNone(self.buffer.read(self.stream_id, CHAT_ID, after=0))
+
+    def test_drops_the_least_recently_active_stream(self) -> None:
+        """Beyond `max_streams`, the stream idle the longest is dropped."""
+        second = self.buffer.create(CHAT_ID)
+        self.buffer.append(self.stream_id, "a")
+        self.buffer.create(CHAT_ID)
+        self.assertEqual(len(self.buffer), 2)
+        self.assertIsNone(self.buffer.read(second, CHAT_ID, after=0))
+        self.assertIsNotNone(self.buffer.read(self.stream_id, CHAT_ID, after=0))
+
+    def test_waits_for_new_events(self) -> None:
+        """A reader caught up with the stream waits for its next event."""
+        timer = threading.Timer(0.05, self.buffer.append, (self.stream_id, "a"))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        events = self.buffer.read(self.stream_id, CHAT_ID, after=0, max_wait=5)
+        self.assertEqual(events.events, [(1, "a")])
+        self.assertFalse(events.done)
+
+    async def test_waits_for_new_events_asynchronously(self) -> None:
+        """`aread` is woken by events appended from another thread."""
+        timer = threading.Timer(0.05, self.buffer.append, (self.stream_id, "a"))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        events = await asyncio.wait_for(
+            self.buffer.aread(self.stream_id, CHAT_ID, after=0, max_wait=5),
+            1,
+        )
+        self.assertEqual(events.events, [(1, "a")])
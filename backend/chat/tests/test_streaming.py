@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator, Iterator
+
+from django.test import SimpleTestCase
+
+from chat.streaming import acoalesce_tokens, coalesce_tokens, format_sse, with_event_id
+
+STALL = 0.5
+MAX_DELAY = 0.05
+
+
+def slow_tokens(tokens: list[str | float]) -> Iterator[str]:
+    """Yield tokens, sleeping for the seconds given between them like a slow model."""
+    for token in tokens:
+        if isinstance(token, float):
+            time.sleep(token)
+        else:
+            yield token
+
+
+async def aslow_tokens(tokens: list[str | float]) -> AsyncIterator[str]:
+    """Asynchronous version of `slow_tokens`."""
+    for token in tokens:
+        if isinstance(token, float):
+            await asyncio.sleep(token)
+        else:
+            yield token
+
+
+def failing_tokens() -> Iterator[str]:
+    """Yield two tokens, then fail like a dropped model connection."""
+    yield "a"
+    yield "b"
+    raise ConnectionError
+
+
+async def afailing_tokens() -> AsyncIterator[str]:
+    """Asynchronous version of `failing_tokens`."""
+    yield "a"
+    yield "b"
+    raise ConnectionError
+
+
+def timed(chunks: Iterator[str]) -> list[tuple[str, float]]:
+    """Return the chunks with the seconds elapsed when each was sent."""
+    start = time.monotonic()
+    return [(chunk, time.monotonic() - start) for chunk in chunks]
+
+
+async def atimed(chunks: AsyncIterator[str]) -> list[tuple[str, float]]:
+    """Asynchronous version of `timed`."""
+    start = time.monotonic()
+    return [(chunk, time.monotonic() - start) async for chunk in chunks]
+
+
+class FormatSseTests(SimpleTestCase):
+    def test_splits_lines_into_data_fields(self) -> None:
+        """A newline in a token does not end the event early."""
+        self.assertEqual(format_sse("a\nb"), "data: a\ndata: b\n\n")
+
+    def test_names_the_event(self) -> None:
+        """Named events start with their `event:` field."""
+        self.assertEqual(format_sse("x", event="error"), "event: error\ndata: x\n\n")
+
+    def test_adds_the_event_id(self) -> None:
+        """The ID goes before the event's other fields."""
+        self.assertEqual(with_event_id(format_sse("x"), "s:1"), "id: s:1\ndata: x\n\n")
+
+
+class CoalesceTokensTests(SimpleTestCase):
+    def test_groups_tokens_up_to_max_chars(self) -> None:
+        """The first token is sent alone, then tokens are grouped by size."""
+        chunks = coalesce_tokens(iter(["a", "bc", "de", "f", "g"]), 4, 10.0)
+        self.assertEqual(list(chunks), ["a", "bcde", "fg"])
+
+    def test_sends_the_first_token_at_once(self) -> None:
+        """The first token is not held back waiting for more."""
+        chunks = timed(coalesce_tokens(slow_tokens(["a", STALL, "b"]), 100, 10.0))
+        self.assertEqual([chunk for chunk, _ in chunks], ["a", "b"])
+        self.assertLess(chunks[0][1], STALL / 2)
+
+    def test_flushes_at_the_deadline_while_the_model_stalls(self) -> None:
+        """Buffered tokens are sent after `max_delay` even if no token follows."""
+        tokens = slow_tokens(["a", "b", "c", STALL, "d"])
+        chunks = timed(coalesce_tokens(tokens, 100, MAX_DELAY))
+        self.assertEqual([chunk for chunk, _ in chunks], ["a", "bc", "d"])
+        self.assertLess(chunks[1][1], STALL / 2)
+
+    def test_passes_tokens_through_without_max_chars(self) -> None:
+        """`max_chars` of 0 disables coalescing."""
+        chunks = coalesce_tokens(iter(["a", "b", "c"]), 0, MAX_DELAY)
+        self.assertEqual(list(chunks), ["a", "b", "c"])
+
+    def test_flushes_buffered_tokens_before_an_error(self) -> None:
+        """The tokens read before the source failed are sent, then the error raised."""
+        chunks = coalesce_tokens(failing_tokens(), 100, 10.0)
+        self.assertEqual(next(chunks), "a")
+        self.assertEqual(next(chunks), "b")
+        with self.assertRaises(ConnectionError):
+            next(chunks)
+
+
+class ACoalesceTokensTests(SimpleTestCase):
+    async def test_groups_tokens_up_to_max_chars(self) -> None:
+        """The first token is sent alone, then tokens are grouped by size."""
+        chunks = acoalesce_tokens(aslow_tokens(["a", "bc", "de", "f", "g"]), 4, 10.0)
+        self.assertEqual([chunk async for chunk in chunks], ["a", "bcde", "fg"])
+
+    async def test_sends_the_first_token_at_once(self) -> None:
+        """The first token is not held back waiting for more."""
+        tokens = aslow_tokens(["a", STALL, "b"])
+        chunks = await atimed(acoalesce_tokens(tokens, 100, 10.0))
+        self.assertEqual([chunk for chunk, _ in chunks], ["a", "b"])
+        self.assertLess(chunks[0][1], STALL / 2)
+
+    async def test_flushes_at_the_deadline_while_the_model_stalls(self) -> None:
+        """Buffered tokens are sent after `max_delay` even if no token follows."""
+        tokens = aslow_tokens(["a", "b", "c", STALL, "d"])
+        chunks = await atimed(acoalesce_tokens(tokens, 100, MAX_DELAY))
+        self.assertEqual([chunk for chunk, _ in chunks], ["a", "bc", "d"])
+        self.assertLess(chunks[1][1], STALL / 2)
+
+    async def test_passes_tokens_through_without_max_chars(self) -> None:
+        """`max_chars` of 0 disables coalescing."""
+        chunks = acoalesce_tokens(aslow_tokens(["a", "b", "c"]), 0, MAX_DELAY)
+        self.assertEqual([chunk async for chunk in chunks], ["a", "b", "c"])
+
+    async def test_flushes_buffered_tokens_before_an_error(self) -> None:
+        """The tokens read before the source failed are sent, then the error raised."""
+        chunks = acoalesce_tokens(afailing_tokens(), 100, 10.0)
+        self.assertEqual(await anext(chunks), "a")
+        self.assertEqual(await anext(chunks), "b")
+        with self.assertRaises(ConnectionError):
+            await anext(chunks)
@@ -0,0 +1,387 @@
+import logging
+import re
+from collections.abc import AsyncIterator, Iterator
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from chat.models import ChatHistory, ChatMessage
+from chat.resume import LAST_EVENT_ID_HEADER
+from chat.views import (
+    STREAM_ERROR_MESSAGE,
+    QueryRoute,
+    _route_query,
+    astream_llm_response_view,
+    stream_llm_response_view,
+)
+from rag.tracing import Trace
+
+QUERY = "What is the median salary?"
+
+
+class RouteQueryTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Fake a RAG client and namespace resources, sharing one record of calls."""
+        self.calls = mock.Mock()
+        self.rag_client = mock.Mock(
+            context_retrieval=self.calls.context_retrieval,
+            openai=self.calls.openai,
+        )
+        self.rag_client.openai.generate_embedding.return_value = [1.0, 0.0]
+        self.resources = mock.Mock(
+            namespace="acme",
+            structured_router=self.calls.structured_router,
+            response_cache=self.calls.response_cache,
+        )
+        self.resources.structured_router.answer.return_value = None
+        self.resources.needs_dataset.return_value = True
+        self.resources.query_entities.return_value = frozenset()
+        self.resources.response_cache.current_version.return_value = "v1"
+        self.resources.response_cache.get.return_value = None
+
+    def route(self, **kwargs: bool) -> object:
+        """Route the question with the fakes."""
+        return _route_query(self.rag_client, self.resources, QUERY, Trace(), **kwargs)
+
+    def call_names(self) -> list[str]:
+        """Return the names of the calls made to the fakes, in order."""
+        return [name for name, _, _ in self.calls.mock_calls if "." in name]
+
+    def test_answers_structured_questions_without_retrieval(self) -> None:
+        """An exact answer skips the response cache and retrieval."""
+        self.resources.structured_router.answer.return_value = "42"
+        route = self.route()
+        self.assertEqual(route.ready_response, "42")
+        self.assertIsNone(route.pending_context)
+        self.rag_client.context_retrieval.submit.assert_not_called()
+
+    @override_settings(CHAT_PIPELINED_RETRIEVAL=False)
+    def test_retrieves_after_a_cache_miss(self) -> None:
+        """Without pipelining, retrieval starts once the cache lookup has missed."""
+        route = self.route()
+        self.assertIsNotNone(route.pending_context)
+        self.assertEqual(
+            self.call_names(),
+            [
+                "structured_router.answer",
+                "response_cache.current_version",
+                "openai.generate_embedding",
+                "response_cache.get",
+                "context_retrieval.submit",
+            ],
+        )
+
+    @override_settings(CHAT_PIPELINED_RETRIEVAL=False)
+    def test_skips_retrieval_on_a_cache_hit(self) -> None:
+        """A cached answer is used without retrieving a context."""
+        self.resources.response_cache.get.return_value = "cached"
+        route = self.route()
+        self.assertEqual(route.ready_response, "cached")
+        self.assertIsNone(route.pending_context)
+
+    @override_settings(CHAT_PIPELINED_RETRIEVAL=True)
+    def test_starts_retrieval_before_the_cache_lookup(self) -> None:
+        """With pipelining, retrieval runs while the query is embedded."""
+        self.resources.response_cache.get.return_value = "cached"
+        route = self.route()
+        self.assertEqual(route.ready_response, "cached")
+        self.assertIsNotNone(route.pending_context)
+        self.assertEqual(
+            self.call_names()[:3],
+            [
+                "structured_router.answer",
+                "context_retrieval.submit",
+                "response_cache.current_version",
+            ],
+        )
+
+    @override_settings(CHAT_PIPELINED_RETRIEVAL=True)
+    def test_sends_general_questions_straight_to_the_llm(self) -> None:
+        """With pipelining, questions not needing the dataset skip cache and retrieval."""
+        self.resources.needs_dataset.return_value = False
+        route = self.route()
+        self.assertIsNone(route.ready_response)
+        self.assertIsNone(route.pending_context)
+        self.assertEqual(self.call_names(), ["structured_router.answer"])
+
+    @override_settings(CHAT_PIPELINED_RETRIEVAL=False)
+    def test_skips_the_cache_when_asked(self) -> None:
+        """Answers of a non-default length are neither looked up nor embedded."""
+        route = self.route(use_response_cache=False)
+        self.assertIsNone(route.query_embedding)
+        self.rag_client.openai.generate_embedding.assert_not_called()
+        self.assertIsNotNone(route.pending_context)
+
+
+def links(response: object) -> dict[str, dict[str, list[str]]]:
+    """Return the query parameters of the `Link` header URLs, by relation."""
+    return {
+        rel: parse_qs(urlsplit(url).query)
+        for url, rel in re.findall(r'<([^>]+)>; rel="(\w+)"', response["Link"])
+    }
+
+
+def parse_frames(frames: list[str]) -> list[tuple[str | None, str, str]]:
+    """Return the ID, name and data of each SSE event."""
+    events = []
+    for frame in frames:
+        fields = dict(line.split(": ", 1) for line in frame.strip("\n").split("\n"))
+        events.append((fields.get("id"), fields.get("event"), fields["data"]))
+    return events
+
+
+def failing_tokens(*_args: object) -> Iterator[str]:
+    """Stream one token, then fail like a dropped model connection."""
+    yield "Hello"
+    raise ConnectionError
+
+
+async def afailing_tokens(*_args: object) -> AsyncIterator[str]:
+    """Asynchronous version of `failing_tokens`."""
+    yield "Hello"
+    raise ConnectionError
+
+
+class ChatHistoryListTests(TestCase):
+    def create_histories(self, count: int, namespace: str = "") -> list[ChatHistory]:
+        """Create histories with a first user message, sharing a few timestamps."""
+        created_at = timezone.now()
+        histories = []
+        for i in range(count):
+            history = ChatHistory.objects.create(
+                title="",
+                namespace=namespace,
+                created_at=created_at - timedelta(minutes=i // 2),
+            )
+            ChatMessage.objects.create(
+                chat_history=history,
+                role=ChatMessage.Role.USER,
+                content=f"Question {i}",
+            )
+            histories.append(history)
+        return histories
+
+    def test_lists_a_page_in_one_query(self) -> None:
+        """Titles derived from first messages don't add a query per history."""
+        url = reverse("chat-list")
+        for count in [2, 20]:
+            self.create_histories(count - ChatHistory.objects.count())
+            with self.subTest(count=count), self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(len(response.json()["results"]), count)
+        titles = [history["title"] for history in response.json()["results"]]
+        self.assertTrue(all(title.startswith("Question ") for title in titles))
+
+    def test_pages_through_every_history_once(self) -> None:
+        """Following the `next` cursors lists every history once, newest first."""
+        histories = self.create_histories(7)
+        ids = []
+        url = f"{reverse('chat-list')}?page_size=3"
+        while url:
+            page = self.client.get(url).json()
+            ids.extend(history["id"] for history in page["results"])
+            url = page["next"]
+        expected = sorted(histories, key=lambda h: (h.created_at, h.id), reverse=True)
+        self.assertEqual(ids, [history.id for history in expected])
+
+    def test_filters_by_namespace(self) -> None:
+        """With `namespace`, only the histories of that namespace are listed."""
+        [acme] = self.create_histories(1, namespace="acme")
+        self.create_histories(2)
+        response = self.client.get(reverse("chat-list"), {"namespace": "acme"})
+        self.assertEqual([h["id"] for h in response.json()["results"]], [acme.id])
+        response = self.client.get(reverse("chat-list"), {"namespace": ""})
+        self.assertEqual(len(response.json()["results"]), 2)
+
+
+class ChatMessageListTests(TestCase):
+    def setUp(self) -> None:
+        """Create a chat with five messages, a minute apart."""
+        self.chat = ChatHistory.objects.create(title="Salaries")
+        started_at = timezone.now() - timedelta(hours=1)
+        self.messages = [
+            ChatMessage.objects.create(
+                chat_history=self.chat,
+                role=ChatMessage.Role.USER if i % 2 == 0 else ChatMessage.Role.BOT,
+                content=f"Message {i}",
+                created_at=started_at + timedelta(minutes=i),
+            )
+            for i in range(5)
+        ]
+        self.url = reverse("chat-messages", args=[self.chat.id])
+
+    def contents(self, response: object) -> list[str]:
+        """Return the contents of the messages of a page."""
+        return [message["content"] for message in response.json()]
+
+    def test_returns_the_latest_page_linking_to_older_ones(self) -> None:
+        """The default page ends at the newest message and links to the previous."""
+        response = self.client.get(self.url, {"limit": 2})
+        self.assertEqual(self.contents(response), ["Message 3", "Message 4"])
+        self.assertEqual(
+            links(response),
+            {"prev": {"before": [str(self.messages[3].id)], "limit": ["2"]}},
+        )
+
+    def test_pages_back_with_before(self) -> None:
+        """`before` pages link to both the older and the newer messages."""
+        response = self.client.get(self.url, {"limit": 2, "before": self.messages[3].id})
+        self.assertEqual(self.contents(response), ["Message 1", "Message 2"])
+        self.assertEqual(links(response)["prev"]["before"], [str(self.messages[1].id)])
+        self.assertEqual(links(response)["next"]["after"], [str(self.messages[2].id)])
+
+        response = self.client.get(self.url, {"limit": 2, "before": self.messages[1].id})
+        self.assertEqual(self.contents(response), ["Message 0"])
+        self.assertNotIn("prev", links(response))
+
+    def test_fetches_newer_messages_with_after(self) -> None:
+        """`after` returns the messages following a known one, oldest first."""
+        response = self.client.get(self.url, {"limit": 2, "after": self.messages[1].id})
+        self.assertEqual(self.contents(response), ["Message 2", "Message 3"])
+        self.assertEqual(links(response)["next"]["after"], [str(self.messages[3].id)])
+
+    def test_fetches_messages_since_a_time(self) -> None:
+        """`since` returns the messages created after a timestamp."""
+        since = self.messages[2].created_at.isoformat()
+        response = self.client.get(self.url, {"since": since})
+        self.assertEqual(self.contents(response), ["Message 3", "Message 4"])
+
+    def test_rejects_malformed_cursors(self) -> None:
+        """Cursors that are not message IDs or timestamps are a bad request."""
+        for params in [{"before": "x"}, {"after": "x"}, {"since": "yesterday"}]:
+            with self.subTest(params=params), self.assertLogs("django.request"):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_revalidates_an_unchanged_page(self) -> None:
+        """A client holding the current page gets a 304 without the messages."""
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+    def test_new_messages_change_the_etag(self) -> None:
+        """A message added to the chat invalidates the pages clients hold."""
+        etag = self.client.get(self.url)["ETag"]
+        self.chat.save_bot_response("Message 5")
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(self.contents(response)[-1], "Message 5")
+
+
+class StreamViewTests(TestCase):
+    def setUp(self) -> None:
+        """Create a chat, and fake the RAG client and the routing of questions."""
+        # Requests log their traces at INFO.
+        logging.disable(logging.INFO)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.chat = ChatHistory.objects.create(title="New Chat")
+        self.rag_client = mock.Mock()
+        app_config = mock.Mock(rag_client=self.rag_client, rag_client_loaded=True)
+        patcher = mock.patch("chat.views.apps.get_app_config", return_value=app_config)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.route = QueryRoute(ready_response="Hello there")
+        patcher = mock.patch("chat.views._route_query", return_value=self.route)
+        self.route_query = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, **headers: str) -> object:
+        """Return a stream request of the chat, sending tokens one by one."""
+        params = {"query": QUERY, "chat_history_id": self.chat.id, "coalesce_chars": 0}
+        return RequestFactory().get("/", params, headers=headers)
+
+    def stream(self, **headers: str) -> list[tuple[str | None, str, str]]:
+        """Stream the answer of the synchronous view, returning its events."""
+        response = stream_llm_response_view(self.request(**headers))
+        return parse_frames([frame.decode() for frame in response.streaming_content])
+
+    async def astream(self, **headers: str) -> list[tuple[str | None, str, str]]:
+        """Stream the answer of the asynchronous view, returning its events."""
+        params = {"query": QUERY, "chat_history_id": self.chat.id, "coalesce_chars": 0}
+        request = AsyncRequestFactory().get("/", params, headers=headers)
+        response = await astream_llm_response_view(request)
+        frames = [frame.decode() async for frame in response.streaming_content]
+        return parse_frames(frames)
+
+    def bot_responses(self) -> list[str]:
+        """Return the saved answers of the chat."""
+        messages = ChatMessage.objects.filter(chat_history=self.chat)
+        return list(
+            messages.filter(role=ChatMessage.Role.BOT).values_list("content", flat=True),
+        )
+
+    def test_ends_the_answer_with_done(self) -> None:
+        """The answer is streamed in events with IDs, then [DONE] ends it."""
+        events = self.stream()
+        self.assertEqual(
+            [(name, data) for _, name, data in events],
+            [(None, "Hello"), (None, " there"), (None, "[DONE]")],
+        )
+        self.assertTrue(all(event_id for event_id, _, _ in events))
+        self.assertEqual(self.bot_responses(), ["Hello there"])
+
+    def test_ends_a_failed_answer_with_an_error_event(self) -> None:
+        """A failure sends an error event, not [DONE], and keeps the partial answer."""
+        self.route.ready_response = None
+        self.rag_client.stream_rag_response.side_effect = failing_tokens
+        with self.assertLogs("chat.views", "ERROR"):
+            events = self.stream()
+        self.assertEqual(
+            [(name, data) for _, name, data in events],
+            [(None, "Hello"), ("error", STREAM_ERROR_MESSAGE)],
+        )
+        self.assertEqual(self.bot_responses(), ["Hello"])
+
+    def test_resumes_after_the_last_event_read(self) -> None:
+        """A reconnecting client gets the rest of the stream, not a new answer."""
+        first_id = self.stream()[0][0]
+        events = self.stream(**{LAST_EVENT_ID_HEADER: first_id})
+        self.assertEqual([data for _, _, data in events], [" there", "[DONE]"])
+        self.assertEqual(self.route_query.call_count, 1)
+        self.assertEqual(self.bot_responses(), ["Hello there"])
+
+    def test_answers_anew_for_an_unknown_stream(self) -> None:
+        """An unknown or malformed Last-Event-ID is ignored."""
+        for event_id in ["unknown:1", "malformed"]:
+            with self.subTest(event_id=event_id):
+                events = self.stream(**{LAST_EVENT_ID_HEADER: event_id})
+                self.assertEqual(events[-1][2], "[DONE]")
+        self.assertEqual(self.route_query.call_count, 2)
+
+    async def test_ends_the_async_answer_with_done(self) -> None:
+        """The asynchronous view streams the same events."""
+        events = await self.astream()
+        self.assertEqual(
+            [(name, data) for _, name, data in events],
+            [(None, "Hello"), (None, " there"), (None, "[DONE]")],
+        )
+
+    async def test_ends_a_failed_async_answer_with_an_error_event(self) -> None:
+        """The asynchronous view also ends a failed answer with an error event."""
+        self.route.ready_response = None
+        self.rag_client.astream_rag_response.side_effect = afailing_tokens
+        with self.assertLogs("chat.views", "ERROR"):
+            events = await self.astream()
+        self.assertEqual(
+            [(name, data) for _, name, data in events],
+            [(None, "Hello"), ("error", STREAM_ERROR_MESSAGE)],
+        )
+
+    async def test_resumes_the_async_stream(self) -> None:
+        """A client of the asynchronous view resumes from the buffer too."""
+        first_id = (await self.astream())[0][0]
+        events = await self.astream(**{LAST_EVENT_ID_HEADER: first_id})
+        self.assertEqual([data for _, _, data in events], [" there", "[DONE]"])
+        self.assertEqual(self.route_query.call_count, 1)
@@ -1,19 +1,87 @@
+import asyncio
+import hashlib
+import logging
+import re
 import time
+from collections.abc import AsyncIterable, AsyncIterator, Generator, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
-from celery.result import AsyncResult
+from asgiref.sync import sync_to_async
 from django.apps import apps
-from django.http import HttpRequest, StreamingHttpResponse
-from rest_framework import generics
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import generics, status
 from rest_framework.response import Response
 
-from chat.models import ChatHistory, ChatMessage
+from chat.models import ChatHistory, ChatHistoryQuerySet, ChatMessage
+from chat.pagination import ChatHistoryCursorPagination, MessageKeysetPagination
+from chat.resume import (
+    LAST_EVENT_ID_HEADER,
+    StreamBuffer,
+    format_event_id,
+    parse_event_id,
+)
 from chat.serializers import ChatHistorySerializer, ChatMessageSerializer
-from rag.tasks import fetch_rag_context
+from chat.streaming import acoalesce_tokens, coalesce_tokens, format_sse, with_event_id
+from rag.tracing import REQUEST_ID_HEADER, Trace
+
+if TYPE_CHECKING:
+    # Imported lazily with the RAG client, which is constructed on first use.
+    from rag.clients import RAGClient
+    from rag.resources import NamespaceResources
+    from rag.retrieval import PendingContext
+
+logger = logging.getLogger(__name__)
+
+# Runs the blocking calls of the async stream view: the response cache lookup, the
+# Celery task and the wait for its result.
+blocking_executor = ThreadPoolExecutor(
+    max_workers=settings.CHAT_ASYNC_BLOCKING_THREADS,
+    thread_name_prefix="chat-blocking",
+)
+
+# Events of the recent streams of this process, for clients resuming them.
+stream_buffer = (
+    StreamBuffer(
+        ttl=settings.SSE_RESUME_TTL,
+        max_events=settings.SSE_RESUME_MAX_EVENTS,
+        max_streams=settings.SSE_RESUME_MAX_STREAMS,
+    )
+    if settings.SSE_RESUME_ENABLED
+    else None
+)
+# Finishes the streams of the sync view whose client has disconnected.
+detached_executor = ThreadPoolExecutor(
+    max_workers=settings.SSE_DETACHED_THREADS,
+    thread_name_prefix="chat-detached",
+)
+# Generation tasks of the async view, referenced until they finish.
+generation_tasks: set[asyncio.Task] = set()
+
+# Splits a cached answer into word-sized tokens, keeping the leading whitespace.
+CACHED_TOKEN_PATTERN = re.compile(r"\s*\S+|\s+$")
+# Data of the `error` event ending a stream whose answer failed, instead of [DONE].
+STREAM_ERROR_MESSAGE = "Failed to generate a response. Please try again."
 
 
 class ChatHistoryListCreate(generics.ListCreateAPIView):
-    queryset = ChatHistory.objects.all().order_by("-created_at")
+    queryset = ChatHistory.objects.with_first_user_message()
     serializer_class = ChatHistorySerializer
+    pagination_class = ChatHistoryCursorPagination
+
+    def get_queryset(self) -> ChatHistoryQuerySet:
+        """Return the histories, of one namespace if `namespace` is given."""
+        queryset = super().get_queryset()
+        namespace = self.request.query_params.get("namespace")
+        if namespace is not None:
+            queryset = queryset.filter(namespace=namespace)
+        return queryset
 
 
 class ChatHistoryCreate(generics.CreateAPIView):
@@ -29,67 +97,565 @@ class ChatHistoryCreate(generics.CreateAPIView):
 class ChatMessageList(generics.RetrieveAPIView):
     serializer_class = ChatMessageSerializer
     queryset = ChatHistory.objects.all()
+    pagination_class = MessageKeysetPagination
 
     def retrieve(self, request: HttpRequest, *args, **kwargs) -> Response:  # noqa: ARG002
-        """Retrieve chat messages."""
+        """Retrieve a page of chat messages.
+
+        Messages are only ever appended, so their count and last ID identify the
+        state of the conversation. They form the ETag, and a client holding the
+        current page gets a 304 without the messages being read.
+        """
         instance = self.get_object()
-        messages = instance.messages.order_by("created_at")
-        serializer = self.get_serializer(messages, many=True)
-        return Response(serializer.data)
+        messages = instance.messages.all()
+        state = messages.aggregate(count=Count("id"), last_id=Max("id"))
+        etag = quote_etag(
+            hashlib.sha256(
+                f"{state['count']}:{state['last_id']}:{request.get_full_path()}".encode(),
+            ).hexdigest()[:32],
+        )
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            page = self.paginate_queryset(messages)
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+        response["ETag"] = etag
+        # Let browsers cache the page but revalidate it with If-None-Match.
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+def _get_context(pending: "PendingContext", deadline: float) -> str | None:
+    """Wait up to RAG_STATUS_INTERVAL seconds for the context of the query.
+
+    Returns None if it is still being retrieved. If retrieval fails or the
+    `deadline` has passed, an empty context is returned so the answer is generated
+    without it.
+    """
+    timeout = min(settings.RAG_STATUS_INTERVAL, deadline - time.monotonic())
+    if timeout <= 0:
+        logger.warning("Timed out waiting for RAG context retrieval %s.", pending.id)
+        return ""
+    return pending.wait(timeout)
+
+
+def _wait_for_context(pending: "PendingContext") -> Generator[str, None, str]:
+    """Yield status events until the context is retrieved, then return it.
+
+    A status event is sent every RAG_STATUS_INTERVAL seconds as a keep-alive, for
+    at most RAG_CONTEXT_TIMEOUT seconds.
+    """
+    deadline = time.monotonic() + settings.RAG_CONTEXT_TIMEOUT
+    while (context := _get_context(pending, deadline)) is None:
+        yield format_sse("Retrieving relevant context...", event="status")
+    return context
+
+
+def _trace_tokens(tokens: Iterable[str], trace: Trace) -> Iterator[str]:
+    """Pass tokens through, timing the first one and the generation of the rest."""
+    first_token_at = None
+    for token in tokens:
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+            trace.add("time_to_first_token", trace.elapsed())
+        trace.tokens += 1
+        yield token
+    if first_token_at is not None:
+        trace.add("generation", time.perf_counter() - first_token_at)
+
+
+async def _atrace_tokens(tokens: AsyncIterable[str], trace: Trace) -> AsyncIterator[str]:
+    """Asynchronous version of `_trace_tokens`."""
+    first_token_at = None
+    async for token in tokens:
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+            trace.add("time_to_first_token", trace.elapsed())
+        trace.tokens += 1
+        yield token
+    if first_token_at is not None:
+        trace.add("generation", time.perf_counter() - first_token_at)
+
+
+def _coalescing_options(request: HttpRequest) -> tuple[int, float]:
+    """Return the SSE coalescing thresholds (characters, seconds) for a request.
+
+    The `coalesce_chars` and `coalesce_ms` query parameters override the
+    SSE_COALESCE_MAX_CHARS and SSE_COALESCE_MAX_DELAY_MS settings.
+    """
+    try:
+        max_chars = int(
+            request.GET.get("coalesce_chars", settings.SSE_COALESCE_MAX_CHARS),
+        )
+        max_delay_ms = float(
+            request.GET.get("coalesce_ms", settings.SSE_COALESCE_MAX_DELAY_MS),
+        )
+    except ValueError:
+        max_chars = settings.SSE_COALESCE_MAX_CHARS
+        max_delay_ms = settings.SSE_COALESCE_MAX_DELAY_MS
+    return max_chars, max(max_delay_ms, 0) / 1000
+
+
+def _max_tokens_option(request: HttpRequest) -> int:
+    """Return the answer length budget for a request, in tokens.
+
+    The `max_tokens` query parameter overrides CHAT_MAX_TOKENS, up to
+    CHAT_MAX_TOKENS_LIMIT.
+    """
+    try:
+        max_tokens = int(request.GET.get("max_tokens", settings.CHAT_MAX_TOKENS))
+    except ValueError:
+        max_tokens = settings.CHAT_MAX_TOKENS
+    return min(max(max_tokens, 1), settings.CHAT_MAX_TOKENS_LIMIT)
+
+
+@dataclass
+class QueryRoute:
+    """How a question is answered: with a ready answer, or by the LLM.
+
+    The LLM answers with the context of `pending_context`, or without context when
+    the question needs no retrieval. `query_embedding`, `index_version` and
+    `entities` are set when the answer can be added to the response cache.
+    """
+
+    ready_response: str | None = None
+    query_embedding: list[float] | None = None
+    index_version: str | None = None
+    entities: frozenset[str] = frozenset()
+    pending_context: "PendingContext | None" = None
+
+
+def _route_query(
+    rag_client: "RAGClient",
+    resources: "NamespaceResources",
+    query: str,
+    trace: Trace,
+    *,
+    use_response_cache: bool = True,
+) -> QueryRoute:
+    """Find how to answer a question, starting the retrieval of its context if needed.
+
+    Aggregate and lookup questions over the employee table of the chat's namespace
+    are answered exactly by its structured query router. Otherwise, the answer to a
+    near-identical question against the same index version is looked up in the
+    namespace's response cache, unless it is not used, as for answers of a
+    non-default length. Otherwise, the context of the question is retrieved.
+
+    With CHAT_PIPELINED_RETRIEVAL, questions that don't need the dataset skip the
+    response cache and retrieval, so the LLM starts at once. The retrieval of the
+    other questions starts before the response cache lookup, which embeds the
+    query, and runs while it does; on a hit, the context goes unused.
+    """
+    pipelined = settings.CHAT_PIPELINED_RETRIEVAL
+    route = QueryRoute()
+    with trace.stage("ready_lookup"):
+        if resources.structured_router is not None:
+            route.ready_response = resources.structured_router.answer(query)
+            if route.ready_response is not None:
+                return route
+        if pipelined and not resources.needs_dataset(query):
+            return route
+
+    if pipelined:
+        with trace.stage("enqueue"):
+            route.pending_context = rag_client.context_retrieval.submit(
+                query,
+                settings.RAG_TOP_K,
+                resources.namespace,
+                trace,
+            )
+    with trace.stage("ready_lookup"):
+        response_cache = resources.response_cache if use_response_cache else None
+        index_version = response_cache.current_version() if response_cache else None
+        if index_version is not None:
+            route.query_embedding = rag_client.openai.generate_embedding(query)
+            route.index_version = index_version
+            route.entities = resources.query_entities(query)
+            route.ready_response = response_cache.get(
+                route.query_embedding,
+                index_version,
+                route.entities,
+            )
+    if route.ready_response is None and route.pending_context is None:
+        with trace.stage("enqueue"):
+            route.pending_context = rag_client.context_retrieval.submit(
+                query,
+                settings.RAG_TOP_K,
+                resources.namespace,
+                trace,
+            )
+    return route
+
+
+def _cache_response(
+    resources: "NamespaceResources",
+    route: QueryRoute,
+    response: str,
+) -> None:
+    """Cache a generated answer, if its question was looked up in the response cache."""
+    generated = route.ready_response is None and route.query_embedding is not None
+    if generated and response:
+        resources.response_cache.set(
+            route.query_embedding,
+            response,
+            route.index_version,
+            route.entities,
+        )
+
+
+def _resumed_stream_response(
+    chat_history: ChatHistory,
+    last_event_id: str | None,
+    *,
+    asynchronous: bool = False,
+) -> HttpResponse | None:
+    """Return the rest of the stream a reconnecting client has read up to, if any.
+
+    Returns None, for the question to be answered anew, if no stream of the chat is
+    buffered under `last_event_id`. If the events after it have been dropped from
+    the buffer, a 204 tells the client to stop reconnecting.
+    """
+    parsed = parse_event_id(last_event_id) if last_event_id else None
+    if stream_buffer is None or parsed is None:
+        return None
+    stream_id, after = parsed
+    events = stream_buffer.read(stream_id, chat_history.id, after)
+    if events is None:
+        logger.info("Stream %s is no longer buffered, answering anew.", stream_id)
+        return None
+    if not events.complete:
+        logger.info("Events of stream %s after %d were dropped.", stream_id, after)
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+    logger.info("Resuming stream %s after event %d.", stream_id, after)
+    replay = _areplay_events if asynchronous else _replay_events
+    return StreamingHttpResponse(
+        replay(stream_id, chat_history.id, after),
+        content_type="text/event-stream",
+    )
+
+
+def _replay_events(stream_id: str, chat_history_id: int, after: int) -> Iterator[str]:
+    """Yield the buffered events of a stream after the `after`-th one, until it ends."""
+    while True:
+        events = stream_buffer.read(
+            stream_id,
+            chat_history_id,
+            after,
+            max_wait=settings.RAG_STATUS_INTERVAL,
+        )
+        if events is None or not events.complete:
+            return
+        for seq, frame in events.events:
+            yield with_event_id(frame, format_event_id(stream_id, seq))
+            after = seq
+        if events.done:
+            return
+
+
+async def _areplay_events(
+    stream_id: str,
+    chat_history_id: int,
+    after: int,
+) -> AsyncIterator[str]:
+    """Asynchronous version of `_replay_events`."""
+    while True:
+        events = await stream_buffer.aread(
+            stream_id,
+            chat_history_id,
+            after,
+            max_wait=settings.RAG_STATUS_INTERVAL,
+        )
+        if events is None or not events.complete:
+            return
+        for seq, frame in events.events:
+            yield with_event_id(frame, format_event_id(stream_id, seq))
+            after = seq
+        if events.done:
+            return
+
+
+def _buffered_events(stream_id: str, events: Iterator[str]) -> Iterator[str]:
+    """Buffer the events of a new stream as they are sent, with their IDs.
+
+    If the client disconnects, the rest of the stream is generated into the buffer
+    on `detached_executor`, for the client to resume it.
+    """
+    detached = False
+    try:
+        for frame in events:
+            seq = stream_buffer.append(stream_id, frame)
+            yield with_event_id(frame, format_event_id(stream_id, seq))
+    except GeneratorExit:
+        detached = True
+        detached_executor.submit(_drain_events, stream_id, events)
+        raise
+    finally:
+        if not detached:
+            stream_buffer.close(stream_id)
+
+
+def _drain_events(stream_id: str, events: Iterator[str]) -> None:
+    """Generate the rest of a stream into the buffer, after its client left."""
+    try:
+        for frame in events:
+            stream_buffer.append(stream_id, frame)
+    except Exception:
+        logger.exception("Failed to finish stream %s.", stream_id)
+    finally:
+        stream_buffer.close(stream_id)
+        connection.close()
+
+
+def _abuffered_events(
+    chat_history_id: int,
+    events: AsyncIterator[str],
+) -> AsyncIterator[str]:
+    """Generate a new stream into the buffer in a task, returning its buffered events.
+
+    The task goes on if the client disconnects, for the client to resume the stream.
+    Without a buffer, the events are returned as they are.
+    """
+    if stream_buffer is None:
+        return events
+    stream_id = stream_buffer.create(chat_history_id)
+    task = asyncio.create_task(_agenerate_events(stream_id, events))
+    generation_tasks.add(task)
+    task.add_done_callback(generation_tasks.discard)
+    return _areplay_events(stream_id, chat_history_id, 0)
+
+
+async def _agenerate_events(stream_id: str, events: AsyncIterator[str]) -> None:
+    """Generate a stream into the buffer, whether or not its client is connected."""
+    try:
+        async for frame in events:
+            stream_buffer.append(stream_id, frame)
+    except Exception:
+        logger.exception("Failed to generate stream %s.", stream_id)
+    finally:
+        stream_buffer.close(stream_id)
 
 
 def stream_llm_response_view(request: HttpRequest) -> StreamingHttpResponse:
-    """Stream LLM response using Celery + RAG and Server-Side Events (SSE)."""
+    """Stream LLM response using Celery + RAG and Server-Side Events (SSE).
+
+    Each stage of the request is timed in a trace, identified by the X-Request-ID
+    header of the request (or a new ID) and returned in the same header.
+
+    Events carry IDs and are buffered, and the answer is generated to the end even
+    if the client disconnects. A client reconnecting with the Last-Event-ID header
+    gets the rest of the stream from the buffer instead of a new answer.
+    """
+    trace = Trace(request.headers.get(REQUEST_ID_HEADER))
     query = request.GET.get("query", "")
     chat_history_id = request.GET.get("chat_history_id")
 
     if not query or not chat_history_id:
         return StreamingHttpResponse(status=400)
 
+    coalesce_chars, coalesce_delay = _coalescing_options(request)
+    max_tokens = _max_tokens_option(request)
+
     try:
         chat_history = ChatHistory.objects.get(id=chat_history_id)
     except ChatHistory.DoesNotExist:
         return StreamingHttpResponse(status=404)
 
-    # Save user message
-    ChatMessage.objects.create(
-        chat_history=chat_history,
-        role=ChatMessage.Role.USER,
-        content=query,
+    resumed = _resumed_stream_response(
+        chat_history,
+        request.headers.get(LAST_EVENT_ID_HEADER),
     )
+    if resumed is not None:
+        return resumed
 
-    rag_app_config = apps.get_app_config("rag")
-    fetch_rag_context_task = fetch_rag_context.delay(query)
+    # Save user message
+    with trace.stage("db_write"):
+        ChatMessage.objects.create(
+            chat_history=chat_history,
+            role=ChatMessage.Role.USER,
+            content=query,
+        )
+
+    rag_client = apps.get_app_config("rag").rag_client
+
+    with trace.stage("ready_lookup"):
+        resources = rag_client.resources(chat_history.namespace)
+    route = _route_query(
+        rag_client,
+        resources,
+        query,
+        trace,
+        use_response_cache=max_tokens == settings.CHAT_MAX_TOKENS,
+    )
+    ready_response = route.ready_response
 
     def event_stream() -> str:
-        result = AsyncResult(fetch_rag_context_task.id)
         full_response = []
 
-        while not result.ready():
-            yield "event: status\ndata: Retrieving relevant context...\n\n"
-            time.sleep(0.5)
+        if ready_response is not None:
+            tokens = CACHED_TOKEN_PATTERN.findall(ready_response)
+        else:
+            context = ""
+            if route.pending_context is not None:
+                context = yield from _wait_for_context(route.pending_context)
+            tokens = rag_client.stream_rag_response(query, context, max_tokens)
 
         try:
-            for token in rag_app_config.rag_client.stream_rag_response(
-                query,
-                result.result,
+            for chunk in coalesce_tokens(
+                _trace_tokens(tokens, trace),
+                max_chars=coalesce_chars,
+                max_delay=coalesce_delay,
             ):
-                full_response.append(token)
-                yield f"data: {token}\n\n"
-                time.sleep(0.05)
+                full_response.append(chunk)
+                yield format_sse(chunk)
+
+            _cache_response(resources, route, "".join(full_response))
+        except Exception:
+            logger.exception("Failed to stream request %s.", trace.request_id)
+            yield format_sse(STREAM_ERROR_MESSAGE, event="error")
+            return
         finally:
-            # Save bot response
-            ChatMessage.objects.create(
-                chat_history=chat_history,
-                role=ChatMessage.Role.BOT,
-                content="".join(full_response),
-            )
+            with trace.stage("db_write_response"):
+                chat_history.save_bot_response("".join(full_response))
+            trace.finish("llm" if ready_response is None else "ready")
+
+        yield format_sse("[DONE]")
 
-            # Update title if empty
-            if chat_history.title in ["", "New Chat"]:
-                chat_history.title = chat_history.derived_title
-                chat_history.save(update_fields=["title"])
+    events = event_stream()
+    if stream_buffer is not None:
+        events = _buffered_events(stream_buffer.create(chat_history.id), events)
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response[REQUEST_ID_HEADER] = trace.request_id
+    return response
+
+
+async def astream_llm_response_view(request: HttpRequest) -> StreamingHttpResponse:
+    """Asynchronous version of `stream_llm_response_view`, for ASGI deployments.
+
+    The response is an asynchronous iterator, so an open stream does not hold a
+    worker thread while tokens are generated. Blocking calls run on
+    `blocking_executor`, which holds a thread only until the context is retrieved.
+    With resuming enabled, the answer is generated by a task of its own and the
+    response reads it from the buffer.
+    """
+    trace = Trace(request.headers.get(REQUEST_ID_HEADER))
+    query = request.GET.get("query", "")
+    chat_history_id = request.GET.get("chat_history_id")
+
+    if not query or not chat_history_id:
+        return StreamingHttpResponse(status=400)
+
+    coalesce_chars, coalesce_delay = _coalescing_options(request)
+    max_tokens = _max_tokens_option(request)
+
+    try:
+        chat_history = await ChatHistory.objects.aget(id=chat_history_id)
+    except ChatHistory.DoesNotExist:
+        return StreamingHttpResponse(status=404)
+
+    resumed = _resumed_stream_response(
+        chat_history,
+        request.headers.get(LAST_EVENT_ID_HEADER),
+        asynchronous=True,
+    )
+    if resumed is not None:
+        return resumed
+
+    # Save user message
+    with trace.stage("db_write"):
+        await ChatMessage.objects.acreate(
+            chat_history=chat_history,
+            role=ChatMessage.Role.USER,
+            content=query,
+        )
+
+    rag_client = await _aget_rag_client()
+
+    with trace.stage("ready_lookup"):
+        # Resources of a cold namespace are loaded off the event loop.
+        resources = await sync_to_async(
+            rag_client.resources,
+            thread_sensitive=False,
+            executor=blocking_executor,
+        )(chat_history.namespace)
+    route = await sync_to_async(
+        _route_query,
+        thread_sensitive=False,
+        executor=blocking_executor,
+    )(
+        rag_client,
+        resources,
+        query,
+        trace,
+        use_response_cache=max_tokens == settings.CHAT_MAX_TOKENS,
+    )
+    ready_response = route.ready_response
+
+    async def event_stream() -> AsyncIterator[str]:
+        full_response = []
+
+        if ready_response is not None:
+            tokens = _aiter_tokens(CACHED_TOKEN_PATTERN.findall(ready_response))
+        else:
+            context = ""
+            if route.pending_context is not None:
+                deadline = time.monotonic() + settings.RAG_CONTEXT_TIMEOUT
+                get_context = sync_to_async(
+                    _get_context,
+                    thread_sensitive=False,
+                    executor=blocking_executor,
+                )
+                while (
+                    context := await get_context(route.pending_context, deadline)
+                ) is None:
+                    yield format_sse("Retrieving relevant context...", event="status")
+            tokens = rag_client.astream_rag_response(query, context, max_tokens)
+
+        try:
+            async for chunk in acoalesce_tokens(
+                _atrace_tokens(tokens, trace),
+                max_chars=coalesce_chars,
+                max_delay=coalesce_delay,
+            ):
+                full_response.append(chunk)
+                yield format_sse(chunk)
+
+            _cache_response(resources, route, "".join(full_response))
+        except Exception:
+            logger.exception("Failed to stream request %s.", trace.request_id)
+            yield format_sse(STREAM_ERROR_MESSAGE, event="error")
+            return
+        finally:
+            # Save bot response, also when the client disconnects mid-stream
+            with trace.stage("db_write_response"):
+                await sync_to_async(chat_history.save_bot_response)(
+                    "".join(full_response),
+                )
+            trace.finish("llm" if ready_response is None else "ready")
+
+        yield format_sse("[DONE]")
+
+    response = StreamingHttpResponse(
+        _abuffered_events(chat_history.id, event_stream()),
+        content_type="text/event-stream",
+    )
+    response[REQUEST_ID_HEADER] = trace.request_id
+    return response
+
+
+async def _aget_rag_client() -> "RAGClient":
+    """Return the RAG client, constructing it off the event loop on first use."""
+    rag_app_config = apps.get_app_config("rag")
+    if rag_app_config.rag_client_loaded:
+        return rag_app_config.rag_client
+    return await sync_to_async(
+        getattr,
+        thread_sensitive=False,
+        executor=blocking_executor,
+    )(rag_app_config, "rag_client")
 
-            yield "data: [DONE]\n\n"
 
-    return StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+async def _aiter_tokens(tokens: Iterable[str]) -> AsyncIterator[str]:
+    """Turn a list of tokens into an asynchronous iterator."""
+    for token in tokens:
+        yield token
@@ -0,0 +1,19 @@
+"""ASGI config for core project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+"""
+
+import logging
+import time
+
+from django.core.asgi import get_asgi_application
+
+started_at = time.perf_counter()
+application = get_asgi_application()
+logging.getLogger(__name__).info(
+    "ASGI application loaded in %.0f ms.",
+    (time.perf_counter() - started_at) * 1000,
+)
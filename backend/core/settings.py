@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -35,11 +36,14 @@ ALLOWED_HOSTS = ["localhost", "127.0.0.1"]
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
 ]
+CORS_EXPOSE_HEADERS = ["ETag", "Link", "X-Request-ID"]
+CORS_ALLOW_HEADERS = (*default_headers, "last-event-id")
 
 
 # Application definition
 
 WSGI_APPLICATION = "core.wsgi.application"
+ASGI_APPLICATION = "core.asgi.application"
 
 INSTALLED_APPS = [
     "django.contrib.admin",
@@ -86,12 +90,51 @@ TEMPLATES = [
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    },
-}
+# DATABASE_ENGINE selects SQLite (default, for local use) or PostgreSQL. PostgreSQL
+# connections are pooled in-process by psycopg when DATABASE_POOL is set, and kept
+# open for DATABASE_CONN_MAX_AGE seconds otherwise.
+DATABASE_ENGINE = os.getenv("DATABASE_ENGINE", "sqlite").lower()
+
+if DATABASE_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("POSTGRES_DB", "edge_assistant"),
+            "USER": os.getenv("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+            "HOST": os.getenv("POSTGRES_HOST", "localhost"),
+            "PORT": os.getenv("POSTGRES_PORT", "5432"),
+            "CONN_HEALTH_CHECKS": True,
+        },
+    }
+    if os.getenv("DATABASE_POOL", "false").lower() == "true":
+        DATABASES["default"]["OPTIONS"] = {
+            "pool": {
+                "min_size": int(os.getenv("DATABASE_POOL_MIN_SIZE", "2")),
+                "max_size": int(os.getenv("DATABASE_POOL_MAX_SIZE", "20")),
+                "timeout": float(os.getenv("DATABASE_POOL_TIMEOUT", "10")),
+            },
+        }
+    else:
+        DATABASES["default"]["CONN_MAX_AGE"] = int(
+            os.getenv("DATABASE_CONN_MAX_AGE", "60"),
+        )
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+            "OPTIONS": {
+                # WAL lets readers run alongside the single writer. IMMEDIATE
+                # transactions take the write lock upfront, so concurrent writers
+                # wait for it (up to `timeout` seconds) instead of failing to
+                # upgrade a read lock.
+                "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 20,
+            },
+        },
+    }
 
 
 # Password validation
@@ -143,6 +186,42 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "UTC"
 
+# RAG Streaming Configuration
+# Seconds to wait for the retrieval task before answering without context
+RAG_CONTEXT_TIMEOUT = float(os.getenv("RAG_CONTEXT_TIMEOUT", "30"))
+# Seconds between "Retrieving relevant context..." status events while waiting
+RAG_STATUS_INTERVAL = float(os.getenv("RAG_STATUS_INTERVAL", "2"))
+# Chunks retrieved per query. The context is then capped at RAG_CONTEXT_MAX_TOKENS.
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+# Default and maximum answer length in tokens, overridable with `?max_tokens=`
+CHAT_MAX_TOKENS = int(os.getenv("CHAT_MAX_TOKENS", "512"))
+CHAT_MAX_TOKENS_LIMIT = int(os.getenv("CHAT_MAX_TOKENS_LIMIT", "2048"))
+# Answer general-knowledge questions without retrieval, and retrieve the context of
+# dataset questions while their cached answer is looked up.
+CHAT_PIPELINED_RETRIEVAL = os.getenv("CHAT_PIPELINED_RETRIEVAL", "false").lower() == "true"
+# Tokens are buffered into one SSE frame until either threshold is reached.
+# A max of 0 characters sends every token in its own frame.
+SSE_COALESCE_MAX_CHARS = int(os.getenv("SSE_COALESCE_MAX_CHARS", "64"))
+SSE_COALESCE_MAX_DELAY_MS = float(os.getenv("SSE_COALESCE_MAX_DELAY_MS", "50"))
+# Serve the stream endpoint with the async view. Enable when running under ASGI.
+CHAT_ASYNC_STREAMING = os.getenv("CHAT_ASYNC_STREAMING", "false").lower() == "true"
+# Threads the async stream view uses for blocking calls, such as waiting for context.
+CHAT_ASYNC_BLOCKING_THREADS = int(os.getenv("CHAT_ASYNC_BLOCKING_THREADS", "64"))
+# Buffer the events of each stream, so a client reconnecting with Last-Event-ID
+# resumes it. Generation then goes on when the client disconnects.
+SSE_RESUME_ENABLED = os.getenv("SSE_RESUME_ENABLED", "true").lower() == "true"
+# Seconds a stream stays resumable after its last event, events kept per stream,
+# and streams kept per process.
+SSE_RESUME_TTL = float(os.getenv("SSE_RESUME_TTL", "300"))
+SSE_RESUME_MAX_EVENTS = int(os.getenv("SSE_RESUME_MAX_EVENTS", "4096"))
+SSE_RESUME_MAX_STREAMS = int(os.getenv("SSE_RESUME_MAX_STREAMS", "1000"))
+# Threads finishing the streams of the sync view whose client has disconnected.
+SSE_DETACHED_THREADS = int(os.getenv("SSE_DETACHED_THREADS", "16"))
+
+# Metrics Configuration
+# Addresses allowed to scrape the Prometheus metrics at /metrics/
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+
 # Logging Configuration
 LOGGING = {
     "version": 1,
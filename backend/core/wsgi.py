@@ -6,6 +6,14 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 """
 
+import logging
+import time
+
 from django.core.wsgi import get_wsgi_application
 
+started_at = time.perf_counter()
 application = get_wsgi_application()
+logging.getLogger(__name__).info(
+    "WSGI application loaded in %.0f ms.",
+    (time.perf_counter() - started_at) * 1000,
+)
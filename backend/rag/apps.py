@@ -1,6 +1,15 @@
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
 from django.apps import AppConfig
 
-from rag.clients import RAGClient
+if TYPE_CHECKING:
+    from rag.clients import RAGClient
+
+logger = logging.getLogger(__name__)
 
 
 class RagConfig(AppConfig):
@@ -9,9 +18,49 @@ class RagConfig(AppConfig):
     def __init__(self, app_name: str, app_module: str) -> None:
         """Initialize the app config."""
         super().__init__(app_name, app_module)
-        self.rag_client = None
+        self._rag_client = None
+        self._rag_client_lock = threading.Lock()
+        self.ready_ms = None
+
+    @property
+    def rag_client(self) -> "RAGClient":
+        """Return the RAG client, constructing it on first use.
+
+        Processes that never retrieve, such as `migrate`, don't import the OpenAI
+        and Pinecone SDKs or contact either service.
+        """
+        if self._rag_client is None:
+            with self._rag_client_lock:
+                if self._rag_client is None:
+                    from rag.clients import RAGClient  # noqa: PLC0415
+
+                    started_at = time.perf_counter()
+                    self._rag_client = RAGClient()
+                    logger.info(
+                        "RAG client constructed in %.0f ms.",
+                        (time.perf_counter() - started_at) * 1000,
+                    )
+        return self._rag_client
+
+    @rag_client.setter
+    def rag_client(self, rag_client: "RAGClient") -> None:
+        """Replace the RAG client, e.g. with one using local fakes."""
+        with self._rag_client_lock:
+            self._rag_client = rag_client
+
+    @property
+    def rag_client_loaded(self) -> bool:
+        """Return whether the RAG client has been constructed."""
+        return self._rag_client is not None
 
     def ready(self) -> None:
-        """Perform initializations when the app is ready."""
-        if not self.rag_client:
-            self.rag_client = RAGClient()
+        """Perform initializations when the app is ready.
+
+        With RAG_CLIENT_EAGER set, the RAG client is constructed now rather than on
+        the first request, e.g. to warm web workers before they take traffic.
+        """
+        started_at = time.perf_counter()
+        if os.getenv("RAG_CLIENT_EAGER", "false").lower() == "true":
+            _ = self.rag_client
+        self.ready_ms = (time.perf_counter() - started_at) * 1000
+        logger.debug("RAG app ready in %.0f ms.", self.ready_ms)
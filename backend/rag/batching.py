@@ -0,0 +1,142 @@
+"""Micro-batching of retrieval queries."""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from rag.namespaces import DEFAULT_NAMESPACE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_WINDOW_MS = 0
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_CONCURRENT_BATCHES = 4
+
+
+class RetrievalBatcher:
+    """Gathers retrieval queries submitted from many threads into batches.
+
+    The first query of a batch opens a window of `window` seconds. Queries arriving
+    within it, up to `max_batch_size`, are retrieved together by `retrieve_many`,
+    e.g. with one multi-input embedding request, and each caller's future receives
+    its own context. Queries about different namespaces are retrieved separately.
+    Up to `max_concurrent_batches` batches are retrieved at once, so a slow batch
+    does not hold back the next window.
+    """
+
+    def __init__(
+        self,
+        retrieve_many: Callable[[list[str], int, str], list[str]],
+        window: float,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_concurrent_batches: int = DEFAULT_MAX_CONCURRENT_BATCHES,
+    ) -> None:
+        """Initialize a batcher calling `retrieve_many(queries, top_k, namespace)`."""
+        self.retrieve_many = retrieve_many
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_concurrent_batches = max_concurrent_batches
+        self.stats = {"batches": 0, "queries": 0}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @classmethod
+    def from_env(
+        cls,
+        retrieve_many: Callable[[list[str], int, str], list[str]],
+    ) -> "RetrievalBatcher | None":
+        """Build the batcher configured by the RETRIEVAL_BATCH_* environment variables.
+
+        Batching is disabled unless RETRIEVAL_BATCH_WINDOW_MS is positive, since
+        every query may then wait up to the window before it is retrieved.
+        """
+        window_ms = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", DEFAULT_BATCH_WINDOW_MS))
+        if window_ms <= 0:
+            return None
+        max_batch_size = os.getenv("RETRIEVAL_BATCH_MAX_SIZE", DEFAULT_MAX_BATCH_SIZE)
+        max_concurrent_batches = os.getenv(
+            "RETRIEVAL_BATCH_MAX_CONCURRENT",
+            DEFAULT_MAX_CONCURRENT_BATCHES,
+        )
+        return cls(
+            retrieve_many,
+            window=window_ms / 1000,
+            max_batch_size=int(max_batch_size),
+            max_concurrent_batches=int(max_concurrent_batches),
+        )
+
+    def submit(
+        self,
+        query: str,
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> Future:
+        """Queue a query, returning a future resolved with its context."""
+        future = Future()
+        self._start()
+        self._queue.put((query, top_k, namespace, future))
+        return future
+
+    def _start(self) -> None:
+        """Start the collecting thread, once per process.
+
+        The batcher may be created before a worker forks, and threads do not
+        survive a fork, so each process starts its own.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.SimpleQueue()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrent_batches,
+                thread_name_prefix="retrieval-batch",
+            )
+            threading.Thread(
+                target=self._collect,
+                name="retrieval-batcher",
+                daemon=True,
+            ).start()
+
+    def _collect(self) -> None:
+        """Cut the queue into batches and hand them to the executor."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self.stats["batches"] += 1
+            self.stats["queries"] += len(batch)
+            self._executor.submit(self._retrieve, batch)
+
+    def _retrieve(self, batch: list[tuple[str, int, str, Future]]) -> None:
+        """Retrieve a batch, one call per `top_k` and namespace, and fan out results."""
+        groups = defaultdict(list)
+        for query, top_k, namespace, future in batch:
+            if future.set_running_or_notify_cancel():
+                groups[top_k, namespace].append((query, future))
+        for (top_k, namespace), items in groups.items():
+            try:
+                contexts = self.retrieve_many(
+                    [query for query, _ in items],
+                    top_k,
+                    namespace,
+                )
+            except Exception as e:
+                logger.exception("Retrieval of a batch of %d queries failed.", len(items))
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), context in zip(items, contexts, strict=True):
+                future.set_result(context)
@@ -0,0 +1,493 @@
+"""Caches shared by the ingest and query paths."""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+import redis
+
+from rag.namespaces import DEFAULT_NAMESPACE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_CACHE_URL = "redis://localhost:6379/1"
+DEFAULT_EMBEDDING_CACHE_MAX_ENTRIES = 4096
+DEFAULT_EMBEDDING_CACHE_TTL = 7 * 24 * 60 * 60
+DEFAULT_RESPONSE_CACHE_THRESHOLD = 0.95
+DEFAULT_RESPONSE_CACHE_MAX_ENTRIES = 1024
+DEFAULT_RESPONSE_CACHE_TTL = 24 * 60 * 60
+
+ENTITY_WORD_PATTERN = re.compile(r"[\w&-]+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different inputs share a cache entry."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def encode_embedding(embedding: list[float]) -> bytes:
+    """Encode an embedding as packed float32 values."""
+    return array("f", embedding).tobytes()
+
+
+def decode_embedding(value: bytes) -> list[float]:
+    """Decode an embedding packed by `encode_embedding`."""
+    embedding = array("f")
+    embedding.frombytes(value)
+    return embedding.tolist()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with per-entry expiry."""
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        """Initialize the cache with a maximum size and a time-to-live in seconds."""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> object | None:
+        """Return the cached value, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: object) -> None:
+        """Store a value, evicting the least recently used entries when full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        """Return the number of entries, including expired ones not yet evicted."""
+        return len(self._entries)
+
+
+class RedisEmbeddingStore:
+    """Shared embedding store in Redis.
+
+    Entries expire after the TTL. Size-based eviction is left to the Redis
+    `maxmemory-policy` (e.g. `allkeys-lru`) of the cache database.
+    """
+
+    key_prefix = "rag:embedding:"
+
+    def __init__(self, url: str, ttl: int) -> None:
+        """Initialize the store with a Redis URL and a time-to-live in seconds."""
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        """Return the packed embeddings stored under the given keys."""
+        return self.client.mget([self.key_prefix + key for key in keys])
+
+    def set_many(self, items: dict[str, bytes]) -> None:
+        """Store packed embeddings under the given keys."""
+        with self.client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(self.key_prefix + key, value, ex=self.ttl)
+            pipe.execute()
+
+
+class SQLiteEmbeddingStore:
+    """On-disk embedding store in a SQLite database.
+
+    Entries expire after the TTL, and the least recently used entries are evicted
+    once the store holds more than `max_entries`.
+    """
+
+    def __init__(self, path: str | Path, ttl: int, max_entries: int) -> None:
+        """Initialize the store at `path`, creating the table if needed."""
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)",
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_accessed_at "
+                "ON embeddings (accessed_at)",
+            )
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        """Return the packed embeddings stored under the given keys."""
+        now = time.time()
+        placeholders = ",".join("?" * len(keys))
+        with self._lock, self._connection:
+            rows = self._connection.execute(
+                f"SELECT key, value FROM embeddings "  # noqa: S608
+                f"WHERE key IN ({placeholders}) AND expires_at > ?",
+                [*keys, now],
+            ).fetchall()
+            self._connection.execute(
+                f"UPDATE embeddings SET accessed_at = ? "  # noqa: S608
+                f"WHERE key IN ({placeholders})",
+                [now, *keys],
+            )
+        values = dict(rows)
+        return [values.get(key) for key in keys]
+
+    def set_many(self, items: dict[str, bytes]) -> None:
+        """Store packed embeddings, then evict expired and least recently used ones."""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                [(key, value, now + self.ttl, now) for key, value in items.items()],
+            )
+            self._connection.execute("DELETE FROM embeddings WHERE expires_at <= ?", [now])
+            self._connection.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                [self.max_entries],
+            )
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache keyed by (model, normalized text).
+
+    Lookups go to an in-process LRU tier first and then to an optional shared tier
+    (Redis or on-disk SQLite). Both tiers hold packed float32 vectors. Errors from the
+    shared tier are logged and treated as misses, so the cache never fails an
+    embedding request.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_EMBEDDING_CACHE_MAX_ENTRIES,
+        ttl: int = DEFAULT_EMBEDDING_CACHE_TTL,
+        shared_store: RedisEmbeddingStore | SQLiteEmbeddingStore | None = None,
+    ) -> None:
+        """Initialize the cache tiers."""
+        self.local = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.shared_store = shared_store
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingCache | None":
+        """Build the cache configured by the EMBEDDING_CACHE_* environment variables.
+
+        EMBEDDING_CACHE_BACKEND is one of `redis` (default), `sqlite`, `memory` or
+        `none`. EMBEDDING_CACHE_LOCATION is the Redis URL or the SQLite file path.
+        """
+        backend = os.getenv("EMBEDDING_CACHE_BACKEND", "redis").lower()
+        if backend == "none":
+            return None
+        max_entries = int(
+            os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_EMBEDDING_CACHE_MAX_ENTRIES),
+        )
+        ttl = int(os.getenv("EMBEDDING_CACHE_TTL", DEFAULT_EMBEDDING_CACHE_TTL))
+        location = os.getenv("EMBEDDING_CACHE_LOCATION")
+
+        if backend == "redis":
+            shared_store = RedisEmbeddingStore(
+                location or DEFAULT_EMBEDDING_CACHE_URL,
+                ttl=ttl,
+            )
+        elif backend == "sqlite":
+            shared_store = SQLiteEmbeddingStore(
+                location or "embedding_cache.sqlite3",
+                ttl=ttl,
+                max_entries=max_entries,
+            )
+        elif backend == "memory":
+            shared_store = None
+        else:
+            msg = f"Unknown EMBEDDING_CACHE_BACKEND '{backend}'."
+            raise ValueError(msg)
+        return cls(max_entries=max_entries, ttl=ttl, shared_store=shared_store)
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        """Return the cache key for an embedding of `text` by `model`."""
+        return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode()).hexdigest()
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Hit and miss counters for each tier."""
+        return {
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+        }
+
+    def get_many(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        """Return cached embeddings for the given texts, with None for misses."""
+        keys = [self.key(model, text) for text in texts]
+        embeddings = [self.local.get(key) for key in keys]
+        embeddings = [
+            decode_embedding(value) if value is not None else None for value in embeddings
+        ]
+        local_hits = sum(embedding is not None for embedding in embeddings)
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        shared_hits = 0
+        if missing and self.shared_store is not None:
+            try:
+                values = self.shared_store.get_many([keys[i] for i in missing])
+            except (redis.RedisError, sqlite3.Error):
+                logger.warning("Shared embedding cache unavailable.", exc_info=True)
+                values = [None] * len(missing)
+            for i, value in zip(missing, values, strict=True):
+                if value is not None:
+                    embeddings[i] = decode_embedding(value)
+                    self.local.set(keys[i], value)
+                    shared_hits += 1
+
+        with self._stats_lock:
+            self.local_hits += local_hits
+            self.shared_hits += shared_hits
+            self.misses += len(texts) - local_hits - shared_hits
+        return embeddings
+
+    def set_many(
+        self,
+        model: str,
+        texts: list[str],
+        embeddings: list[list[float]],
+    ) -> None:
+        """Store embeddings for the given texts in every tier."""
+        items = {}
+        for text, embedding in zip(texts, embeddings, strict=True):
+            key = self.key(model, text)
+            items[key] = encode_embedding(embedding)
+            self.local.set(key, items[key])
+
+        if items and self.shared_store is not None:
+            try:
+                self.shared_store.set_many(items)
+            except (redis.RedisError, sqlite3.Error):
+                logger.warning("Shared embedding cache unavailable.", exc_info=True)
+
+
+def query_entities(query: str, names: Iterable[str] = ()) -> frozenset[str]:
+    """Return the lower-cased words naming what a question is about.
+
+    These are words with digits, such as Employee_41 or 2020, all-caps words such as
+    IT, and capitalized words after the first one, such as Sales. Each of `names`,
+    e.g. the departments of the dataset, is also matched in any case. Such words
+    barely move the embedding of a short question, so questions about different
+    entities can embed close together.
+    """
+    entities = set()
+    for position, word in enumerate(ENTITY_WORD_PATTERN.findall(query)):
+        if (
+            any(char.isdigit() for char in word)
+            or (len(word) > 1 and word.isupper())
+            or (position and word[0].isupper())
+        ):
+            entities.add(word.lower())
+    lowered = query.lower()
+    for name in map(str.lower, names):
+        if re.search(rf"\b{re.escape(name)}\b", lowered):
+            entities.add(name)
+    return frozenset(entities)
+
+
+class ResponseCache:
+    """Semantic cache of chat answers keyed by query embedding similarity.
+
+    An answer is reused when a new query's embedding has a cosine similarity of at
+    least `threshold` with a cached query embedded against the same index version,
+    and both queries name the same entities (see `query_entities`).
+    Entries live in a bounded in-process matrix with LRU eviction. The index version
+    is kept in Redis, so re-indexing from any process (see `invalidate`) empties the
+    caches of every web worker. Each namespace has a cache and a version of its own.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_RESPONSE_CACHE_THRESHOLD,
+        max_entries: int = DEFAULT_RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: int = DEFAULT_RESPONSE_CACHE_TTL,
+        version_url: str = DEFAULT_EMBEDDING_CACHE_URL,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> None:
+        """Initialize an empty cache of the answers about a namespace."""
+        self.version_key = (
+            f"rag:index-version:{namespace}" if namespace else "rag:index-version"
+        )
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_client = redis.Redis.from_url(version_url)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Versions replaced by a newer one, which requests may still carry.
+        self._stale_versions = set()
+        self._version = None
+        self._clear(version=None)
+
+    @classmethod
+    def from_env(cls, namespace: str = DEFAULT_NAMESPACE) -> "ResponseCache | None":
+        """Build the cache of a namespace, configured by RESPONSE_CACHE_*."""
+        if os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            threshold=float(
+                os.getenv("RESPONSE_CACHE_THRESHOLD", DEFAULT_RESPONSE_CACHE_THRESHOLD),
+            ),
+            max_entries=int(
+                os.getenv(
+                    "RESPONSE_CACHE_MAX_ENTRIES",
+                    DEFAULT_RESPONSE_CACHE_MAX_ENTRIES,
+                ),
+            ),
+            ttl=int(os.getenv("RESPONSE_CACHE_TTL", DEFAULT_RESPONSE_CACHE_TTL)),
+            version_url=os.getenv("RESPONSE_CACHE_LOCATION", DEFAULT_EMBEDDING_CACHE_URL),
+            namespace=namespace,
+        )
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Hit and miss counters."""
+        return {"hits": self.hits, "misses": self.misses, "entries": self._size}
+
+    @property
+    def nbytes(self) -> int:
+        """Return the approximate memory taken by the cached answers."""
+        with self._lock:
+            embeddings = self._embeddings.nbytes if self._embeddings is not None else 0
+            return (
+                embeddings
+                + self._entity_keys.nbytes
+                + self._expires_at.nbytes
+                + self._last_used.nbytes
+                + sum(len(response) for response in self._responses)
+            )
+
+    def current_version(self) -> str | None:
+        """Return the current index version, or None if it cannot be read."""
+        try:
+            version = self.version_client.get(self.version_key)
+        except redis.RedisError:
+            logger.warning("Response cache version unavailable.", exc_info=True)
+            return None
+        return version.decode() if version else ""
+
+    def invalidate(self, version: str) -> None:
+        """Publish a new index version, invalidating every cached answer."""
+        try:
+            self.version_client.set(self.version_key, version)
+        except redis.RedisError:
+            logger.warning("Could not invalidate the response cache.", exc_info=True)
+        with self._lock:
+            self._clear(version=version)
+
+    def get(
+        self,
+        embedding: list[float],
+        version: str,
+        entities: frozenset[str],
+    ) -> str | None:
+        """Return the cached answer for the most similar query, if close enough.
+
+        Only the answers to queries about the same `entities` are considered.
+        """
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if version in self._stale_versions:
+                self.misses += 1
+                return None
+            if version != self._version:
+                self._clear(version=version)
+            if self._size:
+                similarities = self._embeddings[: self._size] @ query
+                similarities[self._expires_at[: self._size] < now] = -np.inf
+                similarities[self._entity_keys[: self._size] != hash(entities)] = -np.inf
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._last_used[best] = now
+                    self.hits += 1
+                    return self._responses[best]
+            self.misses += 1
+            return None
+
+    def set(
+        self,
+        embedding: list[float],
+        response: str,
+        version: str,
+        entities: frozenset[str],
+    ) -> None:
+        """Cache the answer to a query about `entities`, embedded against `version`.
+
+        An answer computed against a version that has since been replaced is not
+        cached, and leaves the answers of the newer version in place.
+        """
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if version in self._stale_versions:
+                return
+            if version != self._version:
+                self._clear(version=version)
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.max_entries, len(query)), np.float32)
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+                self._responses.append(response)
+            else:
+                slot = int(np.argmin(self._last_used))
+                self._responses[slot] = response
+            self._embeddings[slot] = query
+            self._entity_keys[slot] = hash(entities)
+            self._expires_at[slot] = now + self.ttl
+            self._last_used[slot] = now
+
+    def _clear(self, version: str | None) -> None:
+        """Drop every entry and start caching answers for `version`."""
+        if self._version is not None and self._version != version:
+            self._stale_versions.add(self._version)
+        self._stale_versions.discard(version)
+        self._version = version
+        self._embeddings = None
+        self._responses = []
+        self._entity_keys = np.zeros(self.max_entries, dtype=np.int64)
+        self._expires_at = np.zeros(self.max_entries)
+        self._last_used = np.zeros(self.max_entries)
+        self._size = 0
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        """Return the embedding as a unit-length float32 vector."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
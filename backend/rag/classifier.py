@@ -0,0 +1,47 @@
+"""Lightweight routing of questions to the dataset, or to the LLM alone."""
+
+import re
+
+from rag.lexical import TOKEN_PATTERN, LexicalIndex
+from rag.structured import HEADCOUNT_PATTERN, SALARY_PATTERN
+
+# Words about employees and their pay, whether or not they appear in the chunks.
+DOMAIN_PATTERN = re.compile(
+    r"\b(employees?|staff|colleagues?|co-?workers?|departments?|dept|teams?|hired?"
+    r"|payroll|dataset)\b",
+    re.IGNORECASE,
+)
+# Function words matched only when written in capitals, like the IT department.
+STOP_WORDS = frozenset(
+    (
+        "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from",
+        "how", "i", "if", "in", "is", "it", "me", "my", "of", "on", "or", "so", "the",
+        "to", "us", "was", "we", "what", "when", "where", "which", "who", "why",
+        "will", "with", "you",
+    ),
+)  # fmt: skip
+
+
+def needs_dataset(query: str, index: LexicalIndex | None) -> bool:
+    """Return whether answering a question may need the namespace's dataset.
+
+    It may if it uses the dataset's domain words (salaries, headcounts, employees,
+    departments) or any word of its chunks, such as an employee or department name.
+    Numbers are ignored. Without a lexical index to check against, every question
+    may. The check takes microseconds, so general-knowledge questions can go to the
+    LLM without waiting for retrieval.
+    """
+    if index is None:
+        return True
+    if any(
+        pattern.search(query)
+        for pattern in (SALARY_PATTERN, HEADCOUNT_PATTERN, DOMAIN_PATTERN)
+    ):
+        return True
+    for token in TOKEN_PATTERN.findall(query):
+        term = token.lower()
+        if term.isdigit() or (term in STOP_WORDS and not token.isupper()):
+            continue
+        if term in index:
+            return True
+    return False
@@ -1,7 +1,37 @@
+import logging
 import os
+import threading
+import time
+from collections.abc import AsyncIterator, Callable
+from pathlib import Path
 
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
 from pinecone import Pinecone, ServerlessSpec
+from pinecone.data.index import Index
+from urllib3 import PoolManager
+
+from rag.batching import RetrievalBatcher
+from rag.cache import EmbeddingCache
+from rag.context import ContextAssembler
+from rag.namespaces import DEFAULT_NAMESPACE, validate_namespace
+from rag.resources import NamespaceCache, NamespaceResources
+from rag.retrieval import ContextRetrieval
+from rag.tracing import timed_stage
+from rag.transport import (
+    TransportSettings,
+    async_http_client_options,
+    call_latencies,
+    http_client_options,
+    reset_urllib3_connect_ms,
+    time_urllib3_connects,
+    urllib3_connect_ms,
+)
+from rag.vector_stores import DEFAULT_IVF_NPROBE, BaseVectorStore, LocalVectorStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_VECTOR_STORE_PATH = Path(__file__).resolve().parent / "data" / "vector_store"
+DEFAULT_MAX_ANSWER_TOKENS = 512
 
 
 class BaseClient:
@@ -24,10 +54,57 @@ class BaseClient:
 class OpenAIClient(BaseClient):
     """Interal OpenAI client."""
 
-    def __init__(self, api_key: str | None = None) -> None:
-        """Initialize OpenAI client with API key."""
+    def __init__(
+        self,
+        api_key: str | None = None,
+        embedding_cache: EmbeddingCache | None = None,
+        transport: TransportSettings | None = None,
+    ) -> None:
+        """Initialize OpenAI client with API key and an optional embedding cache.
+
+        Without an explicit cache or transport settings, the ones configured by the
+        EMBEDDING_CACHE_* and HTTP_* environment variables are used.
+        """
         super().__init__(api_key=api_key, env_key="OPENAI_API_KEY")
-        self.client = OpenAI(api_key=self.api_key)
+        self.transport = transport or TransportSettings.from_env()
+        self.embedding_cache = embedding_cache or EmbeddingCache.from_env()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> OpenAI:
+        """Return the OpenAI SDK client of this process."""
+        self._create_clients()
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Return the asynchronous OpenAI SDK client of this process."""
+        self._create_clients()
+        return self._async_client
+
+    def _create_clients(self) -> None:
+        """Create the SDK clients with pooled transports, once per process.
+
+        Pooled connections must not be shared with a forked child, such as a Celery
+        prefork worker, so each process creates its own clients.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._client = OpenAI(
+                api_key=self.api_key,
+                http_client=DefaultHttpxClient(**http_client_options(self.transport)),
+            )
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                http_client=DefaultAsyncHttpxClient(
+                    **async_http_client_options(self.transport),
+                ),
+            )
+            self._pid = os.getpid()
 
     def generate_embedding(
         self,
@@ -35,43 +112,108 @@ class OpenAIClient(BaseClient):
         model: str | None = None,
     ) -> list[float]:
         """Generate text embedding using specified model."""
+        return self.generate_embeddings([text], model=model)[0]
+
+    def generate_embeddings(
+        self,
+        texts: list[str],
+        model: str | None = None,
+    ) -> list[list[float]]:
+        """Generate embeddings for multiple texts in a single request.
+
+        Embeddings are returned in the same order as the input texts. Cached
+        embeddings are reused, and only the remaining texts are sent to the API.
+        """
         model_name = model or os.getenv("EMBEDDING_MODEL")
         if not model_name:
             msg = "EMBEDDING_MODEL must be set in environment or passed directly."
             raise ValueError(msg)
-        response = self.client.embeddings.create(input=text, model=model_name)
-        return response.data[0].embedding
+        if self.embedding_cache is None:
+            return self._create_embeddings(texts, model_name)
 
-    def stream_chat_completion(
-        self,
+        embeddings = self.embedding_cache.get_many(model_name, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            created = self._create_embeddings(missing_texts, model_name)
+            self.embedding_cache.set_many(model_name, missing_texts, created)
+            for i, embedding in zip(missing, created, strict=True):
+                embeddings[i] = embedding
+        return embeddings
+
+    def _create_embeddings(self, texts: list[str], model_name: str) -> list[list[float]]:
+        """Request embeddings for the given texts from the API."""
+        response = self.client.embeddings.create(
+            input=texts,
+            model=model_name,
+            timeout=self.transport.timeout(self.transport.embedding_timeout),
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    @staticmethod
+    def _chat_completion_params(
         system_prompt: str,
         user_query: str,
-        model: str | None = None,
-        max_tokens: int = 100,
-    ) -> iter:
-        """Stream chat completion response using specified model."""
+        model: str | None,
+        max_tokens: int,
+    ) -> dict:
+        """Build the parameters of a streamed chat completion request."""
         model_name = model or os.getenv("CHAT_MODEL")
         if not model_name:
             msg = "CHAT_MODEL must be set in environment or passed directly."
             raise ValueError(msg)
-        response = self.client.chat.completions.create(
-            model=model_name,
-            messages=[
+        return {
+            "model": model_name,
+            "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_query},
             ],
-            max_tokens=max_tokens,
-            stream=True,
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+
+    def stream_chat_completion(
+        self,
+        system_prompt: str,
+        user_query: str,
+        model: str | None = None,
+        max_tokens: int = 100,
+    ) -> iter:
+        """Stream chat completion response using specified model."""
+        response = self.client.chat.completions.create(
+            **self._chat_completion_params(system_prompt, user_query, model, max_tokens),
+            timeout=self.transport.timeout(self.transport.chat_timeout),
         )
         for chunk in response:
             if chunk.choices[0].delta.content:
                 yield chunk.choices[0].delta.content
 
+    async def astream_chat_completion(
+        self,
+        system_prompt: str,
+        user_query: str,
+        model: str | None = None,
+        max_tokens: int = 100,
+    ) -> AsyncIterator[str]:
+        """Asynchronously stream chat completion response using specified model."""
+        response = await self.async_client.chat.completions.create(
+            **self._chat_completion_params(system_prompt, user_query, model, max_tokens),
+            timeout=self.transport.timeout(self.transport.chat_timeout),
+        )
+        async for chunk in response:
+            if chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
 
-class PineconeClient(BaseClient):
+class PineconeClient(BaseClient, BaseVectorStore):
     """Internal Pinecone vector database client."""
 
-    def __init__(self, api_key: str | None = None, index_name: str | None = None) -> None:
+    def __init__(
+        self,
+        api_key: str | None = None,
+        index_name: str | None = None,
+        transport: TransportSettings | None = None,
+    ) -> None:
         """Initialize Pinecone client with API key and index name."""
         super().__init__(api_key=api_key, env_key="PINECONE_API_KEY")
         self.index_name = index_name or os.getenv("PINECONE_INDEX_NAME")
@@ -79,50 +221,296 @@ class PineconeClient(BaseClient):
             msg = "PINECONE_INDEX_NAME must be set in environment or passed directly."
             raise ValueError(msg)
 
-        self.client = Pinecone(api_key=self.api_key)
-        self._initialize_index()
+        self.transport = transport or TransportSettings.from_env()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> Pinecone:
+        """Return the Pinecone SDK client of this process."""
+        self._create_client()
+        return self._client
 
-    def _initialize_index(self, dimension: int | None = None) -> None:
-        """Initialize Pinecone index with specified dimension."""
+    @property
+    def index(self) -> Index:
+        """Return the index, looking up its host on first use in each process.
+
+        Setting PINECONE_INDEX_HOST skips the lookup. The index must exist; create
+        it with the `bootstrap_vector_index` command.
+        """
+        self._create_client()
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    index = self._client.Index(
+                        self.index_name,
+                        host=os.getenv("PINECONE_INDEX_HOST", ""),
+                        connection_pool_maxsize=self.transport.max_keepalive_connections,
+                    )
+                    pool_manager = self._find_pool_manager(index)
+                    if pool_manager is not None:
+                        time_urllib3_connects(pool_manager)
+                    self._index = index
+        return self._index
+
+    @staticmethod
+    def _find_pool_manager(index: Index) -> PoolManager | None:
+        """Return the urllib3 pool manager of an index, or None if it can't be found.
+
+        It is reached through attributes private to the SDK, which another version
+        may rename. Connect times are then not recorded, but the index still works.
+        """
+        target = index
+        for name in ("_vector_api", "api_client", "rest_client", "pool_manager"):
+            target = getattr(target, name, None)
+            if target is None:
+                logger.warning(
+                    "Pinecone index has no %s attribute; not timing its connections.",
+                    name,
+                )
+                return None
+        return target
+
+    def _create_client(self) -> None:
+        """Create the SDK client, once per process, as for `OpenAIClient`."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._client = Pinecone(api_key=self.api_key)
+            self._index = None
+            self._pid = os.getpid()
+
+    def create_index(self, dimension: int | None = None) -> bool:
+        """Create Pinecone index with specified dimension, unless it exists."""
         dimension = dimension or int(os.getenv("PINECONE_INDEX_DIMS"))
         if not dimension:
             msg = "PINECONE_INDEX_DIMS must be set in environment or passed directly."
             raise ValueError(msg)
-        if self.index_name not in self.client.list_indexes().names():
-            self.client.create_index(
-                name=self.index_name,
-                dimension=dimension,
-                spec=ServerlessSpec(cloud="aws", region="us-east-1"),
-            )
-        self.index = self.client.Index(self.index_name)
+        if self.index_name in self.client.list_indexes().names():
+            return False
+        self.client.create_index(
+            name=self.index_name,
+            dimension=dimension,
+            spec=ServerlessSpec(cloud="aws", region="us-east-1"),
+        )
+        return True
 
-    def query_index(self, vector: list[float], top_k: int = 3) -> list:
-        """Query the vector index."""
-        return self.index.query(vector=vector, top_k=top_k, include_metadata=True).matches
+    def query_index(
+        self,
+        vector: list[float],
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> list:
+        """Query the vector index, within a namespace."""
+        return self._timed_call(
+            "query",
+            self.index.query,
+            vector=vector,
+            top_k=top_k,
+            namespace=namespace,
+            include_metadata=True,
+            _request_timeout=self.transport.request_timeout(self.transport.query_timeout),
+        ).matches
 
-    def upsert_vectors(self, vectors: list) -> dict:
-        """Upsert vectors into the index."""
-        return self.index.upsert(vectors=vectors)
+    def upsert_vectors(self, vectors: list, namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """Upsert vectors into a namespace of the index."""
+        return self._timed_call(
+            "upsert",
+            self.index.upsert,
+            vectors=vectors,
+            namespace=namespace,
+            _request_timeout=self.transport.request_timeout(self.transport.upsert_timeout),
+        )
+
+    def delete_vectors(self, ids: list[str], namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """Delete vectors from a namespace of the index by ID."""
+        return self.index.delete(
+            ids=ids,
+            namespace=namespace,
+            _request_timeout=self.transport.request_timeout(self.transport.upsert_timeout),
+        )
+
+    def list_ids(self, prefix: str = "", namespace: str = DEFAULT_NAMESPACE) -> list[str]:
+        """Return the IDs of the vectors starting with `prefix`, page by page.
+
+        Pinecone only lists the vectors of serverless indexes.
+        """
+        return [
+            vector_id
+            for page in self.index.list(prefix=prefix, namespace=namespace)
+            for vector_id in page
+        ]
+
+    @staticmethod
+    def _timed_call(call: str, method: Callable, **kwargs) -> object:
+        """Call the index, recording the connect and server time of the call."""
+        reset_urllib3_connect_ms()
+        started_at = time.perf_counter()
+        result = method(**kwargs)
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        connect_ms = urllib3_connect_ms()
+        call_latencies.record(call, connect_ms, elapsed_ms - connect_ms)
+        return result
 
 
 class RAGClient:
     """Internal RAG client."""
 
-    def __init__(self) -> None:
-        """Initialize RAG client with OpenAI and Pinecone clients."""
-        self.openai = OpenAIClient()
-        self.pinecone = PineconeClient()
+    def __init__(
+        self,
+        openai: OpenAIClient | None = None,
+        vector_store: BaseVectorStore | None = None,
+    ) -> None:
+        """Initialize RAG client with OpenAI and vector store clients.
+
+        Without explicit clients, e.g. the local fakes of offline benchmarks, the
+        ones configured by the environment are used. The resources of the default
+        namespace are loaded now, and those of other namespaces on first use.
+        """
+        self.openai = openai if openai is not None else OpenAIClient()
+        self.vector_store = (
+            vector_store if vector_store is not None else self._build_vector_store()
+        )
+        self.context_assembler = ContextAssembler.from_env()
+        self.namespaces = NamespaceCache.from_env(NamespaceResources.from_env)
+        self.retrieval_batcher = RetrievalBatcher.from_env(self.get_contexts)
+        self.context_retrieval = ContextRetrieval.from_env(self.retrieve_context)
+        self.resources(DEFAULT_NAMESPACE)
+
+    @staticmethod
+    def _build_vector_store() -> BaseVectorStore:
+        """Build the vector store selected by the VECTOR_STORE environment variable.
+
+        `pinecone` (default) uses the Pinecone index. `local` uses an in-process
+        store persisted at LOCAL_VECTOR_STORE_PATH, with no external service, and
+        LOCAL_VECTOR_INDEX selects exact (`flat`) or approximate (`ivf`) search.
+        """
+        backend = os.getenv("VECTOR_STORE", "pinecone").lower()
+        if backend == "pinecone":
+            return PineconeClient()
+        if backend == "local":
+            dimension = os.getenv("PINECONE_INDEX_DIMS")
+            if not dimension:
+                msg = "PINECONE_INDEX_DIMS must be set in environment."
+                raise ValueError(msg)
+            nlist = os.getenv("IVF_NLIST")
+            return LocalVectorStore(
+                os.getenv("LOCAL_VECTOR_STORE_PATH", DEFAULT_LOCAL_VECTOR_STORE_PATH),
+                dimension=int(dimension),
+                index_type=os.getenv("LOCAL_VECTOR_INDEX", "flat").lower(),
+                nlist=int(nlist) if nlist else None,
+                nprobe=int(os.getenv("IVF_NPROBE", DEFAULT_IVF_NPROBE)),
+            )
+        msg = f"Unknown VECTOR_STORE '{backend}'."
+        raise ValueError(msg)
+
+    def resources(self, namespace: str = DEFAULT_NAMESPACE) -> NamespaceResources:
+        """Return the structured router, lexical index and answer cache of a namespace.
+
+        Raises ValueError if the namespace name is invalid.
+        """
+        return self.namespaces.get(validate_namespace(namespace))
+
+    def get_context_from_pinecone(
+        self,
+        query: str,
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> str:
+        """Retrieve relevant context from the vector store."""
+        return self.get_contexts([query], top_k=top_k, namespace=namespace)[0]
 
-    def get_context_from_pinecone(self, query: str, top_k: int = 3) -> str:
-        """Retrieve relevant context from Pinecone."""
-        embedding = self.openai.generate_embedding(query)
-        results = self.pinecone.query_index(embedding, top_k=top_k)
-        return " ".join([match.metadata["original_text"] for match in results])
+    def get_contexts(
+        self,
+        queries: list[str],
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> list[str]:
+        """Retrieve the context of several queries about one namespace at once.
+
+        The queries are embedded with one multi-input request, and the vector
+        store runs their queries as a batch. Both are timed as stages of the active
+        trace. With hybrid retrieval, queries naming entity IDs are answered from
+        the lexical index without embedding, and the others fuse the lexical and
+        vector rankings. The chunks of each query are assembled into a context
+        within the RAG_CONTEXT_MAX_TOKENS budget.
+        """
+        hybrid_retriever = self.resources(namespace).hybrid_retriever
+        chunks = [None] * len(queries)
+        if hybrid_retriever is not None:
+            for i, query in enumerate(queries):
+                chunks[i] = hybrid_retriever.exact_context(query, top_k)
+        pending = [i for i, texts in enumerate(chunks) if texts is None]
+
+        if pending:
+            with timed_stage("embedding"):
+                embeddings = self.openai.generate_embeddings(
+                    [queries[i] for i in pending],
+                )
+            candidates = top_k
+            if hybrid_retriever is not None:
+                candidates = max(top_k, hybrid_retriever.candidates)
+            with timed_stage("vector_query"):
+                results = self.vector_store.query_many(
+                    embeddings,
+                    top_k=candidates,
+                    namespace=namespace,
+                )
+            for i, matches in zip(pending, results, strict=True):
+                if hybrid_retriever is None:
+                    chunks[i] = [match.metadata["original_text"] for match in matches]
+                else:
+                    chunks[i] = hybrid_retriever.fuse(queries[i], matches, top_k)
+        return [self.context_assembler.assemble(texts) for texts in chunks]
+
+    def retrieve_context(
+        self,
+        query: str,
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> str:
+        """Retrieve the context of a query, batched with concurrent ones if enabled."""
+        if self.retrieval_batcher is None:
+            return self.get_context_from_pinecone(query, top_k, namespace)
+        return self.retrieval_batcher.submit(query, top_k, namespace).result()
 
-    def stream_rag_response(self, query: str, context: str) -> iter:
+    def stream_rag_response(
+        self,
+        query: str,
+        context: str,
+        max_tokens: int = DEFAULT_MAX_ANSWER_TOKENS,
+    ) -> iter:
         """Stream RAG-formatted response using OpenAI."""
-        system_prompt = f"You are a helpful assistant. Context: {context}"
         return self.openai.stream_chat_completion(
-            system_prompt=system_prompt,
+            system_prompt=self._rag_system_prompt(context, max_tokens),
+            user_query=query,
+            max_tokens=max_tokens,
+        )
+
+    def astream_rag_response(
+        self,
+        query: str,
+        context: str,
+        max_tokens: int = DEFAULT_MAX_ANSWER_TOKENS,
+    ) -> AsyncIterator[str]:
+        """Asynchronously stream RAG-formatted response using OpenAI."""
+        return self.openai.astream_chat_completion(
+            system_prompt=self._rag_system_prompt(context, max_tokens),
             user_query=query,
+            max_tokens=max_tokens,
+        )
+
+    @staticmethod
+    def _rag_system_prompt(context: str, max_tokens: int) -> str:
+        """Build the system prompt carrying the retrieved context.
+
+        The prompt states the length budget, so that answers end on a complete
+        sentence rather than being cut off at `max_tokens`.
+        """
+        return (
+            "You are a helpful assistant. Keep your answer under "
+            f"{max_tokens * 3 // 4} words and end it with a complete sentence.\n"
+            f"Context:\n{context}"
         )
@@ -0,0 +1,136 @@
+"""Assembly of retrieved chunks into a prompt context of bounded size."""
+
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_MAX_TOKENS = 1500
+# Encoding used when tiktoken does not know the chat model.
+DEFAULT_ENCODING = "o200k_base"
+# Characters per token assumed when tiktoken is not installed.
+CHARS_PER_TOKEN = 4
+# Chunks sharing at least this share of their word trigrams with a kept chunk add
+# nothing to it.
+MAX_OVERLAP = 0.8
+SHINGLE_SIZE = 3
+CHUNK_SEPARATOR = "\n\n"
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class TokenCounter:
+    """Counts tokens locally, as the chat model's tokenizer does.
+
+    Uses tiktoken when it is installed and its encoding can be loaded (it is
+    downloaded on first use, then cached), and estimates CHARS_PER_TOKEN characters
+    per token otherwise.
+    """
+
+    def __init__(self, model: str | None = None) -> None:
+        """Initialize a counter for the tokenizer of `model`."""
+        self.encoding = None
+        try:
+            import tiktoken  # noqa: PLC0415
+        except ImportError:
+            logger.info("tiktoken is not installed, estimating token counts.")
+            return
+        try:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model or "")
+            except KeyError:
+                self.encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+        except Exception:
+            logger.exception("Failed to load the tiktoken encoding, estimating instead.")
+
+    def count(self, text: str) -> int:
+        """Return the number of tokens of a text."""
+        if self.encoding is None:
+            return -(-len(text) // CHARS_PER_TOKEN)
+        return len(self.encoding.encode_ordinary(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Return the start of a text, up to `max_tokens` tokens."""
+        if self.encoding is None:
+            return text[: max_tokens * CHARS_PER_TOKEN]
+        return self.encoding.decode(self.encoding.encode_ordinary(text)[:max_tokens])
+
+
+class ContextAssembler:
+    """Builds the prompt context from retrieved chunks, within a token budget.
+
+    Chunks are taken best first. Duplicates, chunks contained in a kept chunk and
+    chunks mostly overlapping one are dropped, and chunks that no longer fit the
+    budget are skipped. The best chunk alone is truncated to the budget rather than
+    dropped.
+    """
+
+    def __init__(self, max_tokens: int, counter: TokenCounter) -> None:
+        """Initialize an assembler keeping contexts within `max_tokens` tokens."""
+        self.max_tokens = max_tokens
+        self.counter = counter
+        self._separator_tokens = counter.count(CHUNK_SEPARATOR)
+
+    @classmethod
+    def from_env(cls) -> "ContextAssembler":
+        """Build the assembler configured by RAG_CONTEXT_MAX_TOKENS and CHAT_MODEL."""
+        max_tokens = os.getenv("RAG_CONTEXT_MAX_TOKENS", DEFAULT_CONTEXT_MAX_TOKENS)
+        return cls(
+            max_tokens=int(max_tokens),
+            counter=TokenCounter(os.getenv("CHAT_MODEL")),
+        )
+
+    def assemble(self, chunks: list[str]) -> str:
+        """Join the chunks that fit the budget, given best first (by score)."""
+        kept = []
+        kept_shingles = []
+        used_tokens = 0
+        for chunk in chunks:
+            text = chunk.strip()
+            shingles = self._shingles(text)
+            if not text or self._is_redundant(text, shingles, kept, kept_shingles):
+                continue
+            tokens = self.counter.count(text)
+            if kept:
+                tokens += self._separator_tokens
+            if used_tokens + tokens > self.max_tokens:
+                if kept:
+                    continue
+                text = self.counter.truncate(text, self.max_tokens)
+                tokens = self.max_tokens
+            kept.append(text)
+            kept_shingles.append(shingles)
+            used_tokens += tokens
+
+        logger.debug(
+            "Assembled %d of %d chunks into a context of %d tokens.",
+            len(kept),
+            len(chunks),
+            used_tokens,
+        )
+        return CHUNK_SEPARATOR.join(kept)
+
+    @staticmethod
+    def _shingles(text: str) -> set[tuple[str, ...]]:
+        """Return the word trigrams of a text."""
+        words = WORD_PATTERN.findall(text.lower())
+        return {
+            tuple(words[i : i + SHINGLE_SIZE])
+            for i in range(max(1, len(words) - SHINGLE_SIZE + 1))
+        }
+
+    @staticmethod
+    def _is_redundant(
+        text: str,
+        shingles: set[tuple[str, ...]],
+        kept: list[str],
+        kept_shingles: list[set[tuple[str, ...]]],
+    ) -> bool:
+        """Return whether a chunk repeats, or mostly overlaps, a kept chunk."""
+        for kept_text, other_shingles in zip(kept, kept_shingles, strict=True):
+            if text in kept_text:
+                return True
+            if len(shingles & other_shingles) / len(shingles) >= MAX_OVERLAP:
+                return True
+        return False
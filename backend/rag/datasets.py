@@ -0,0 +1,218 @@
+"""Streaming readers and single-pass aggregations for employee datasets."""
+
+import itertools
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+EMPLOYEE_COLUMNS = ["Name", "Department", "Salary"]
+DEFAULT_BLOCK_SIZE = 10_000
+SUPPORTED_SUFFIXES = (".xlsx", ".xlsm", ".csv", ".parquet")
+
+
+def iter_dataset_blocks(
+    path: str | Path,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> Iterator[pd.DataFrame]:
+    """Read an employee dataset in blocks of at most `block_size` rows.
+
+    Excel workbooks are read with a read-only openpyxl worksheet, CSV files with a
+    chunked pandas reader and Parquet files by record batch, so only one block is
+    held in memory at a time.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix not in SUPPORTED_SUFFIXES:
+        msg = f"Unsupported dataset format '{suffix}'. Use one of {SUPPORTED_SUFFIXES}."
+        raise ValueError(msg)
+    if not path.exists():
+        msg = f"Dataset not found at {path}."
+        raise FileNotFoundError(msg)
+
+    if suffix == ".csv":
+        _check_columns(pd.read_csv(path, nrows=0).columns, path)
+        return pd.read_csv(path, usecols=EMPLOYEE_COLUMNS, chunksize=block_size)
+    if suffix == ".parquet":
+        return _iter_parquet_blocks(path, block_size)
+    return _iter_excel_blocks(path, block_size)
+
+
+def _check_columns(columns: Iterable, path: Path) -> None:
+    """Raise ValueError if a dataset header lacks any of the employee columns."""
+    missing = [column for column in EMPLOYEE_COLUMNS if column not in set(columns)]
+    if missing:
+        msg = f"Dataset {path} is missing required columns: {', '.join(missing)}."
+        raise ValueError(msg)
+
+
+def _iter_excel_blocks(path: Path, block_size: int) -> Iterator[pd.DataFrame]:
+    """Read an Excel workbook in blocks using a read-only worksheet.
+
+    The header is read and checked upfront, before the blocks are iterated.
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    header = next(rows, None)
+    try:
+        if header is not None:
+            _check_columns(header, path)
+    except ValueError:
+        workbook.close()
+        raise
+    return _excel_row_blocks(workbook, rows, header, block_size)
+
+
+def _excel_row_blocks(
+    workbook: Workbook,
+    rows: Iterator[tuple],
+    header: tuple | None,
+    block_size: int,
+) -> Iterator[pd.DataFrame]:
+    """Yield blocks of the worksheet rows after the header, then close the workbook."""
+    try:
+        if header is None:
+            return
+        for batch in itertools.batched(rows, block_size, strict=False):
+            block = pd.DataFrame(batch, columns=header)[EMPLOYEE_COLUMNS]
+            # Read-only worksheets can report trailing rows without any values.
+            yield block.dropna(how="all")
+    finally:
+        workbook.close()
+
+
+def _iter_parquet_blocks(path: Path, block_size: int) -> Iterator[pd.DataFrame]:
+    """Read a Parquet file in record batches, checking its schema upfront."""
+    try:
+        import pyarrow.parquet as pq  # noqa: PLC0415
+    except ImportError:
+        msg = "Reading Parquet datasets requires the 'pyarrow' package."
+        raise ValueError(msg) from None
+
+    parquet_file = pq.ParquetFile(path)
+    _check_columns(parquet_file.schema_arrow.names, path)
+    return (
+        batch.to_pandas()
+        for batch in parquet_file.iter_batches(
+            batch_size=block_size,
+            columns=EMPLOYEE_COLUMNS,
+        )
+    )
+
+
+def format_employee_records(block: pd.DataFrame) -> pd.Series:
+    """Format a block of employee rows into record texts with column operations."""
+    return (
+        "Employee Record: Name: "
+        + block["Name"].astype(str)
+        + ", Department: "
+        + block["Department"].astype(str)
+        + ", Salary: $"
+        + block["Salary"].astype(float).map("{:,.2f}".format)
+    )
+
+
+@dataclass
+class SalaryStats:
+    """Salary statistics for a group of employees."""
+
+    employee_count: int = 0
+    total_salary: float = 0.0
+    max_salary: float = -np.inf
+    max_employee: str | None = None
+    max_dept: str | None = None
+    max_position: int = -1
+    min_salary: float = np.inf
+    min_employee: str | None = None
+    min_dept: str | None = None
+    min_position: int = -1
+    salaries: list[np.ndarray] = field(default_factory=list, repr=False)
+
+    @property
+    def median_salary(self) -> float:
+        """Median of all salaries in the group."""
+        return float(np.median(np.concatenate(self.salaries)))
+
+    def merge(self, other: "SalaryStats") -> None:
+        """Merge statistics of another group into this one.
+
+        Ties keep the employee with the lowest row position, matching
+        `idxmax`/`idxmin` semantics.
+        """
+        self.employee_count += other.employee_count
+        self.total_salary += other.total_salary
+        self.salaries.extend(other.salaries)
+        if (other.max_salary, -other.max_position) > (
+            self.max_salary,
+            -self.max_position,
+        ) or self.max_position < 0:
+            self.max_salary = other.max_salary
+            self.max_employee = other.max_employee
+            self.max_dept = other.max_dept
+            self.max_position = other.max_position
+        if (other.min_salary, other.min_position) < (
+            self.min_salary,
+            self.min_position,
+        ) or self.min_position < 0:
+            self.min_salary = other.min_salary
+            self.min_employee = other.min_employee
+            self.min_dept = other.min_dept
+            self.min_position = other.min_position
+
+
+class SalaryStatsAccumulator:
+    """Accumulate overall and per-department salary statistics block by block.
+
+    Each block is reduced with a single group-by aggregation. Only the numeric
+    salaries are retained (for exact medians); names and record texts are not.
+    Rows without a department count towards the overall statistics only.
+    """
+
+    def __init__(self) -> None:
+        """Initialize an empty accumulator."""
+        self.departments: dict[str, SalaryStats] = {}
+        self.unassigned = SalaryStats()
+        self.row_count = 0
+
+    def update(self, block: pd.DataFrame) -> None:
+        """Fold a block of employee rows into the running statistics."""
+        if block.empty:
+            return
+        block = block.reset_index(drop=True)
+        offset = self.row_count
+        self.row_count += len(block)
+        salaries = block["Salary"].astype(float).to_numpy()
+        names = block["Name"].to_numpy()
+        grouped = block.groupby("Department", sort=False, dropna=False)["Salary"]
+        aggregates = grouped.agg(["count", "sum", "max", "min", "idxmax", "idxmin"])
+        positions = grouped.indices
+
+        for dept, row in aggregates.iterrows():
+            block_stats = SalaryStats(
+                employee_count=int(row["count"]),
+                total_salary=float(row["sum"]),
+                max_salary=float(row["max"]),
+                max_employee=names[int(row["idxmax"])],
+                max_dept=dept,
+                max_position=offset + int(row["idxmax"]),
+                min_salary=float(row["min"]),
+                min_employee=names[int(row["idxmin"])],
+                min_dept=dept,
+                min_position=offset + int(row["idxmin"]),
+                salaries=[salaries[positions[dept]]],
+            )
+            if pd.isna(dept):
+                self.unassigned.merge(block_stats)
+            else:
+                self.departments.setdefault(dept, SalaryStats()).merge(block_stats)
+
+    def overall(self) -> SalaryStats:
+        """Statistics across all employees, with or without a department."""
+        overall_stats = SalaryStats()
+        for dept_stats in [*self.departments.values(), self.unassigned]:
+            if dept_stats.employee_count:
+                overall_stats.merge(dept_stats)
+        return overall_stats
@@ -0,0 +1,222 @@
+"""Deterministic local stand-ins for the OpenAI and Pinecone clients.
+
+They serve offline benchmarks: no API budget is spent, and results do not depend
+on the network, so runs on different commits can be compared.
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+
+import numpy as np
+
+from rag.clients import OpenAIClient
+from rag.namespaces import DEFAULT_NAMESPACE
+from rag.transport import TransportSettings
+from rag.vector_stores import INITIAL_CAPACITY, BaseVectorStore, VectorMatch
+
+DEFAULT_FAKE_DIMENSION = 64
+DEFAULT_FAKE_ANSWER_TOKENS = 60
+
+
+class FakeOpenAIClient(OpenAIClient):
+    """OpenAI client answering locally, after configurable delays.
+
+    The embedding of a text is a unit vector seeded by its hash, so it is the same
+    in every run. Each embedding request takes `embedding_latency` seconds. Chat
+    completions stream `answer_tokens` tokens, the first after `first_token_latency`
+    seconds and the rest at `tokens_per_second` (0 for no delay).
+    """
+
+    def __init__(
+        self,
+        *,
+        dimension: int = DEFAULT_FAKE_DIMENSION,
+        embedding_latency: float = 0.0,
+        first_token_latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        answer_tokens: int = DEFAULT_FAKE_ANSWER_TOKENS,
+    ) -> None:
+        """Initialize a fake client, without an API key or embedding cache."""
+        self.api_key = None
+        self.transport = TransportSettings()
+        self.embedding_cache = None
+        self.dimension = dimension
+        self.embedding_latency = embedding_latency
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.stats = {"embedding_requests": 0, "embedded_texts": 0, "completions": 0}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _create_embeddings(self, texts: list[str], model_name: str) -> list[list[float]]:  # noqa: ARG002
+        """Return deterministic embeddings after the configured latency."""
+        with self._lock:
+            self.stats["embedding_requests"] += 1
+            self.stats["embedded_texts"] += len(texts)
+        time.sleep(self.embedding_latency)
+        return [self.embed(text).tolist() for text in texts]
+
+    def embed(self, text: str) -> np.ndarray:
+        """Return the embedding of a text."""
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+    def stream_chat_completion(
+        self,
+        system_prompt: str,  # noqa: ARG002
+        user_query: str,  # noqa: ARG002
+        model: str | None = None,  # noqa: ARG002
+        max_tokens: int = 100,
+    ) -> Iterator[str]:
+        """Stream a canned answer at the configured pace."""
+        with self._lock:
+            self.stats["completions"] += 1
+        time.sleep(self.first_token_latency)
+        for i in range(min(self.answer_tokens, max_tokens)):
+            if i and self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield self._token(i)
+
+    async def astream_chat_completion(
+        self,
+        system_prompt: str,  # noqa: ARG002
+        user_query: str,  # noqa: ARG002
+        model: str | None = None,  # noqa: ARG002
+        max_tokens: int = 100,
+    ) -> AsyncIterator[str]:
+        """Asynchronously stream a canned answer at the configured pace."""
+        with self._lock:
+            self.stats["completions"] += 1
+        await asyncio.sleep(self.first_token_latency)
+        for i in range(min(self.answer_tokens, max_tokens)):
+            if i and self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield self._token(i)
+
+    @staticmethod
+    def _token(i: int) -> str:
+        """Return the `i`-th token of the canned answer."""
+        return f"Token{i}" if i == 0 else f" token{i}"
+
+
+class FakePineconeClient(BaseVectorStore):
+    """In-memory vector index with the latencies of a remote one.
+
+    Queries score every vector exactly. Like Pinecone, batches of queries are run
+    as concurrent single queries, each taking `query_latency` seconds on top of
+    the search, and every upsert takes `upsert_latency` seconds. Each namespace is
+    an index of its own.
+    """
+
+    def __init__(
+        self,
+        dimension: int = DEFAULT_FAKE_DIMENSION,
+        query_latency: float = 0.0,
+        upsert_latency: float = 0.0,
+    ) -> None:
+        """Initialize an empty index of `dimension`-dimensional vectors."""
+        self.dimension = dimension
+        self.query_latency = query_latency
+        self.upsert_latency = upsert_latency
+        self._vectors = np.zeros((INITIAL_CAPACITY, dimension), dtype=np.float32)
+        self._alive = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self._ids = []
+        self._metadata = []
+        self._rows = {}
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    @property
+    def vector_count(self) -> int:
+        """Return the number of vectors stored in the default namespace."""
+        return len(self._rows)
+
+    def namespace(self, namespace: str) -> "FakePineconeClient":
+        """Return the index of a namespace, creating it on first use."""
+        if namespace == DEFAULT_NAMESPACE:
+            return self
+        with self._lock:
+            index = self._namespaces.get(namespace)
+            if index is None:
+                index = self._namespaces[namespace] = FakePineconeClient(
+                    self.dimension,
+                    self.query_latency,
+                    self.upsert_latency,
+                )
+            return index
+
+    def query_index(
+        self,
+        vector: list[float],
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> list[VectorMatch]:
+        """Return the `top_k` matches closest to `vector`, best first."""
+        if namespace != DEFAULT_NAMESPACE:
+            return self.namespace(namespace).query_index(vector, top_k)
+        time.sleep(self.query_latency)
+        query = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            size = len(self._ids)
+            scores = self._vectors[:size] @ query
+            scores[~self._alive[:size]] = -np.inf
+            top_k = min(top_k, size)
+            rows = np.argpartition(-scores, top_k - 1)[:top_k] if top_k else []
+            rows = sorted(rows, key=lambda row: -scores[row])
+            return [
+                VectorMatch(
+                    id=self._ids[row],
+                    score=float(scores[row]),
+                    metadata=self._metadata[row],
+                )
+                for row in rows
+                if self._alive[row]
+            ]
+
+    def upsert_vectors(self, vectors: list, namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """Insert or update `(id, values, metadata)` vectors."""
+        if namespace != DEFAULT_NAMESPACE:
+            return self.namespace(namespace).upsert_vectors(vectors)
+        time.sleep(self.upsert_latency)
+        with self._lock:
+            for vector_id, values, metadata in vectors:
+                row = self._rows.get(vector_id)
+                if row is None:
+                    row = self._rows[vector_id] = self._allocate_row(vector_id)
+                self._vectors[row] = values
+                self._alive[row] = True
+                self._metadata[row] = metadata
+        return {"upserted_count": len(vectors)}
+
+    def delete_vectors(self, ids: list[str], namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """Delete vectors by ID."""
+        if namespace != DEFAULT_NAMESPACE:
+            return self.namespace(namespace).delete_vectors(ids)
+        with self._lock:
+            for vector_id in ids:
+                row = self._rows.pop(vector_id, None)
+                if row is not None:
+                    self._alive[row] = False
+        return {}
+
+    def list_ids(self, prefix: str = "", namespace: str = DEFAULT_NAMESPACE) -> list[str]:
+        """Return the IDs of the vectors starting with `prefix`."""
+        if namespace != DEFAULT_NAMESPACE:
+            return self.namespace(namespace).list_ids(prefix)
+        with self._lock:
+            return [vector_id for vector_id in self._rows if vector_id.startswith(prefix)]
+
+    def _allocate_row(self, vector_id: str) -> int:
+        """Append a row, doubling the capacity when it is full."""
+        row = len(self._ids)
+        if row == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+            self._alive = np.concatenate([self._alive, np.zeros_like(self._alive)])
+        self._ids.append(vector_id)
+        self._metadata.append({})
+        return row
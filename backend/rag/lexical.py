@@ -0,0 +1,342 @@
+"""BM25 inverted index over the dataset chunks, fused with vector search results."""
+
+import itertools
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+
+from rag.namespaces import DEFAULT_NAMESPACE, namespace_path
+
+DEFAULT_LEXICAL_INDEX_PATH = Path(__file__).resolve().parent / "data" / "lexical_index.npz"
+DEFAULT_RRF_K = 60
+DEFAULT_HYBRID_CANDIDATES = 20
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms in more than this share of the chunks, e.g. "salary", barely affect the
+# ranking but cost a full pass over the postings, so queries skip them.
+MAX_DOCUMENT_FREQUENCY = 0.5
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Tokens mixing letters, digits or underscores, such as "employee_4521", name one
+# entity rather than a topic.
+ENTITY_TOKEN_PATTERN = re.compile(r"\b(?=\w*\d)(?=\w*[^\W\d])\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lower-cased word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalIndex:
+    """BM25 inverted index with array-backed postings.
+
+    Terms are sorted and encoded as bytes, and the postings of term `i` are the
+    slice `term_offsets[i]:term_offsets[i + 1]` of `postings` (chunk rows) and
+    `frequencies`. Chunk texts are stored concatenated, with offsets, so the index
+    can return a context without the vector store.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        terms: np.ndarray,
+        term_offsets: np.ndarray,
+        postings: np.ndarray,
+        frequencies: np.ndarray,
+        doc_ids: np.ndarray,
+        doc_lengths: np.ndarray,
+        text_data: np.ndarray,
+        text_offsets: np.ndarray,
+    ) -> None:
+        """Initialize an index from its arrays."""
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.text_data = text_data
+        self.text_offsets = text_offsets
+        self.average_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, documents: Iterable[tuple[str, str]]) -> "LexicalIndex":
+        """Build an index from `(id, text)` chunks."""
+        builder = LexicalIndexBuilder()
+        for doc_id, text in documents:
+            builder.add(doc_id, text)
+        return builder.build()
+
+    @classmethod
+    def load(cls, path: str | Path) -> "LexicalIndex":
+        """Load an index saved with `save`."""
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+    def save(self, path: str | Path) -> None:
+        """Atomically write the index to disk."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.stem}.tmp.npz")
+        np.savez(
+            tmp_path,
+            terms=self.terms,
+            term_offsets=self.term_offsets,
+            postings=self.postings,
+            frequencies=self.frequencies,
+            doc_ids=self.doc_ids,
+            doc_lengths=self.doc_lengths,
+            text_data=self.text_data,
+            text_offsets=self.text_offsets,
+        )
+        tmp_path.replace(path)
+
+    def __len__(self) -> int:
+        """Return the number of chunks."""
+        return len(self.doc_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Return the memory taken by the index arrays."""
+        return sum(
+            array.nbytes
+            for array in (
+                self.terms,
+                self.term_offsets,
+                self.postings,
+                self.frequencies,
+                self.doc_ids,
+                self.doc_lengths,
+                self.text_data,
+                self.text_offsets,
+            )
+        )
+
+    def __contains__(self, term: str) -> bool:
+        """Return whether a lower-cased term appears in any chunk."""
+        start, end = self._postings_range(term)
+        return end > start
+
+    def doc_id(self, row: int) -> str:
+        """Return the ID of a chunk."""
+        return self.doc_ids[row].decode()
+
+    def text(self, row: int) -> str:
+        """Return the text of a chunk."""
+        start, end = self.text_offsets[row : row + 2]
+        return self.text_data[start:end].tobytes().decode()
+
+    def search(self, query: str, top_k: int) -> list[int]:
+        """Return the rows of the `top_k` chunks with the highest BM25 score."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        max_postings = MAX_DOCUMENT_FREQUENCY * len(self)
+        for term in set(tokenize(query)):
+            start, end = self._postings_range(term)
+            if not 0 < end - start <= max_postings:
+                continue
+            rows = self.postings[start:end]
+            frequencies = self.frequencies[start:end]
+            idf = math.log(1 + (len(self) - (end - start) + 0.5) / (end - start + 0.5))
+            norms = BM25_K1 * (
+                1 - BM25_B + BM25_B * self.doc_lengths[rows] / self.average_length
+            )
+            scores[rows] += idf * frequencies * (BM25_K1 + 1) / (frequencies + norms)
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k)[:top_k]]
+        # Ties keep chunk order.
+        return candidates[np.argsort(-scores[candidates], kind="stable")].tolist()
+
+    def exact_matches(self, query: str, limit: int) -> list[int] | None:
+        """Return the chunks containing the entity IDs named in the query.
+
+        Returns None if the query names no entity, or if an entity appears in none
+        or more than `limit` of the chunks, so the match is not conclusive.
+        """
+        rows = set()
+        for term in set(ENTITY_TOKEN_PATTERN.findall(query.lower())):
+            start, end = self._postings_range(term)
+            if not 0 < end - start <= limit:
+                return None
+            rows.update(self.postings[start:end].tolist())
+        if not rows or len(rows) > limit:
+            return None
+        return sorted(rows)
+
+    def _postings_range(self, term: str) -> tuple[int, int]:
+        """Return the bounds of the postings of a term, empty if it is unknown."""
+        encoded = term.encode()
+        index = np.searchsorted(self.terms, encoded)
+        if index == len(self.terms) or self.terms[index] != encoded:
+            return 0, 0
+        return int(self.term_offsets[index]), int(self.term_offsets[index + 1])
+
+
+class LexicalIndexBuilder:
+    """Builds a `LexicalIndex` one chunk at a time.
+
+    The postings and text of each chunk are appended to compact typed arrays as the
+    chunk is added, so the chunks need not be kept until the index is built.
+    """
+
+    def __init__(self) -> None:
+        """Initialize a builder without chunks."""
+        self._term_ids = {}
+        self._posting_terms = array("q")
+        self._posting_docs = array("i")
+        self._posting_frequencies = array("f")
+        self._doc_ids = bytearray()
+        self._doc_id_offsets = array("q", [0])
+        self._doc_lengths = array("f")
+        self._text_data = bytearray()
+        self._text_offsets = array("q", [0])
+
+    def __len__(self) -> int:
+        """Return the number of chunks added."""
+        return len(self._doc_lengths)
+
+    def add(self, doc_id: str, text: str) -> None:
+        """Add a chunk to the index."""
+        tokens = tokenize(text)
+        row = len(self)
+        for term, frequency in Counter(tokens).items():
+            term_id = self._term_ids.setdefault(term, len(self._term_ids))
+            self._posting_terms.append(term_id)
+            self._posting_docs.append(row)
+            self._posting_frequencies.append(frequency)
+        self._doc_ids += doc_id.encode()
+        self._doc_id_offsets.append(len(self._doc_ids))
+        self._doc_lengths.append(len(tokens))
+        self._text_data += text.encode()
+        self._text_offsets.append(len(self._text_data))
+
+    def build(self) -> LexicalIndex:
+        """Return the index of the chunks added so far."""
+        # Renumber terms in sorted order, so they can be found with a binary search.
+        vocabulary = sorted(self._term_ids, key=str.encode)
+        sorted_ids = np.empty(len(vocabulary), dtype=np.int64)
+        sorted_ids[[self._term_ids[term] for term in vocabulary]] = np.arange(
+            len(vocabulary),
+        )
+        posting_terms = sorted_ids[np.array(self._posting_terms, dtype=np.int64)]
+        # A stable sort keeps the postings of each term in chunk order.
+        order = np.argsort(posting_terms, kind="stable")
+        term_offsets = np.searchsorted(
+            posting_terms[order],
+            np.arange(len(vocabulary) + 1),
+        )
+        doc_ids = [
+            bytes(self._doc_ids[start:end])
+            for start, end in itertools.pairwise(self._doc_id_offsets)
+        ]
+        return LexicalIndex(
+            terms=np.array([term.encode() for term in vocabulary], dtype=bytes),
+            term_offsets=term_offsets.astype(np.int64),
+            postings=np.array(self._posting_docs, dtype=np.int32)[order],
+            frequencies=np.array(self._posting_frequencies, dtype=np.float32)[order],
+            doc_ids=np.array(doc_ids, dtype=bytes),
+            doc_lengths=np.array(self._doc_lengths, dtype=np.float32),
+            text_data=np.frombuffer(bytes(self._text_data), dtype=np.uint8),
+            text_offsets=np.array(self._text_offsets, dtype=np.int64),
+        )
+
+
+class HybridRetriever:
+    """Combines BM25 ranking with vector search results.
+
+    Queries naming entity IDs found in only a few chunks are answered from the
+    index alone, with no embedding request or vector search. Otherwise, the BM25
+    and vector rankings are merged with reciprocal rank fusion (RRF), each chunk
+    scoring `1 / (rrf_k + rank)` per ranking it appears in.
+
+    The index is written by `embed_dataset`, loaded on startup and reloaded when
+    the file changes.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        rrf_k: int = DEFAULT_RRF_K,
+        candidates: int = DEFAULT_HYBRID_CANDIDATES,
+    ) -> None:
+        """Initialize a retriever over the index saved at `path`."""
+        self.path = Path(path)
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.index = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, namespace: str = DEFAULT_NAMESPACE) -> "HybridRetriever | None":
+        """Build the retriever of a namespace, configured by HYBRID_RETRIEVAL_*."""
+        if os.getenv("HYBRID_RETRIEVAL_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+        retriever = cls(
+            lexical_index_path(namespace),
+            rrf_k=int(os.getenv("HYBRID_RETRIEVAL_RRF_K", DEFAULT_RRF_K)),
+            candidates=int(
+                os.getenv("HYBRID_RETRIEVAL_CANDIDATES", DEFAULT_HYBRID_CANDIDATES),
+            ),
+        )
+        retriever.get_index()
+        return retriever
+
+    def get_index(self) -> LexicalIndex | None:
+        """Return the index, reloading it if `embed_dataset` wrote a new one."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                self.index = LexicalIndex.load(self.path)
+                self._mtime = mtime
+            return self.index
+
+    def exact_context(self, query: str, top_k: int) -> list[str] | None:
+        """Return the texts of the chunks matching the entities named in the query."""
+        index = self.get_index()
+        if index is None:
+            return None
+        rows = index.exact_matches(query, limit=top_k)
+        if rows is None:
+            return None
+        return [index.text(row) for row in rows]
+
+    def fuse(self, query: str, matches: list, top_k: int) -> list[str]:
+        """Merge vector `matches` with the BM25 ranking, returning the top texts."""
+        index = self.get_index()
+        if index is None:
+            return [match.metadata["original_text"] for match in matches[:top_k]]
+
+        scores = Counter()
+        texts = {}
+        for rank, match in enumerate(matches):
+            scores[match.id] += 1 / (self.rrf_k + rank + 1)
+            texts[match.id] = match.metadata["original_text"]
+        for rank, row in enumerate(index.search(query, self.candidates)):
+            doc_id = index.doc_id(row)
+            scores[doc_id] += 1 / (self.rrf_k + rank + 1)
+            if doc_id not in texts:
+                texts[doc_id] = index.text(row)
+        return [texts[doc_id] for doc_id, _ in scores.most_common(top_k)]
+
+
+def lexical_index_path(namespace: str = DEFAULT_NAMESPACE) -> Path:
+    """Return the path of a namespace's lexical index.
+
+    The index of the default namespace is at LEXICAL_INDEX_PATH.
+    """
+    return namespace_path(
+        os.getenv("LEXICAL_INDEX_PATH", DEFAULT_LEXICAL_INDEX_PATH),
+        namespace,
+    )
@@ -0,0 +1,102 @@
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandParser
+
+from rag.batching import DEFAULT_MAX_BATCH_SIZE, RetrievalBatcher
+
+DEFAULT_WINDOWS = "0,2,5,10,20"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks retrieval throughput and latency of concurrent queries, "
+        "unbatched and with micro-batching windows."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add command arguments."""
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=32,
+            help="Number of queries in flight at once.",
+        )
+        parser.add_argument(
+            "--windows",
+            default=DEFAULT_WINDOWS,
+            help="Comma-separated batch windows in ms. 0 retrieves every query "
+            "on its own.",
+        )
+        parser.add_argument(
+            "--max-batch-size",
+            type=int,
+            default=DEFAULT_MAX_BATCH_SIZE,
+        )
+        parser.add_argument("--top-k", type=int, default=3)
+
+    def handle(self, *args, **kwargs) -> None:  # noqa: ARG002
+        """Handle the command."""
+        rag_client = apps.get_app_config("rag").rag_client
+        top_k = kwargs["top_k"]
+
+        self.stdout.write(
+            f"{'window ms':>10} {'queries/s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+            f"{'mean batch':>11} {'embedding requests':>19}",
+        )
+        for window_ms in [float(window) for window in kwargs["windows"].split(",")]:
+            # Fresh query texts per run, so embeddings are never served from cache.
+            run_id = uuid.uuid4().hex[:8]
+            queries = [
+                f"What is the salary of employee_{i}? ({run_id})"
+                for i in range(kwargs["queries"])
+            ]
+            if window_ms > 0:
+                batcher = RetrievalBatcher(
+                    rag_client.get_contexts,
+                    window=window_ms / 1000,
+                    max_batch_size=kwargs["max_batch_size"],
+                )
+
+                def retrieve(query: str, batcher: RetrievalBatcher = batcher) -> str:
+                    return batcher.submit(query, top_k).result()
+            else:
+                batcher = None
+
+                def retrieve(query: str) -> str:
+                    return rag_client.get_context_from_pinecone(query, top_k)
+
+            elapsed, latencies = self.run_queries(
+                retrieve,
+                queries,
+                kwargs["concurrency"],
+            )
+            requests = batcher.stats["batches"] if batcher else len(queries)
+            p50, p99 = np.percentile(latencies, [50, 99])
+            self.stdout.write(
+                f"{window_ms:>10g} {len(queries) / elapsed:>10.1f} {p50:>8.1f} "
+                f"{p99:>8.1f} {len(queries) / requests:>11.1f} {requests:>19}",
+            )
+
+    def run_queries(
+        self,
+        retrieve: Callable[[str], str],
+        queries: list[str],
+        concurrency: int,
+    ) -> tuple[float, list[float]]:
+        """Retrieve all queries from `concurrency` threads and time each one."""
+
+        def timed(query: str) -> float:
+            started_at = time.perf_counter()
+            retrieve(query)
+            return (time.perf_counter() - started_at) * 1000
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(timed, queries))
+        return time.perf_counter() - started_at, latencies
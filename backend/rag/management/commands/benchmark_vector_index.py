@@ -0,0 +1,161 @@
+import tempfile
+import time
+
+import numpy as np
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from rag.vector_stores import IVFIndex, LocalVectorStore
+
+DEFAULT_NPROBES = "1,2,4,8,16,32"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks recall@k and latency of the IVF index against exact search "
+        "on the local vector store."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add command arguments."""
+        parser.add_argument(
+            "--synthetic",
+            type=int,
+            default=0,
+            help="Benchmark on this many synthetic clustered vectors instead of "
+            "the configured local vector store.",
+        )
+        parser.add_argument(
+            "--dimension",
+            type=int,
+            default=1536,
+            help="Dimension of the synthetic vectors.",
+        )
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--top-k", type=int, default=10)
+        parser.add_argument(
+            "--nlist",
+            type=int,
+            help="Number of IVF partitions. Defaults to 4 * sqrt(vector count).",
+        )
+        parser.add_argument(
+            "--nprobe",
+            default=DEFAULT_NPROBES,
+            help="Comma-separated nprobe values to benchmark.",
+        )
+        parser.add_argument(
+            "--noise",
+            type=float,
+            default=0.05,
+            help="Gaussian noise added to stored vectors to form the queries.",
+        )
+
+    def handle(self, *args, **kwargs) -> None:  # noqa: ARG002
+        """Handle the command."""
+        top_k = kwargs["top_k"]
+        nprobes = [int(nprobe) for nprobe in kwargs["nprobe"].split(",")]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            if kwargs["synthetic"]:
+                store = self.build_synthetic_store(
+                    tmp_dir,
+                    kwargs["synthetic"],
+                    kwargs["dimension"],
+                )
+            else:
+                store = apps.get_app_config("rag").rag_client.vector_store
+                if not isinstance(store, LocalVectorStore):
+                    msg = "Set VECTOR_STORE=local or pass --synthetic to benchmark."
+                    raise CommandError(msg)
+            if store.vector_count < top_k:
+                msg = f"The store holds {store.vector_count} vectors, fewer than top-k."
+                raise CommandError(msg)
+
+            queries = self.sample_queries(store, kwargs["queries"], kwargs["noise"])
+
+            # Train in memory only, so the configured store is left untouched.
+            store.ivf = IVFIndex(nlist=kwargs["nlist"])
+            started_at = time.perf_counter()
+            store.train_index()
+            elapsed = time.perf_counter() - started_at
+            self.stdout.write(
+                f"Trained {len(store.ivf.centroids)} partitions over "
+                f"{store.vector_count} vectors in {elapsed:.2f}s.",
+            )
+
+            exact_ids, exact_latencies = self.run_queries(
+                store,
+                queries,
+                top_k,
+                exact=True,
+            )
+            self.stdout.write(
+                f"{'search':>12} {'recall@' + str(top_k):>10} {'p50 ms':>8} {'p99 ms':>8}",
+            )
+            self.write_row("exact", 1.0, exact_latencies)
+            for nprobe in nprobes:
+                store.ivf.nprobe = nprobe
+                ann_ids, ann_latencies = self.run_queries(store, queries, top_k)
+                recall = np.mean(
+                    [
+                        len(set(ann) & set(exact)) / top_k
+                        for ann, exact in zip(ann_ids, exact_ids, strict=True)
+                    ],
+                )
+                self.write_row(f"ivf/{nprobe}", recall, ann_latencies)
+
+    def build_synthetic_store(
+        self,
+        path: str,
+        vector_count: int,
+        dimension: int,
+    ) -> LocalVectorStore:
+        """Build a store of clustered random vectors."""
+        rng = np.random.default_rng(0)
+        store = LocalVectorStore(path, dimension=dimension)
+        centers = rng.normal(size=(max(1, vector_count // 100), dimension))
+        for start in range(0, vector_count, 10_000):
+            count = min(10_000, vector_count - start)
+            vectors = centers[rng.integers(len(centers), size=count)]
+            vectors = vectors + 0.5 * rng.normal(size=(count, dimension))
+            store.upsert_vectors(
+                [
+                    (f"vec-{start + i}", vector, {})
+                    for i, vector in enumerate(vectors.astype(np.float32))
+                ],
+            )
+        return store
+
+    def sample_queries(
+        self,
+        store: LocalVectorStore,
+        query_count: int,
+        noise: float,
+    ) -> np.ndarray:
+        """Sample stored vectors and perturb them to form queries."""
+        rng = np.random.default_rng(1)
+        vectors = store.sample_vectors(query_count, seed=1)
+        return vectors + noise * rng.normal(size=vectors.shape) / np.sqrt(store.dimension)
+
+    def run_queries(
+        self,
+        store: LocalVectorStore,
+        queries: np.ndarray,
+        top_k: int,
+        *,
+        exact: bool = False,
+    ) -> tuple[list[list[str]], list[float]]:
+        """Run queries one at a time, as the chat path does, and time each."""
+        ids = []
+        latencies = []
+        for query in queries:
+            started_at = time.perf_counter()
+            matches = store.query_many([query], top_k=top_k, exact=exact)[0]
+            latencies.append((time.perf_counter() - started_at) * 1000)
+            ids.append([match.id for match in matches])
+        return ids, latencies
+
+    def write_row(self, name: str, recall: float, latencies: list[float]) -> None:
+        """Write one row of the results table."""
+        p50, p99 = np.percentile(latencies, [50, 99])
+        self.stdout.write(f"{name:>12} {recall:>10.3f} {p50:>8.2f} {p99:>8.2f}")
@@ -0,0 +1,17 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the vector index if it does not exist. Run once per environment, "
+        "before embedding the dataset or serving requests."
+    )
+
+    def handle(self, *args, **kwargs) -> None:  # noqa: ARG002
+        """Handle the command."""
+        vector_store = apps.get_app_config("rag").rag_client.vector_store
+        if vector_store.create_index():
+            self.stdout.write("Created the vector index.")
+        else:
+            self.stdout.write("The vector index already exists or needs no bootstrap.")
@@ -1,13 +1,44 @@
+import hashlib
+import itertools
 import logging
 import os
+import random
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 import pandas as pd
 from django.apps import apps
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from rag.cache import ResponseCache
+from rag.datasets import (
+    DEFAULT_BLOCK_SIZE,
+    SalaryStatsAccumulator,
+    format_employee_records,
+    iter_dataset_blocks,
+)
+from rag.lexical import LexicalIndexBuilder, lexical_index_path
+from rag.manifest import EmbeddingManifest, content_hash
+from rag.namespaces import DEFAULT_NAMESPACE, validate_namespace
+from rag.structured import EmployeeTableBuilder, employee_table_path
+
+DEFAULT_EMBEDDING_BATCH_SIZE = 256
+DEFAULT_UPSERT_BATCH_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 5
+DELETE_BATCH_SIZE = 1000
+RETRY_BASE_DELAY_SECONDS = 0.5
+# Prefix of the IDs of the vectors written by this command.
+VECTOR_ID_PREFIX = "row-"
 
 
 class Command(BaseCommand):
-    help = "Chunks the fake employee dataset and embeds it into Pinecone for RAG queries."
+    help = (
+        "Chunks the fake employee dataset and embeds it into the vector store "
+        "for RAG queries."
+    )
 
     def __init__(self) -> None:
         """Initialize the command."""
@@ -15,112 +46,495 @@ class Command(BaseCommand):
         self.logger = logging.getLogger(__name__)
 
         self.rag_app_config = apps.get_app_config("rag")
+        self.namespace = DEFAULT_NAMESPACE
 
-        if not self.rag_app_config.rag_client:
-            msg = "RAG client not initialized."
-            raise CommandError(msg)
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add command arguments."""
+        parser.add_argument(
+            "--dataset",
+            help="Path to an .xlsx, .csv or .parquet dataset. "
+            "Defaults to the bundled fake employee dataset.",
+        )
+        parser.add_argument(
+            "--namespace",
+            default=DEFAULT_NAMESPACE,
+            help="Namespace the dataset is indexed in, e.g. one per customer. "
+            "Chats bound to the namespace only retrieve from this dataset. "
+            "Defaults to the default namespace.",
+        )
+        parser.add_argument(
+            "--block-size",
+            type=int,
+            default=DEFAULT_BLOCK_SIZE,
+            help="Number of dataset rows read and chunked at a time.",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Embed only new or changed chunks and delete vectors of removed rows.",
+        )
+        parser.add_argument(
+            "--manifest",
+            help="Path to the chunk manifest. Defaults to <dataset>.manifest.json, "
+            "or <dataset>.<namespace>.manifest.json outside the default namespace.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_EMBEDDING_BATCH_SIZE,
+            help="Number of chunks sent in a single embedding request.",
+        )
+        parser.add_argument(
+            "--upsert-batch-size",
+            type=int,
+            default=DEFAULT_UPSERT_BATCH_SIZE,
+            help="Number of vectors sent in a single upsert request.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=DEFAULT_CONCURRENCY,
+            help="Number of embedding (and upsert) requests in flight at once.",
+        )
+        parser.add_argument(
+            "--max-retries",
+            type=int,
+            default=DEFAULT_MAX_RETRIES,
+            help="Retries with exponential backoff for each failed batch.",
+        )
 
     def handle(self, *args, **kwargs) -> None:  # noqa: ARG002
         """Handle the command."""
-        employee_data_path = f"{self.rag_app_config.path}/data/Fake_Employee_Data.xlsx"
+        batch_size = kwargs["batch_size"]
+        concurrency = kwargs["concurrency"]
+        if min(batch_size, kwargs["upsert_batch_size"], kwargs["block_size"]) < 1 or (
+            concurrency < 1
+        ):
+            msg = "Batch sizes and concurrency must be positive integers."
+            raise CommandError(msg)
+        try:
+            self.namespace = validate_namespace(kwargs["namespace"])
+        except ValueError as e:
+            raise CommandError(str(e)) from None
+
+        dataset_path = (
+            kwargs["dataset"] or f"{self.rag_app_config.path}/data/Fake_Employee_Data.xlsx"
+        )
 
         try:
-            employee_data = pd.read_excel(employee_data_path, engine="openpyxl")
-        except FileNotFoundError:
-            msg = f"Dataset not found at {employee_data_path}."
-            raise CommandError(msg) from None
+            blocks = iter_dataset_blocks(dataset_path, block_size=kwargs["block_size"])
+        except (FileNotFoundError, ValueError) as e:
+            raise CommandError(str(e)) from None
+
+        suffix = f".{self.namespace}" if self.namespace else ""
+        manifest = EmbeddingManifest.load(
+            kwargs["manifest"] or f"{dataset_path}{suffix}.manifest.json",
+        )
+        incremental = kwargs["incremental"]
+
+        if self.rag_app_config.rag_client.vector_store.create_index():
+            self.logger.info("Created the vector index.")
 
-        self.logger.info("Loaded dataset with %d rows.", len(employee_data))
+        self.logger.info(
+            "Streaming dataset from %s into namespace '%s'.",
+            dataset_path,
+            self.namespace,
+        )
+        chunk_hashes = {}
+        data_chunks = self.track_chunk_changes(
+            self.chunk_rows_into_text(blocks),
+            manifest,
+            chunk_hashes,
+            changed_only=incremental,
+        )
+
+        started_at = time.perf_counter()
+        upserted_ids = self.embed_and_upsert(
+            data_chunks,
+            batch_size=batch_size,
+            upsert_batch_size=kwargs["upsert_batch_size"],
+            concurrency=concurrency,
+            max_retries=kwargs["max_retries"],
+        )
+        removed_ids = self.find_removed_ids(manifest, chunk_hashes, full=not incremental)
+        deleted_ids = self.delete_vectors(removed_ids, kwargs["max_retries"])
+        self.rag_app_config.rag_client.vector_store.flush()
+        elapsed = time.perf_counter() - started_at
 
-        data_chunks = self.chunk_rows_into_text(employee_data)
-        self.logger.info("Generated %d text chunks from the dataset.", len(data_chunks))
+        self.update_manifest(manifest, chunk_hashes, upserted_ids, deleted_ids)
+        table_path = employee_table_path(self.namespace)
+        self.employee_table.build().save(table_path)
+        self.logger.info("Saved the employee table for structured queries: %s", table_path)
+        index_path = lexical_index_path(self.namespace)
+        self.lexical_index.build().save(index_path)
+        self.logger.info("Saved the lexical index for hybrid retrieval: %s", index_path)
+        response_cache = ResponseCache.from_env(self.namespace)
+        if response_cache is not None:
+            response_cache.invalidate(manifest.dataset_version)
 
-        self.embed_and_upsert(data_chunks)
         self.logger.info(
-            "Dataset has been successfully embedded and upserted to Pinecone.",
+            "Generated %d text chunks from %d dataset rows.",
+            self.chunk_count,
+            self.row_count,
+        )
+        if incremental:
+            self.logger.info(
+                "Incremental run: %d new or changed chunks, %d removed, %d unchanged.",
+                self.changed_count,
+                len(deleted_ids),
+                self.chunk_count - self.changed_count,
+            )
+        else:
+            self.logger.info("Deleted %d stale vectors.", len(deleted_ids))
+        self.logger.info(
+            "Upserted %d/%d chunks in %.2fs "
+            "(batch size: %d, concurrency: %d, throughput: %.1f rows/s).",
+            len(upserted_ids),
+            self.changed_count,
+            elapsed,
+            batch_size,
+            concurrency,
+            len(upserted_ids) / elapsed if elapsed else 0.0,
+        )
+        embedding_cache = self.rag_app_config.rag_client.openai.embedding_cache
+        if embedding_cache is not None:
+            self.logger.info("Embedding cache: %s.", embedding_cache.stats)
+        self.report_failures(
+            failed_count=self.changed_count - len(upserted_ids),
+            skipped_count=len(removed_ids) - len(deleted_ids),
         )
 
-    def chunk_rows_into_text(self, df: pd.DataFrame) -> list:
-        """Chunk rows into text (document)."""
-        chunks = []
+    def report_failures(self, failed_count: int, skipped_count: int) -> None:
+        """Fail the command if chunks were not upserted or vectors not deleted.
 
-        # Individual employee data
-        for idx, row in df.iterrows():
-            text = (
-                f"Employee Record: Name: {row['Name']}, "
-                f"Department: {row['Department']}, "
-                f"Salary: ${row['Salary']:,.2f}"
+        The manifest keeps the previous state of those chunks, so the next
+        incremental run retries them.
+        """
+        if not failed_count and not skipped_count:
+            self.logger.info(
+                "Dataset has been successfully embedded and upserted to the vector store.",
             )
-            chunks.append((f"emp-{idx}", text))
-
-        # Overall data statistics
-        overall_stats = {
-            "median_salary": df["Salary"].median(),
-            "max_salary": df["Salary"].max(),
-            "max_employee": df.loc[df["Salary"].idxmax(), "Name"],
-            "max_dept": df.loc[df["Salary"].idxmax(), "Department"],
-            "min_salary": df["Salary"].min(),
-            "min_employee": df.loc[df["Salary"].idxmin(), "Name"],
-            "min_dept": df.loc[df["Salary"].idxmin(), "Department"],
-            "total_employees": len(df),
-            "total_salary": df["Salary"].sum(),
-        }
+            return
+        msg = (
+            f"{failed_count} chunks failed to embed or upsert and {skipped_count} "
+            "vector deletions were skipped after retries. Run again with "
+            "--incremental to retry them."
+        )
+        raise CommandError(msg)
+
+    def chunk_rows_into_text(self, blocks: Iterable[pd.DataFrame]) -> Iterator[tuple]:
+        """Chunk rows into text (document).
+
+        Employee records are yielded block by block as they are read, and the overall
+        and department statistics are yielded once every block has been aggregated.
+        """
+        self.row_count = 0
+        self.chunk_count = 0
+        stats = SalaryStatsAccumulator()
+        name_occurrences = Counter()
+        self.employee_table = EmployeeTableBuilder()
+
+        # Individual employee data
+        for block in blocks:
+            texts = format_employee_records(block)
+            for name, text in zip(block["Name"].astype(str), texts, strict=True):
+                name_occurrences[name] += 1
+                yield self.employee_chunk_id(name, name_occurrences[name]), text
+            self.row_count += len(block)
+            self.chunk_count += len(block)
+            stats.update(block)
+            self.employee_table.add(block)
+
+        if not stats.row_count:
+            return
 
         # Overall data statistics chunk
+        overall_stats = stats.overall()
         overall_text = (
             "Overall Data Statistics:\n"
-            f"Overall Median Salary: ${overall_stats['median_salary']:,.2f}\n"
-            f"Overall Maximum Salary: ${overall_stats['max_salary']:,.2f} "
-            f"(Employee: {overall_stats['max_employee']}, "
-            f"Dept: {overall_stats['max_dept']})\n"
-            f"Overall Minimum Salary: ${overall_stats['min_salary']:,.2f} "
-            f"(Employee: {overall_stats['min_employee']}, "
-            f"Dept: {overall_stats['min_dept']})\n"
-            f"Overall Total Employees: {overall_stats['total_employees']}\n"
-            f"Overall Total Salary: ${overall_stats['total_salary']:,.2f}"
-        )
-        chunks.append(("overall-data-stats", overall_text))
+            f"Overall Median Salary: ${overall_stats.median_salary:,.2f}\n"
+            f"Overall Maximum Salary: ${overall_stats.max_salary:,.2f} "
+            f"(Employee: {overall_stats.max_employee}, "
+            f"Dept: {overall_stats.max_dept})\n"
+            f"Overall Minimum Salary: ${overall_stats.min_salary:,.2f} "
+            f"(Employee: {overall_stats.min_employee}, "
+            f"Dept: {overall_stats.min_dept})\n"
+            f"Overall Total Employees: {overall_stats.employee_count}\n"
+            f"Overall Total Salary: ${overall_stats.total_salary:,.2f}"
+        )
+        self.chunk_count += 1
+        yield "overall-data-stats", overall_text
 
         # Department-wise statistics
-        dept_groups = df.groupby("Department")
-        for dept, group in dept_groups:
-            dept_stats = {
-                "median_salary": group["Salary"].median(),
-                "max_salary": group["Salary"].max(),
-                "max_employee": group.loc[group["Salary"].idxmax(), "Name"],
-                "min_salary": group["Salary"].min(),
-                "min_employee": group.loc[group["Salary"].idxmin(), "Name"],
-                "employee_count": len(group),
-                "total_salary": group["Salary"].sum(),
-            }
-
+        for dept in sorted(stats.departments):
+            dept_stats = stats.departments[dept]
             dept_text = (
                 f"Department Statistics ({dept}):\n"
-                f"Department Median Salary: ${dept_stats['median_salary']:,.2f}\n"
-                f"Department Max Salary: ${dept_stats['max_salary']:,.2f} "
-                f"(Employee: {dept_stats['max_employee']})\n"
-                f"Department Min Salary: ${dept_stats['min_salary']:,.2f} "
-                f"(Employee: {dept_stats['min_employee']})\n"
-                f"Department Total Employees: {dept_stats['employee_count']}\n"
-                f"Department Total Salary: ${dept_stats['total_salary']:,.2f}"
+                f"Department Median Salary: ${dept_stats.median_salary:,.2f}\n"
+                f"Department Max Salary: ${dept_stats.max_salary:,.2f} "
+                f"(Employee: {dept_stats.max_employee})\n"
+                f"Department Min Salary: ${dept_stats.min_salary:,.2f} "
+                f"(Employee: {dept_stats.min_employee})\n"
+                f"Department Total Employees: {dept_stats.employee_count}\n"
+                f"Department Total Salary: ${dept_stats.total_salary:,.2f}"
             )
-            chunks.append((f"dept-data-stats-{dept}", dept_text))
+            self.chunk_count += 1
+            yield f"dept-data-stats-{dept}", dept_text
+
+    @staticmethod
+    def employee_chunk_id(name: str, occurrence: int = 1) -> str:
+        """Return a stable chunk ID for an employee, independent of row position.
 
-        return chunks
+        Repeated names are told apart by their occurrence count in the dataset.
+        """
+        digest = hashlib.sha256(name.encode()).hexdigest()[:16]
+        return f"emp-{digest}" if occurrence == 1 else f"emp-{digest}-{occurrence}"
 
-    def embed_and_upsert(self, data_chunks: list) -> None:
-        """Embed and upsert data chunks to Pinecone."""
-        vectors_to_upsert = []
+    @staticmethod
+    def vector_id(chunk_id: str) -> str:
+        """Return the vector ID under which a chunk is stored in the index."""
+        return f"{VECTOR_ID_PREFIX}{chunk_id}"
+
+    def track_chunk_changes(
+        self,
+        data_chunks: Iterable[tuple],
+        manifest: EmbeddingManifest,
+        chunk_hashes: dict[str, str],
+        *,
+        changed_only: bool = False,
+    ) -> Iterator[tuple]:
+        """Record the content hash of every chunk, optionally skipping unchanged ones.
+
+        `chunk_hashes` is filled with the hash of each chunk by vector ID, and every
+        chunk is added to the lexical index. With `changed_only`, chunks whose hash
+        matches the manifest are not yielded. The department statistics are always
+        aggregated, but only the groups whose statistics text changed are re-embedded.
+        """
+        self.changed_count = 0
+        self.lexical_index = LexicalIndexBuilder()
         for row_id, text_chunk in data_chunks:
+            vector_id = self.vector_id(row_id)
+            chunk_hash = content_hash(text_chunk)
+            chunk_hashes[vector_id] = chunk_hash
+            self.lexical_index.add(vector_id, text_chunk)
+            if changed_only and manifest.hashes.get(vector_id) == chunk_hash:
+                continue
+            self.changed_count += 1
+            yield row_id, text_chunk
+
+    def find_removed_ids(
+        self,
+        manifest: EmbeddingManifest,
+        chunk_hashes: dict[str, str],
+        *,
+        full: bool,
+    ) -> list[str]:
+        """Return the IDs of the vectors whose chunks are no longer in the dataset.
+
+        Incremental runs compare against the manifest. Full runs also list the
+        vectors of this command in the store, so they delete vectors the manifest
+        does not know about, such as those of the `row-emp-<row>` IDs of earlier
+        versions or of a lost manifest.
+        """
+        stale_ids = set(manifest.hashes)
+        if full:
             try:
-                embedding = self.rag_app_config.rag_client.openai.generate_embedding(
-                    text_chunk,
-                    model=os.getenv("EMBEDDING_MODEL"),
+                stale_ids.update(
+                    self.rag_app_config.rag_client.vector_store.list_ids(
+                        prefix=VECTOR_ID_PREFIX,
+                        namespace=self.namespace,
+                    ),
                 )
-                metadata = {"original_text": text_chunk}
-                vectors_to_upsert.append((f"row-{row_id}", embedding, metadata))
-            except Exception as e:
-                self.logger.exception("Skipping row %s due to error: %s", row_id, str(e))
+            except Exception:
+                self.logger.warning(
+                    "Could not list the vectors of the store; only deleting the "
+                    "removed chunks recorded in the manifest.",
+                    exc_info=True,
+                )
+        return sorted(stale_ids.difference(chunk_hashes))
+
+    def delete_vectors(self, vector_ids: list[str], max_retries: int) -> list[str]:
+        """Delete vectors in batches, returning the IDs that were deleted."""
+        deleted_ids = []
+        for batch in itertools.batched(vector_ids, DELETE_BATCH_SIZE, strict=False):
+            try:
+                self._with_retries(
+                    self.rag_app_config.rag_client.vector_store.delete_vectors,
+                    list(batch),
+                    namespace=self.namespace,
+                    max_retries=max_retries,
+                )
+            except Exception:
+                self.logger.exception(
+                    "Skipping deletion of %d vectors due to error.",
+                    len(batch),
+                )
+                continue
+            deleted_ids.extend(batch)
+        return deleted_ids
+
+    def update_manifest(
+        self,
+        manifest: EmbeddingManifest,
+        chunk_hashes: dict[str, str],
+        upserted_ids: list[str],
+        deleted_ids: list[str],
+    ) -> None:
+        """Record the chunks that are now in the index and save the manifest.
+
+        Chunks that failed to upsert keep their previous hash (if any), so they are
+        retried by the next incremental run.
+        """
+        upserted_ids = set(upserted_ids)
+        for vector_id, chunk_hash in chunk_hashes.items():
+            if vector_id in upserted_ids:
+                manifest.hashes[vector_id] = chunk_hash
+        for vector_id in deleted_ids:
+            manifest.hashes.pop(vector_id, None)
+        manifest.save()
+        self.logger.info(
+            "Saved manifest with %d chunks (dataset version %s) to %s.",
+            len(manifest.hashes),
+            manifest.dataset_version,
+            manifest.path,
+        )
+
+    def embed_and_upsert(
+        self,
+        data_chunks: Iterable,
+        *,
+        batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+        upsert_batch_size: int = DEFAULT_UPSERT_BATCH_SIZE,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ) -> list[str]:
+        """Embed and upsert data chunks to the vector store.
+
+        Chunks are embedded with multi-input requests by a bounded pool of workers.
+        Vectors are upserted in fixed-size batches as soon as they are available, so
+        upserts overlap with the embedding of later batches. Returns the IDs of the
+        upserted vectors.
+        """
+        pending_vectors = []
+        upserted_ids = []
+
+        with (
+            ThreadPoolExecutor(max_workers=concurrency) as embed_pool,
+            ThreadPoolExecutor(max_workers=concurrency) as upsert_pool,
+        ):
+            embed_futures: set[Future] = set()
+            upsert_futures: set[Future] = set()
+
+            def collect_embeddings(futures: set[Future]) -> None:
+                for future in futures:
+                    embed_futures.discard(future)
+                    pending_vectors.extend(future.result())
+                while len(pending_vectors) >= upsert_batch_size:
+                    submit_upsert(pending_vectors[:upsert_batch_size])
+                    del pending_vectors[:upsert_batch_size]
+
+            def submit_upsert(vectors: list) -> None:
+                if len(upsert_futures) >= concurrency:
+                    done, _ = wait(upsert_futures, return_when=FIRST_COMPLETED)
+                    upserted_ids.extend(self._collect_upserts(done, upsert_futures))
+                upsert_futures.add(
+                    upsert_pool.submit(self._upsert_batch, vectors, max_retries),
+                )
+
+            for batch in itertools.batched(data_chunks, batch_size, strict=False):
+                if len(embed_futures) >= concurrency:
+                    done, _ = wait(embed_futures, return_when=FIRST_COMPLETED)
+                    collect_embeddings(done)
+                embed_futures.add(
+                    embed_pool.submit(self._embed_batch, batch, max_retries),
+                )
+
+            collect_embeddings(set(embed_futures))
+            if pending_vectors:
+                submit_upsert(pending_vectors)
+            upserted_ids.extend(
+                self._collect_upserts(set(upsert_futures), upsert_futures),
+            )
 
-        if vectors_to_upsert:
-            self.rag_app_config.rag_client.pinecone.upsert_vectors(vectors_to_upsert)
+        return upserted_ids
+
+    def _embed_batch(self, batch: tuple, max_retries: int) -> list:
+        """Embed a batch of chunks, returning vectors ready for upsert."""
+        row_ids = [row_id for row_id, _ in batch]
+        text_chunks = [text_chunk for _, text_chunk in batch]
+        try:
+            embeddings = self._with_retries(
+                self.rag_app_config.rag_client.openai.generate_embeddings,
+                text_chunks,
+                model=os.getenv("EMBEDDING_MODEL"),
+                max_retries=max_retries,
+            )
+        except Exception:
+            self.logger.exception(
+                "Skipping rows %s..%s due to embedding error.",
+                row_ids[0],
+                row_ids[-1],
+            )
+            return []
+        return [
+            (self.vector_id(row_id), embedding, {"original_text": text_chunk})
+            for row_id, text_chunk, embedding in zip(
+                row_ids,
+                text_chunks,
+                embeddings,
+                strict=True,
+            )
+        ]
+
+    def _upsert_batch(self, vectors: list, max_retries: int) -> list[str]:
+        """Upsert a batch of vectors, returning the IDs of the upserted vectors."""
+        try:
+            self._with_retries(
+                self.rag_app_config.rag_client.vector_store.upsert_vectors,
+                vectors,
+                namespace=self.namespace,
+                max_retries=max_retries,
+            )
+        except Exception:
+            self.logger.exception(
+                "Skipping upsert of %d vectors due to error.",
+                len(vectors),
+            )
+            return []
+        return [vector_id for vector_id, *_ in vectors]
+
+    def _collect_upserts(
+        self,
+        done: set[Future],
+        upsert_futures: set[Future],
+    ) -> list[str]:
+        """Remove finished upserts from the in-flight set and return upserted IDs."""
+        upsert_futures.difference_update(done)
+        return [vector_id for future in done for vector_id in future.result()]
+
+    def _with_retries(
+        self,
+        func: Callable,
+        *args,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        **kwargs,
+    ) -> object:
+        """Call a function, retrying with jittered exponential backoff on failure."""
+        for attempt in range(max_retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == max_retries:
+                    raise
+                delay = RETRY_BASE_DELAY_SECONDS * 2**attempt
+                delay *= random.uniform(0.5, 1.5)  # noqa: S311
+                self.logger.warning(
+                    "%s failed (attempt %d/%d): %s. Retrying in %.2fs.",
+                    func.__name__,
+                    attempt + 1,
+                    max_retries + 1,
+                    e,
+                    delay,
+                )
+                time.sleep(delay)
+        return None
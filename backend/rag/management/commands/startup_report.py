@@ -0,0 +1,129 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+# Runs in a fresh interpreter, timing what a web or worker process does on boot.
+STARTUP_SCRIPT = """
+import json, time
+started_at = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+settings_ms = (time.perf_counter() - started_at) * 1000
+django.setup()
+setup_ms = (time.perf_counter() - started_at) * 1000
+from django.apps import apps
+rag_app_config = apps.get_app_config("rag")
+client_ms = None
+if {construct_client}:
+    client_started_at = time.perf_counter()
+    rag_app_config.rag_client
+    client_ms = (time.perf_counter() - client_started_at) * 1000
+print(json.dumps({{
+    "settings_ms": settings_ms,
+    "setup_ms": setup_ms,
+    "ready_ms": rag_app_config.ready_ms,
+    "client_ms": client_ms,
+}}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports the cold start time of a process: importing settings and apps, "
+        "the RAG app's ready(), and constructing the RAG client on first use."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add command arguments."""
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument(
+            "--skip-client",
+            action="store_true",
+            help="Don't construct the RAG client, e.g. without API credentials.",
+        )
+        parser.add_argument(
+            "--imports",
+            type=int,
+            default=10,
+            help="Number of slowest top-level imports to list.",
+        )
+
+    def handle(self, *args, **kwargs) -> None:  # noqa: ARG002
+        """Handle the command."""
+        if kwargs["runs"] < 1:
+            msg = "--runs must be a positive integer."
+            raise CommandError(msg)
+        script = STARTUP_SCRIPT.format(construct_client=not kwargs["skip_client"])
+
+        samples = []
+        import_times = {}
+        for _ in range(kwargs["runs"]):
+            started_at = time.perf_counter()
+            result = subprocess.run(  # noqa: S603
+                [sys.executable, "-X", "importtime", "-c", script],
+                capture_output=True,
+                text=True,
+                env=os.environ.copy(),
+                check=False,
+            )
+            wall_ms = (time.perf_counter() - started_at) * 1000
+            if result.returncode:
+                raise CommandError(self.failure_message(result))
+            samples.append({**json.loads(result.stdout), "process_ms": wall_ms})
+            for module, cumulative_us in self.top_level_imports(result.stderr):
+                import_times.setdefault(module, []).append(cumulative_us / 1000)
+
+        self.stdout.write(f"{'stage':>24} {'p50 ms':>8} {'max ms':>8}")
+        for key, label in (
+            ("settings_ms", "settings"),
+            ("setup_ms", "django.setup()"),
+            ("ready_ms", "rag ready()"),
+            ("client_ms", "RAG client first use"),
+            ("process_ms", "process wall time"),
+        ):
+            values = [sample[key] for sample in samples if sample[key] is not None]
+            if values:
+                self.stdout.write(
+                    f"{label:>24} {np.median(values):>8.0f} {max(values):>8.0f}",
+                )
+
+        if kwargs["imports"]:
+            self.stdout.write(f"\n{'slowest imports':>24} {'p50 ms':>8}")
+            slowest = sorted(
+                import_times.items(),
+                key=lambda item: -np.median(item[1]),
+            )[: kwargs["imports"]]
+            for module, times in slowest:
+                self.stdout.write(f"{module:>24} {np.median(times):>8.0f}")
+
+    @staticmethod
+    def failure_message(result: subprocess.CompletedProcess) -> str:
+        """Describe a failed startup by its last error line, or its exit status.
+
+        A process killed by a signal may not write anything besides the import times.
+        """
+        errors = [
+            line
+            for line in result.stderr.splitlines()
+            if line.strip() and not line.startswith("import time:")
+        ]
+        reason = errors[-1] if errors else f"exit status {result.returncode}"
+        return f"Startup failed:\n{reason}"
+
+    @staticmethod
+    def top_level_imports(importtime_log: str) -> list[tuple[str, int]]:
+        """Parse `-X importtime` output into top-level modules and cumulative us."""
+        imports = []
+        for line in importtime_log.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line.removeprefix("import time:").split("|")
+            if not name.startswith("  "):
+                imports.append((name.strip(), int(cumulative)))
+        return imports
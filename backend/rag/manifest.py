@@ -0,0 +1,61 @@
+"""Local manifest of embedded chunks used for incremental re-indexing."""
+
+import hashlib
+import json
+from pathlib import Path
+
+MANIFEST_FORMAT_VERSION = 1
+
+
+def content_hash(text: str) -> str:
+    """Return a short, stable hash of a chunk's text."""
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+class EmbeddingManifest:
+    """Map of vector IDs to the content hash of the text they were embedded from.
+
+    The manifest is written next to the dataset after every run. Incremental runs
+    compare fresh chunk hashes against it to embed only new or changed chunks and to
+    find vectors whose source rows were removed.
+    """
+
+    def __init__(self, path: str | Path, hashes: dict[str, str] | None = None) -> None:
+        """Initialize a manifest stored at `path`."""
+        self.path = Path(path)
+        self.hashes = hashes or {}
+
+    @classmethod
+    def load(cls, path: str | Path) -> "EmbeddingManifest":
+        """Load a manifest from disk, or return an empty one if it does not exist."""
+        path = Path(path)
+        try:
+            with path.open() as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path)
+        if data.get("format_version") != MANIFEST_FORMAT_VERSION:
+            return cls(path)
+        return cls(path, data["chunks"])
+
+    @property
+    def dataset_version(self) -> str:
+        """Hash identifying the full set of embedded chunks."""
+        digest = hashlib.sha256()
+        for vector_id, chunk_hash in sorted(self.hashes.items()):
+            digest.update(f"{vector_id}:{chunk_hash}\n".encode())
+        return digest.hexdigest()[:16]
+
+    def save(self) -> None:
+        """Atomically write the manifest to disk."""
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with tmp_path.open("w") as f:
+            json.dump(
+                {
+                    "format_version": MANIFEST_FORMAT_VERSION,
+                    "dataset_version": self.dataset_version,
+                    "chunks": self.hashes,
+                },
+                f,
+            )
+        tmp_path.replace(self.path)
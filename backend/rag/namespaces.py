@@ -0,0 +1,30 @@
+"""Dataset namespaces: names, validation, and where their files are kept."""
+
+import re
+from pathlib import Path
+
+# The namespace of the bundled dataset, and of data indexed before namespaces.
+DEFAULT_NAMESPACE = ""
+NAMESPACE_PATTERN = re.compile(r"\A[A-Za-z0-9][A-Za-z0-9_-]{0,63}\Z")
+
+
+def validate_namespace(namespace: str) -> str:
+    """Return the namespace if it is valid, raising ValueError otherwise."""
+    if namespace != DEFAULT_NAMESPACE and not NAMESPACE_PATTERN.match(namespace):
+        msg = (
+            f"Invalid namespace '{namespace}': use up to 64 letters, digits, "
+            "underscores or hyphens, starting with a letter or digit."
+        )
+        raise ValueError(msg)
+    return namespace
+
+
+def namespace_path(path: str | Path, namespace: str) -> Path:
+    """Return where the file at `path` of the default namespace is for `namespace`.
+
+    Files of other namespaces are kept under `namespaces/<namespace>/` next to it.
+    """
+    path = Path(path)
+    if namespace == DEFAULT_NAMESPACE:
+        return path
+    return path.parent / "namespaces" / validate_namespace(namespace) / path.name
@@ -0,0 +1,162 @@
+"""Per-namespace retrieval resources, kept warm in a memory-bounded LRU cache."""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from rag.cache import ResponseCache, query_entities
+from rag.classifier import needs_dataset
+from rag.lexical import HybridRetriever
+from rag.structured import StructuredQueryRouter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAMESPACE_CACHE_MAX_MB = 1024
+
+
+@dataclass
+class NamespaceResources:
+    """The structured router, lexical index and answer cache of a namespace."""
+
+    namespace: str
+    structured_router: StructuredQueryRouter | None
+    hybrid_retriever: HybridRetriever | None
+    response_cache: ResponseCache | None
+
+    @classmethod
+    def from_env(cls, namespace: str) -> "NamespaceResources":
+        """Build and load the resources of a namespace, as configured by the env."""
+        resources = cls(
+            namespace=namespace,
+            structured_router=StructuredQueryRouter.from_env(namespace),
+            hybrid_retriever=HybridRetriever.from_env(namespace),
+            response_cache=ResponseCache.from_env(namespace),
+        )
+        if resources.structured_router is not None:
+            resources.structured_router.get_table()
+        return resources
+
+    def needs_dataset(self, query: str) -> bool:
+        """Return whether answering a question may need this namespace's dataset."""
+        retriever = self.hybrid_retriever
+        return needs_dataset(query, retriever.get_index() if retriever else None)
+
+    def query_entities(self, query: str) -> frozenset[str]:
+        """Return the entities a question is about, among them departments."""
+        table = self.structured_router.get_table() if self.structured_router else None
+        return query_entities(query, table.departments if table is not None else ())
+
+    @property
+    def nbytes(self) -> int:
+        """Return the memory taken by the loaded tables, indexes and answers."""
+        nbytes = 0
+        router, retriever = self.structured_router, self.hybrid_retriever
+        if router is not None and router.table is not None:
+            nbytes += router.table.nbytes
+        if retriever is not None and retriever.index is not None:
+            nbytes += retriever.index.nbytes
+        if self.response_cache is not None:
+            nbytes += self.response_cache.nbytes
+        return nbytes
+
+
+class NamespaceCache:
+    """LRU cache of the resources of the namespaces queried by this process.
+
+    Resources are loaded on first use and the least recently used namespaces are
+    dropped once the loaded ones take more than `max_bytes`, so the number of
+    datasets served does not bound memory. Loads run outside the cache lock: a
+    cold namespace being loaded does not hold up queries of the warm ones, and
+    concurrent queries of the same namespace wait for a single load.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str], NamespaceResources],
+        max_bytes: int = DEFAULT_NAMESPACE_CACHE_MAX_MB * 1024 * 1024,
+    ) -> None:
+        """Initialize an empty cache, loading namespaces with `load(namespace)`."""
+        self.load = load
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(
+        cls,
+        load: Callable[[str], NamespaceResources] = NamespaceResources.from_env,
+    ) -> "NamespaceCache":
+        """Build the cache bounded by the NAMESPACE_CACHE_MAX_MB variable."""
+        max_mb = float(
+            os.getenv("NAMESPACE_CACHE_MAX_MB", DEFAULT_NAMESPACE_CACHE_MAX_MB),
+        )
+        return cls(load, max_bytes=int(max_mb * 1024 * 1024))
+
+    def __len__(self) -> int:
+        """Return the number of cached namespaces."""
+        return len(self._entries)
+
+    def get(self, namespace: str) -> NamespaceResources:
+        """Return the resources of a namespace, loading them if needed."""
+        with self._lock:
+            future = self._entries.get(namespace)
+            loading = future is None
+            if loading:
+                future = self._entries[namespace] = Future()
+                self.stats["loads"] += 1
+            else:
+                self._entries.move_to_end(namespace)
+                self.stats["hits"] += 1
+        if loading:
+            try:
+                future.set_result(self.load(namespace))
+            except Exception as e:
+                with self._lock:
+                    if self._entries.get(namespace) is future:
+                        del self._entries[namespace]
+                future.set_exception(e)
+                raise
+            self._evict(keep=namespace)
+        return future.result()
+
+    @property
+    def nbytes(self) -> int:
+        """Return the memory taken by the loaded namespaces."""
+        with self._lock:
+            return sum(self._sizes().values())
+
+    def _sizes(self) -> dict[str, int]:
+        """Return the memory taken by each loaded namespace, with the lock held."""
+        return {
+            namespace: future.result().nbytes
+            for namespace, future in self._entries.items()
+            if future.done()
+        }
+
+    def _evict(self, keep: str) -> None:
+        """Drop the least recently used namespaces beyond `max_bytes`, except `keep`."""
+        with self._lock:
+            sizes = self._sizes()
+            total = sum(sizes.values())
+            evicted = []
+            for namespace in list(self._entries):
+                if total <= self.max_bytes:
+                    break
+                if namespace == keep or namespace not in sizes:
+                    continue
+                del self._entries[namespace]
+                total -= sizes[namespace]
+                evicted.append(namespace)
+            self.stats["evictions"] += len(evicted)
+        if evicted:
+            logger.info(
+                "Evicted %d namespaces from the resource cache (%s), keeping %.1f MB.",
+                len(evicted),
+                ", ".join(repr(namespace) for namespace in evicted),
+                total / 1024 / 1024,
+            )
@@ -0,0 +1,250 @@
+"""Dispatch of context retrieval to the web process or to Celery workers."""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from celery.result import AsyncResult
+
+from rag.namespaces import DEFAULT_NAMESPACE
+from rag.tasks import fetch_rag_context, timed_retrieval
+from rag.tracing import Trace
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INPROCESS_WORKERS = 8
+DEFAULT_INPROCESS_MAX_PENDING = 32
+# Retrievals kept per path for the overhead metrics, and how often they are logged.
+METRICS_WINDOW = 1000
+METRICS_LOG_EVERY = 100
+
+
+class RetrievalMetrics:
+    """Per-path wait and overhead times of recent retrievals.
+
+    The wait is the time from submitting a query to its context being available
+    to the view. The overhead is the part of it not spent retrieving: the Celery
+    broker and result backend round trips, or waiting for a free pool thread.
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW) -> None:
+        """Initialize metrics keeping the last `window` retrievals per path."""
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, path: str, wait_ms: float, retrieval_ms: float | None) -> None:
+        """Record a completed retrieval, logging a summary every so often."""
+        overhead_ms = wait_ms - retrieval_ms if retrieval_ms is not None else None
+        with self._lock:
+            self.samples[path].append((wait_ms, overhead_ms))
+            self.count += 1
+            log_summary = self.count % METRICS_LOG_EVERY == 0
+        if log_summary:
+            for summary_path, summary in self.summary().items():
+                logger.info(
+                    "Retrieval via %s over %d requests: wait p50 %.0f ms, p99 %.0f ms; "
+                    "overhead p50 %.0f ms, p99 %.0f ms.",
+                    summary_path,
+                    summary["count"],
+                    summary["wait_p50_ms"],
+                    summary["wait_p99_ms"],
+                    summary["overhead_p50_ms"],
+                    summary["overhead_p99_ms"],
+                )
+
+    def summary(self) -> dict[str, dict]:
+        """Return the count and wait and overhead percentiles of each path."""
+        with self._lock:
+            samples = {
+                path: list(path_samples) for path, path_samples in self.samples.items()
+            }
+        summary = {}
+        for path, path_samples in samples.items():
+            waits = [wait for wait, _ in path_samples]
+            overheads = [overhead for _, overhead in path_samples if overhead is not None]
+            wait_p50, wait_p99 = np.percentile(waits, [50, 99])
+            overhead_p50, overhead_p99 = (
+                np.percentile(overheads, [50, 99]) if overheads else (np.nan, np.nan)
+            )
+            summary[path] = {
+                "count": len(path_samples),
+                "wait_p50_ms": float(wait_p50),
+                "wait_p99_ms": float(wait_p99),
+                "overhead_p50_ms": float(overhead_p50),
+                "overhead_p99_ms": float(overhead_p99),
+            }
+        return summary
+
+
+class PendingContext:
+    """The context of a query, being retrieved in-process or by a Celery worker."""
+
+    def __init__(
+        self,
+        result: Future | AsyncResult,
+        path: str,
+        metrics: RetrievalMetrics,
+        submitted_at: float,
+        trace: Trace | None = None,
+    ) -> None:
+        """Initialize a retrieval submitted at `submitted_at` (`time.perf_counter`).
+
+        Once the context is received, the retrieval stages are added to `trace`.
+        """
+        self.result = result
+        self.path = path
+        self.metrics = metrics
+        self.submitted_at = submitted_at
+        self.trace = trace
+
+    @property
+    def id(self) -> str:
+        """Identify the retrieval in logs."""
+        return self.result.id if isinstance(self.result, AsyncResult) else hex(id(self))
+
+    def wait(self, timeout: float) -> str | None:
+        """Wait up to `timeout` seconds for the context.
+
+        Celery results are pushed by the result backend (pub/sub on Redis) instead
+        of being polled. Returns None if the retrieval is still running, and an
+        empty context if it failed.
+        """
+        try:
+            if isinstance(self.result, Future):
+                value = self.result.result(timeout=timeout)
+            else:
+                value = self.result.get(timeout=timeout)
+        except (TimeoutError, CeleryTimeoutError):
+            return None
+        except Exception:
+            logger.exception("Retrieval %s via %s failed.", self.id, self.path)
+            return ""
+
+        wait_ms = (time.perf_counter() - self.submitted_at) * 1000
+        # Workers running an older version of the task return the bare context.
+        if not isinstance(value, dict):
+            self.metrics.record(self.path, wait_ms, None)
+            return value
+        self.metrics.record(self.path, wait_ms, value["retrieval_ms"])
+        if self.trace is not None:
+            stages = value.get("stages", {})
+            self.trace.update(stages)
+            self.trace.add("context_wait", wait_ms / 1000)
+            if "queue_wait" in stages:
+                self.trace.add(
+                    "polling_delay",
+                    max(
+                        wait_ms / 1000 - stages["queue_wait"] - stages["retrieval"],
+                        0.0,
+                    ),
+                )
+        return value["context"]
+
+
+class ContextRetrieval:
+    """Runs context retrieval in the web process, or in Celery workers.
+
+    In `inprocess` mode, retrieval runs on a bounded thread pool in the web worker
+    and skips the broker and result backend round trips. Once `max_workers` plus
+    `max_pending` retrievals are in flight, further ones overflow to Celery. In
+    `celery` mode, every retrieval is a Celery task.
+    """
+
+    def __init__(
+        self,
+        retrieve: Callable[[str, int, str], str],
+        mode: str = "celery",
+        max_workers: int = DEFAULT_INPROCESS_WORKERS,
+        max_pending: int = DEFAULT_INPROCESS_MAX_PENDING,
+    ) -> None:
+        """Initialize retrieval calling `retrieve(query, top_k, namespace)` in-process."""
+        if mode not in ("celery", "inprocess"):
+            msg = f"Unknown RAG_RETRIEVAL_MODE '{mode}'."
+            raise ValueError(msg)
+        self.retrieve = retrieve
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_in_flight = max_workers + max_pending
+        self.metrics = RetrievalMetrics()
+        self._in_flight = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(
+        cls,
+        retrieve: Callable[[str, int, str], str],
+    ) -> "ContextRetrieval":
+        """Build the retrieval configured by RAG_RETRIEVAL_MODE and RAG_INPROCESS_*."""
+        return cls(
+            retrieve,
+            mode=os.getenv("RAG_RETRIEVAL_MODE", "celery").lower(),
+            max_workers=int(
+                os.getenv("RAG_INPROCESS_WORKERS", DEFAULT_INPROCESS_WORKERS),
+            ),
+            max_pending=int(
+                os.getenv("RAG_INPROCESS_MAX_PENDING", DEFAULT_INPROCESS_MAX_PENDING),
+            ),
+        )
+
+    def submit(
+        self,
+        query: str,
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+        trace: Trace | None = None,
+    ) -> PendingContext:
+        """Start retrieving the context of a query about a namespace.
+
+        The retrieval stages are added to `trace`, the trace of the request.
+
+        The request ID and the enqueue time are passed along in the Celery task
+        headers, so the worker can tell how long the task was queued.
+        """
+        submitted_at = time.perf_counter()
+        headers = {"enqueued_at": time.time()}
+        if trace is not None:
+            headers["request_id"] = trace.request_id
+        if self.mode == "inprocess" and self._acquire():
+            future = self._get_executor().submit(
+                timed_retrieval,
+                self.retrieve,
+                query,
+                top_k,
+                namespace,
+                headers,
+            )
+            future.add_done_callback(self._release)
+            return PendingContext(future, "inprocess", self.metrics, submitted_at, trace)
+        task = fetch_rag_context.apply_async((query, top_k, namespace), headers=headers)
+        return PendingContext(task, "celery", self.metrics, submitted_at, trace)
+
+    def _acquire(self) -> bool:
+        """Reserve an in-process slot, unless all are taken."""
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                return False
+            self._in_flight += 1
+            return True
+
+    def _release(self, _future: Future) -> None:
+        """Free the slot of a finished in-process retrieval."""
+        with self._lock:
+            self._in_flight -= 1
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Create the thread pool on first use, in the process that uses it."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="retrieval",
+                )
+            return self._executor
@@ -0,0 +1,457 @@
+"""Exact answers to aggregate and lookup questions over the employee dataset."""
+
+import os
+import re
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from rag.namespaces import DEFAULT_NAMESPACE, namespace_path
+
+DEFAULT_EMPLOYEE_TABLE_PATH = (
+    Path(__file__).resolve().parent / "data" / "employee_table.npz"
+)
+# Longest employee name, in words, looked up in a question.
+MAX_NAME_WORDS = 4
+
+SALARY_TERMS = r"(salar|pay|paid|earn|compensation|wage|income)"
+SALARY_PATTERN = re.compile(rf"\b{SALARY_TERMS}", re.IGNORECASE)
+HEADCOUNT_PATTERN = re.compile(
+    r"\b(how many|number of|count|headcount)\b.*\b(employees?|people|staff|workers?)\b"
+    r"|\btotal (employees|people|staff|headcount)\b",
+    re.IGNORECASE,
+)
+# What may follow "most" or "least": a salary term, or the end of the question.
+EXTREME_END = rf"(?=\s+{SALARY_TERMS}|\W*$)"
+STAT_PATTERNS = {
+    "median": re.compile(r"\bmedian\b", re.IGNORECASE),
+    "mean": re.compile(r"\b(average|mean|avg)\b", re.IGNORECASE),
+    # "most" and "least" only ask for the extremes of pay, as in "most paid" or "who
+    # earns the least", and not in "what do most employees earn".
+    "max": re.compile(
+        rf"\b(max(imum)?|highest|largest|biggest|top)\b|\bmost\b{EXTREME_END}",
+        re.IGNORECASE,
+    ),
+    "min": re.compile(
+        rf"\b(min(imum)?|lowest|smallest)\b|\bleast\b{EXTREME_END}",
+        re.IGNORECASE,
+    ),
+    "total": re.compile(r"\b(total|sum|combined|payroll)\b", re.IGNORECASE),
+}
+# Questions comparing groups, asking for more than a statistic, or filtering the
+# employees by a condition the router does not parse go to the LLM. Numbers are
+# only allowed within words, as in employee names.
+UNSUPPORTED_PATTERN = re.compile(
+    r"\b(which (department|dept|team|group)s?|compare|compared|versus|vs|between|why"
+    r"|trend|distribution|not|no|except|excluding|outside|other than|without"
+    r"|more|less|fewer|greater|above|below|over|under|at least|at most"
+    r"|hired|joined|since|before|after|during|if)\b|n't\b|\b\d",
+    re.IGNORECASE,
+)
+# Every word of a question answered from the table must be one of these, a
+# department or a named employee, so that no condition is silently ignored.
+QUESTION_WORDS = frozenset(
+    """
+    a across all an and any are at average avg be biggest by can combined company
+    compensation count current currently data dataset department departments dept do
+    does earn earned earner earners earning earnings earns employed employee
+    employees employs entire everyone for get gets give has have headcount highest
+    how i in income is largest least lowest make makes many max maximum me mean
+    median min minimum most much number of our overall paid pay payroll people
+    please salaries salary show smallest staff sum team tell the their there this
+    top total us wage wages we what what's whats where which who who's whole within
+    work worker workers working works you
+    """.split(),  # noqa: SIM905
+)
+QUESTION_WORD_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+# A capitalized word after "in" or "for" that is not a known department, e.g. a
+# department missing from the dataset, makes an overall answer misleading.
+GROUP_REFERENCE_PATTERN = re.compile(r"\b(?:in|for|of|within) (?:the )?([A-Z][\w&-]*)")
+NON_GROUP_WORDS = {"Overall", "Total", "All", "Our", "Company", "Employee", "Employees"}
+LOOKUP_PATTERN = re.compile(r"\b(department|dept|work|works|team)\b", re.IGNORECASE)
+WORD_PATTERN = re.compile(r"[\w.'-]+")
+
+
+class EmployeeTable:
+    """Columnar, in-memory copy of the employee dataset.
+
+    Departments are dictionary-encoded, and rows are kept sorted by department and
+    salary, so group-by aggregates are slices of contiguous arrays.
+    """
+
+    def __init__(
+        self,
+        names: np.ndarray,
+        dept_codes: np.ndarray,
+        departments: np.ndarray,
+        salaries: np.ndarray,
+    ) -> None:
+        """Initialize a table from its columns, in dataset row order."""
+        self.names = names
+        self.dept_codes = dept_codes
+        self.departments = departments
+        self.salaries = salaries
+
+        # Stable sorts keep ties in row order, so the first of equal salaries is
+        # the earliest row, as in the statistics chunks.
+        self._group_order = np.lexsort((salaries, dept_codes))
+        self._group_bounds = np.searchsorted(
+            dept_codes[self._group_order],
+            np.arange(len(departments) + 1),
+        )
+        self._overall_order = np.argsort(salaries, kind="stable")
+        self._lower_names = np.char.lower(names.astype(str))
+        self._name_order = np.argsort(self._lower_names, kind="stable")
+        # Searching for a string longer than the array's itemsize copies the whole
+        # array to a wider dtype, so such names are ruled out first.
+        self._max_name_length = self._lower_names.dtype.itemsize // np.dtype("U1").itemsize
+        self._department_lookup = {
+            department.lower(): code for code, department in enumerate(departments)
+        }
+
+    @classmethod
+    def from_blocks(cls, blocks: Iterable[pd.DataFrame]) -> "EmployeeTable":
+        """Build a table from blocks of employee rows."""
+        builder = EmployeeTableBuilder()
+        for block in blocks:
+            builder.add(block)
+        return builder.build()
+
+    @classmethod
+    def load(cls, path: str | Path) -> "EmployeeTable":
+        """Load a table saved with `save`."""
+        with np.load(path) as data:
+            return cls(
+                names=data["names"],
+                dept_codes=data["dept_codes"],
+                departments=data["departments"],
+                salaries=data["salaries"],
+            )
+
+    def save(self, path: str | Path) -> None:
+        """Atomically write the table to disk."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.stem}.tmp.npz")
+        np.savez(
+            tmp_path,
+            names=self.names,
+            dept_codes=self.dept_codes,
+            departments=self.departments,
+            salaries=self.salaries,
+        )
+        tmp_path.replace(path)
+
+    def __len__(self) -> int:
+        """Return the number of employees."""
+        return len(self.salaries)
+
+    @property
+    def nbytes(self) -> int:
+        """Return the memory taken by the columns and their sort orders."""
+        return sum(
+            array.nbytes
+            for array in (
+                self.names,
+                self.dept_codes,
+                self.departments,
+                self.salaries,
+                self._group_order,
+                self._group_bounds,
+                self._overall_order,
+                self._lower_names,
+                self._name_order,
+            )
+        )
+
+    def department_code(self, department: str) -> int | None:
+        """Return the code of a department, matched case-insensitively."""
+        return self._department_lookup.get(department.lower())
+
+    def aggregate(self, stat: str, department: int | None = None) -> dict | None:
+        """Compute a salary statistic over a department, or over everyone.
+
+        `stat` is one of `count`, `total`, `mean`, `median`, `max` or `min`. `max`
+        and `min` also return the employee. Returns None for an empty group.
+        """
+        if department is None:
+            rows = self._overall_order
+        else:
+            start, end = self._group_bounds[department : department + 2]
+            rows = self._group_order[start:end]
+        if not len(rows):
+            return None
+        salaries = self.salaries[rows]
+
+        if stat == "count":
+            return {"value": len(rows)}
+        if stat == "total":
+            return {"value": float(salaries.sum())}
+        if stat == "mean":
+            return {"value": float(salaries.mean())}
+        if stat == "median":
+            return {"value": float(np.median(salaries))}
+        # `salaries` is sorted, and the first of equal salaries is the earliest row.
+        index = 0 if stat == "min" else np.searchsorted(salaries, salaries[-1])
+        row = rows[index]
+        return {
+            "value": float(self.salaries[row]),
+            "employee": str(self.names[row]),
+            "department": str(self.departments[self.dept_codes[row]]),
+        }
+
+    def find_employees(self, name: str) -> list[int]:
+        """Return the rows of the employees with a name, matched case-insensitively."""
+        name = name.lower()
+        if len(name) > self._max_name_length:
+            return []
+        start = np.searchsorted(self._lower_names, name, "left", self._name_order)
+        end = np.searchsorted(self._lower_names, name, "right", self._name_order)
+        return sorted(self._name_order[start:end].tolist())
+
+
+class EmployeeTableBuilder:
+    """Builds an `EmployeeTable` one block of employee rows at a time.
+
+    The columns of each block are copied into arrays that grow geometrically, so
+    the blocks themselves can be dropped as soon as they are added.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        """Initialize an empty builder with room for `capacity` rows."""
+        self._size = 0
+        self._names = np.empty(capacity, dtype="U1")
+        self._dept_codes = np.empty(capacity, dtype=np.int32)
+        self._salaries = np.empty(capacity, dtype=np.float64)
+        # Codes are given in order of first appearance, and sorted in `build`.
+        self._department_codes = {}
+
+    def add(self, block: pd.DataFrame) -> None:
+        """Append a block of employee rows."""
+        names = block["Name"].astype(str).to_numpy(dtype=str)
+        codes, departments = pd.factorize(block["Department"].astype(str))
+        global_codes = np.array(
+            [
+                self._department_codes.setdefault(department, len(self._department_codes))
+                for department in departments
+            ],
+            dtype=np.int32,
+        )
+        end = self._size + len(block)
+        self._reserve(end, names.dtype)
+        self._names[self._size : end] = names
+        self._dept_codes[self._size : end] = global_codes[codes]
+        self._salaries[self._size : end] = block["Salary"].astype(float).to_numpy()
+        self._size = end
+
+    def build(self) -> EmployeeTable:
+        """Return the table of the rows added so far."""
+        departments = np.array(list(self._department_codes), dtype=str)
+        order = np.argsort(departments, kind="stable")
+        sorted_codes = np.empty(len(order), dtype=np.int32)
+        sorted_codes[order] = np.arange(len(order), dtype=np.int32)
+        return EmployeeTable(
+            names=self._names[: self._size].copy(),
+            dept_codes=sorted_codes[self._dept_codes[: self._size]],
+            departments=departments[order],
+            salaries=self._salaries[: self._size].copy(),
+        )
+
+    def _reserve(self, size: int, names_dtype: np.dtype) -> None:
+        """Make room for `size` rows, widening the names to `names_dtype` if needed."""
+        capacity = len(self._salaries)
+        if size > capacity:
+            capacity = max(size, 2 * capacity)
+            self._dept_codes = self._resized(self._dept_codes, capacity)
+            self._salaries = self._resized(self._salaries, capacity)
+        if capacity > len(self._names) or names_dtype.itemsize > self._names.itemsize:
+            wider = names_dtype.itemsize > self._names.itemsize
+            dtype = names_dtype if wider else self._names.dtype
+            self._names = self._resized(self._names, capacity, dtype)
+
+    def _resized(
+        self,
+        array: np.ndarray,
+        capacity: int,
+        dtype: np.dtype | None = None,
+    ) -> np.ndarray:
+        """Return a copy of the filled part of an array with room for more rows."""
+        resized = np.empty(capacity, dtype=dtype or array.dtype)
+        resized[: self._size] = array[: self._size]
+        return resized
+
+
+class StructuredQueryRouter:
+    """Answers aggregate and lookup salary questions from an `EmployeeTable`.
+
+    Questions such as "median salary in IT" or "what does Employee_42 earn" get
+    exact answers in milliseconds, without retrieval or generation. Anything else,
+    or anything ambiguous, returns None and goes through RAG.
+
+    The table is written by `embed_dataset` and reloaded when the file changes.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        """Initialize a router over the table saved at `path`."""
+        self.path = Path(path)
+        self.table = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(
+        cls,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> "StructuredQueryRouter | None":
+        """Build the router of a namespace, unless STRUCTURED_QUERIES_ENABLED is off."""
+        if os.getenv("STRUCTURED_QUERIES_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+        return cls(employee_table_path(namespace))
+
+    def answer(self, query: str) -> str | None:
+        """Answer a question from the table, or return None if it can't be."""
+        table = self.get_table()
+        if table is None or not len(table) or UNSUPPORTED_PATTERN.search(query):
+            return None
+        employees = self._find_mentioned_employees(table, query)
+        if self._has_unknown_words(table, query, employees):
+            return None
+        if employees:
+            if SALARY_PATTERN.search(query) or LOOKUP_PATTERN.search(query):
+                return self._answer_lookup(table, employees)
+            return None
+        return self._answer_aggregate(table, query)
+
+    def get_table(self) -> EmployeeTable | None:
+        """Return the table, reloading it if `embed_dataset` wrote a new one."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                self.table = EmployeeTable.load(self.path)
+                self._mtime = mtime
+            return self.table
+
+    @staticmethod
+    def _find_mentioned_employees(table: EmployeeTable, query: str) -> list[int]:
+        """Return the rows of employees named in the question."""
+        words = WORD_PATTERN.findall(query)
+        for size in range(min(MAX_NAME_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                candidate = " ".join(words[start : start + size]).rstrip(".'?")
+                candidate = candidate.removesuffix("'s")
+                rows = table.find_employees(candidate)
+                if rows:
+                    return rows
+        return []
+
+    @staticmethod
+    def _has_unknown_words(table: EmployeeTable, query: str, employees: list[int]) -> bool:
+        """Return whether the question has words the router does not understand.
+
+        Departments follow the same case rules as in `_find_mentioned_departments`,
+        and possessives are read as the word they follow.
+        """
+        query = re.sub(r"'s\b", " ", query, flags=re.IGNORECASE)
+        for department in table.departments:
+            flags = 0 if department.isupper() else re.IGNORECASE
+            query = re.sub(rf"\b{re.escape(department)}\b", " ", query, flags=flags)
+        for name in {str(table.names[row]) for row in employees}:
+            pattern = rf"(?<!\w){re.escape(name)}(?!\w)"
+            query = re.sub(pattern, " ", query, flags=re.IGNORECASE)
+        words = QUESTION_WORD_PATTERN.findall(query.lower())
+        return any(word not in QUESTION_WORDS for word in words)
+
+    @staticmethod
+    def _answer_lookup(table: EmployeeTable, rows: list[int]) -> str:
+        """Describe the department and salary of the named employees."""
+        return " ".join(
+            f"{table.names[row]} works in {table.departments[table.dept_codes[row]]} "
+            f"with a salary of ${table.salaries[row]:,.2f}."
+            for row in rows
+        )
+
+    def _answer_aggregate(self, table: EmployeeTable, query: str) -> str | None:
+        """Answer statistics questions over departments or the whole dataset."""
+        stats = [stat for stat, pattern in STAT_PATTERNS.items() if pattern.search(query)]
+        if HEADCOUNT_PATTERN.search(query):
+            # Counting the employees with a given salary, e.g. "how many employees
+            # earn the highest salary", is a condition the table can't filter on.
+            if SALARY_PATTERN.search(query) or set(stats) - {"total"}:
+                return None
+            stats = ["count"]
+        elif not SALARY_PATTERN.search(query):
+            return None
+        if not stats:
+            return None
+
+        departments = self._find_mentioned_departments(table, query)
+        if departments is None:
+            return None
+        sentences = []
+        for department in departments or [None]:
+            for stat in stats:
+                result = table.aggregate(stat, department)
+                if result is None:
+                    return None
+                sentences.append(self._describe(table, stat, department, result))
+        return " ".join(sentences)
+
+    @staticmethod
+    def _find_mentioned_departments(table: EmployeeTable, query: str) -> list[int] | None:
+        """Return the departments named in the question.
+
+        All-caps names such as IT or HR only match in capitals, so that "it" in a
+        question is not read as a department. Returns None if the question seems to
+        name a group that is not in the dataset.
+        """
+        departments = []
+        for code, department in enumerate(table.departments):
+            flags = 0 if department.isupper() else re.IGNORECASE
+            if re.search(rf"\b{re.escape(department)}\b", query, flags):
+                departments.append(code)
+        for group in GROUP_REFERENCE_PATTERN.findall(query):
+            if group not in NON_GROUP_WORDS and table.department_code(group) is None:
+                return None
+        return departments
+
+    @staticmethod
+    def _describe(
+        table: EmployeeTable,
+        stat: str,
+        department: int | None,
+        result: dict,
+    ) -> str:
+        """Phrase a statistic as a sentence."""
+        scope = "overall" if department is None else f"in {table.departments[department]}"
+        if stat == "count":
+            return f"There are {result['value']:,} employees {scope}."
+        label = {
+            "total": "total salary",
+            "mean": "average salary",
+            "median": "median salary",
+            "max": "highest salary",
+            "min": "lowest salary",
+        }[stat]
+        sentence = f"The {label} {scope} is ${result['value']:,.2f}"
+        if stat in ("max", "min"):
+            sentence += f", earned by {result['employee']}"
+            if department is None:
+                sentence += f" ({result['department']})"
+        return sentence + "."
+
+
+def employee_table_path(namespace: str = DEFAULT_NAMESPACE) -> Path:
+    """Return the path of a namespace's employee table.
+
+    The table of the default namespace is at EMPLOYEE_TABLE_PATH.
+    """
+    return namespace_path(
+        os.getenv("EMPLOYEE_TABLE_PATH", DEFAULT_EMPLOYEE_TABLE_PATH),
+        namespace,
+    )
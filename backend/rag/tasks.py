@@ -1,9 +1,60 @@
+import time
+from collections.abc import Callable
+
 from celery import shared_task
 from django.apps import apps
 
+from rag.namespaces import DEFAULT_NAMESPACE
+from rag.tracing import Trace, activate
+
+
+def timed_retrieval(
+    retrieve: Callable[[str, int, str], str],
+    query: str,
+    top_k: int,
+    namespace: str = DEFAULT_NAMESPACE,
+    headers: dict | None = None,
+) -> dict:
+    """Retrieve the context of a query about a namespace, and the time it took.
+
+    `headers` carries the request ID and the wall-clock time the retrieval was
+    enqueued at. The timings of the retrieval stages are returned with the context,
+    to be added to the trace of the request.
+    """
+    headers = headers or {}
+    trace = Trace(headers.get("request_id"))
+    enqueued_at = headers.get("enqueued_at")
+    if enqueued_at is not None:
+        trace.add("queue_wait", max(time.time() - enqueued_at, 0.0))
+    with activate(trace), trace.stage("retrieval"):
+        context = retrieve(query, top_k, namespace)
+    return {
+        "context": context,
+        "retrieval_ms": trace.stages["retrieval"] * 1000,
+        "request_id": trace.request_id,
+        "stages": trace.stages,
+    }
+
+
+@shared_task(bind=True)
+def fetch_rag_context(
+    self,  # noqa: ANN001
+    query: str,
+    top_k: int = 3,
+    namespace: str = DEFAULT_NAMESPACE,
+) -> dict:
+    """Celery task to fetch RAG context from vector store, with its retrieval time.
 
-@shared_task
-def fetch_rag_context(query: str, top_k: int = 3) -> str:
-    """Celery task to fetch RAG context from vector store."""
+    Tasks enqueued before namespaces existed retrieve from the default one. The
+    request ID and enqueue time are passed in the task headers. With
+    RETRIEVAL_BATCH_WINDOW_MS set, queries of concurrent tasks in a worker process
+    (e.g. `--pool threads`) are retrieved in batches.
+    """
     rag_client = apps.get_app_config("rag").rag_client
-    return rag_client.get_context_from_pinecone(query, top_k)
+    return timed_retrieval(
+        rag_client.retrieve_context,
+        query,
+        top_k,
+        namespace,
+        self.request.headers,
+    )
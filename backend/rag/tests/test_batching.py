@@ -0,0 +1,77 @@
+import os
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from rag.batching import RetrievalBatcher
+from rag.namespaces import DEFAULT_NAMESPACE
+
+WINDOW = 0.2
+TIMEOUT = 5
+
+
+class RecordingRetriever:
+    """Fake `retrieve_many` answering each query with itself, recording its calls."""
+
+    def __init__(self) -> None:
+        """Start without calls."""
+        self.calls = []
+
+    def __call__(self, queries: list[str], top_k: int, namespace: str) -> list[str]:
+        """Record a call and return a context per query."""
+        self.calls.append((queries, top_k, namespace))
+        return [f"{namespace}/{top_k}: {query}" for query in queries]
+
+
+class RetrievalBatcherTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Create a batcher whose window holds every query a test submits."""
+        self.retriever = RecordingRetriever()
+        self.batcher = RetrievalBatcher(self.retriever, window=WINDOW)
+
+    def test_retrieves_queries_in_a_window_together(self) -> None:
+        """Queries within one window share a call, and each gets its own context."""
+        futures = [self.batcher.submit(query) for query in ["a", "b", "c"]]
+        contexts = [future.result(TIMEOUT) for future in futures]
+        self.assertEqual(contexts, ["/3: a", "/3: b", "/3: c"])
+        self.assertEqual(self.retriever.calls, [(["a", "b", "c"], 3, DEFAULT_NAMESPACE)])
+        self.assertEqual(self.batcher.stats, {"batches": 1, "queries": 3})
+
+    def test_retrieves_each_top_k_and_namespace_separately(self) -> None:
+        """Queries needing different retrievals are not mixed in one call."""
+        futures = [
+            self.batcher.submit("a", namespace="hr"),
+            self.batcher.submit("b", top_k=5, namespace="hr"),
+            self.batcher.submit("c", namespace="it"),
+            self.batcher.submit("d", namespace="hr"),
+        ]
+        contexts = [future.result(TIMEOUT) for future in futures]
+        self.assertEqual(contexts, ["hr/3: a", "hr/5: b", "it/3: c", "hr/3: d"])
+        self.assertCountEqual(
+            self.retriever.calls,
+            [(["a", "d"], 3, "hr"), (["b"], 5, "hr"), (["c"], 3, "it")],
+        )
+
+    def test_cuts_batches_at_max_batch_size(self) -> None:
+        """A full batch is retrieved without waiting for the rest of the window."""
+        self.batcher.max_batch_size = 2
+        futures = [self.batcher.submit(query) for query in ["a", "b", "c"]]
+        for future in futures:
+            future.result(TIMEOUT)
+        self.assertEqual(self.batcher.stats, {"batches": 2, "queries": 3})
+
+    def test_fails_every_query_of_a_failed_batch(self) -> None:
+        """An error of `retrieve_many` is raised to each of the batch's callers."""
+        self.batcher.retrieve_many = mock.Mock(side_effect=ConnectionError)
+        futures = [self.batcher.submit(query) for query in ["a", "b"]]
+        with self.assertLogs("rag.batching", "ERROR"):
+            for future in futures:
+                with self.assertRaises(ConnectionError):
+                    future.result(TIMEOUT)
+
+    def test_is_disabled_without_a_window(self) -> None:
+        """No batcher is built unless RETRIEVAL_BATCH_WINDOW_MS is positive."""
+        with mock.patch.dict(os.environ, {"RETRIEVAL_BATCH_WINDOW_MS": "0"}):
+            self.assertIsNone(RetrievalBatcher.from_env(self.retriever))
+        with mock.patch.dict(os.environ, {"RETRIEVAL_BATCH_WINDOW_MS": "5"}):
+            self.assertEqual(RetrievalBatcher.from_env(self.retriever).window, 0.005)
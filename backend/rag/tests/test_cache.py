@@ -0,0 +1,220 @@
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+import redis
+from django.test import SimpleTestCase
+
+from rag.cache import (
+    EmbeddingCache,
+    RedisEmbeddingStore,
+    ResponseCache,
+    SQLiteEmbeddingStore,
+    query_entities,
+)
+from rag.fakes import FakeOpenAIClient
+
+DEPARTMENTS = ["HR", "IT", "Sales"]
+MODEL = "text-embedding-3-small"
+EMBEDDING = [0.5, -0.25, 1.0]
+
+
+class QueryEntitiesTests(SimpleTestCase):
+    def test_finds_identifiers_numbers_and_names(self) -> None:
+        """Identifiers, numbers and names after the first word are entities."""
+        self.assertEqual(
+            query_entities("What does Employee_41 earn in 2020 at Globex?"),
+            {"employee_41", "2020", "globex"},
+        )
+
+    def test_ignores_the_capitalized_first_word(self) -> None:
+        """The first word of a question is capitalized whatever it is."""
+        self.assertEqual(query_entities("What is the median salary?"), set())
+
+    def test_matches_names_in_any_case(self) -> None:
+        """Known names such as departments match in lower case too."""
+        self.assertEqual(
+            query_entities("median salary in sales", DEPARTMENTS),
+            {"sales"},
+        )
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def test_hits_normalized_texts(self) -> None:
+        """Texts differing only in whitespace share an entry."""
+        cache = EmbeddingCache()
+        cache.set_many(MODEL, ["median  salary "], [EMBEDDING])
+        self.assertEqual(cache.get_many(MODEL, ["median salary", "HR"]), [EMBEDDING, None])
+        self.assertEqual(cache.stats, {"local_hits": 1, "shared_hits": 0, "misses": 1})
+        self.assertEqual(cache.get_many("other-model", ["median salary"]), [None])
+
+    def test_evicts_the_least_recently_used_entry(self) -> None:
+        """A full cache drops the entry read or written the longest ago."""
+        cache = EmbeddingCache(max_entries=2)
+        cache.set_many(MODEL, ["a", "b"], [EMBEDDING, EMBEDDING])
+        cache.get_many(MODEL, ["a"])
+        cache.set_many(MODEL, ["c"], [EMBEDDING])
+        self.assertEqual(
+            cache.get_many(MODEL, ["a", "b", "c"]),
+            [EMBEDDING, None, EMBEDDING],
+        )
+
+    def test_expires_entries_after_the_ttl(self) -> None:
+        """Entries older than the TTL are misses."""
+        cache = EmbeddingCache(ttl=60)
+        cache.set_many(MODEL, ["a"], [EMBEDDING])
+        later = time.monotonic() + 61
+        with mock.patch("rag.cache.time.monotonic", return_value=later):
+            self.assertEqual(cache.get_many(MODEL, ["a"]), [None])
+        self.assertEqual(len(cache.local), 0)
+
+    def test_fills_the_local_tier_from_the_shared_one(self) -> None:
+        """An embedding cached by another process is read once from the store."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / "embeddings.sqlite3"
+        writer = EmbeddingCache(shared_store=SQLiteEmbeddingStore(path, 60, 10))
+        writer.set_many(MODEL, ["a"], [EMBEDDING])
+        store = SQLiteEmbeddingStore(path, ttl=60, max_entries=10)
+        for shared_store in [writer.shared_store, store]:
+            self.addCleanup(shared_store._connection.close)  # noqa: SLF001
+
+        cache = EmbeddingCache(shared_store=store)
+        with mock.patch.object(store, "get_many", wraps=store.get_many) as get_many:
+            self.assertEqual(cache.get_many(MODEL, ["a"]), [EMBEDDING])
+            self.assertEqual(cache.get_many(MODEL, ["a"]), [EMBEDDING])
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(cache.stats, {"local_hits": 1, "shared_hits": 1, "misses": 0})
+
+    def test_computes_embeddings_when_redis_fails(self) -> None:
+        """Redis errors are cache misses, not failed embedding requests."""
+        store = RedisEmbeddingStore("redis://localhost:6379/1", ttl=60)
+        store.client = mock.Mock()
+        store.client.mget.side_effect = redis.ConnectionError("Connection refused.")
+        store.client.pipeline.side_effect = redis.ConnectionError("Connection refused.")
+        client = FakeOpenAIClient(dimension=3)
+        client.embedding_cache = EmbeddingCache(shared_store=store)
+        with self.assertLogs("rag.cache", "WARNING") as logs:
+            embeddings = client.generate_embeddings(["a", "b"], model=MODEL)
+        self.assertEqual(embeddings, [client.embed(text).tolist() for text in "ab"])
+        self.assertEqual(client.stats["embedded_texts"], 2)
+        self.assertEqual(len(logs.output), 2)
+        # The embeddings are still cached in the local tier.
+        self.assertEqual(client.generate_embeddings(["a"], model=MODEL), embeddings[:1])
+        self.assertEqual(client.stats["embedded_texts"], 2)
+
+
+class SQLiteEmbeddingStoreTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Open a store of at most two entries in a temporary directory."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = SQLiteEmbeddingStore(
+            Path(directory.name) / "embeddings.sqlite3",
+            ttl=60,
+            max_entries=2,
+        )
+        self.addCleanup(self.store._connection.close)  # noqa: SLF001
+        self.now = 1000.0
+        clock = mock.patch("rag.cache.time.time", side_effect=self.tick)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def tick(self) -> float:
+        """Return a time one second later than the previous one."""
+        self.now += 1
+        return self.now
+
+    def test_evicts_the_least_recently_used_entries(self) -> None:
+        """Beyond `max_entries`, the entries read or written the longest ago go."""
+        self.store.set_many({"a": b"1", "b": b"2"})
+        self.store.get_many(["a"])
+        self.store.set_many({"c": b"3"})
+        self.assertEqual(self.store.get_many(["a", "b", "c"]), [b"1", None, b"3"])
+
+    def test_expires_entries_after_the_ttl(self) -> None:
+        """Entries older than the TTL are not returned."""
+        self.store.set_many({"a": b"1"})
+        self.now += 60
+        self.assertEqual(self.store.get_many(["a"]), [None])
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Create a cache; its Redis connection is only used for the version."""
+        self.cache = ResponseCache(threshold=0.95)
+
+    def test_hits_similar_question_about_the_same_entities(self) -> None:
+        """A near-identical question about the same department gets the answer."""
+        entities = query_entities("What is the median salary in IT?", DEPARTMENTS)
+        self.cache.set([1.0, 0.0, 0.0], "IT answer", "v1", entities)
+        self.assertEqual(
+            self.cache.get(
+                [0.99, 0.01, 0.0],
+                "v1",
+                query_entities("what's the median salary in IT", DEPARTMENTS),
+            ),
+            "IT answer",
+        )
+
+    def test_departments_do_not_share_answers(self) -> None:
+        """Questions differing only in the department embed close but don't match."""
+        self.cache.set(
+            [1.0, 0.0, 0.0],
+            "IT answer",
+            "v1",
+            query_entities("median salary in IT", DEPARTMENTS),
+        )
+        self.assertIsNone(
+            self.cache.get(
+                [0.999, 0.001, 0.0],
+                "v1",
+                query_entities("median salary in HR", DEPARTMENTS),
+            ),
+        )
+
+    def test_employees_do_not_share_answers(self) -> None:
+        """Employee_41 and Employee_14 get their own answers."""
+        self.cache.set([1.0, 0.0], "41 answer", "v1", query_entities("Employee_41 salary"))
+        self.cache.set([1.0, 0.1], "14 answer", "v1", query_entities("Employee_14 salary"))
+        # Closest to the Employee_41 question, but only Employee_14's answer matches.
+        self.assertEqual(
+            self.cache.get([1.0, 0.0], "v1", query_entities("Employee_14 salary")),
+            "14 answer",
+        )
+        self.assertIsNone(
+            self.cache.get([1.0, 0.0], "v1", query_entities("Employee_99 salary")),
+        )
+
+    def test_dissimilar_question_misses(self) -> None:
+        """Questions below the similarity threshold miss."""
+        self.cache.set([1.0, 0.0], "answer", "v1", frozenset())
+        self.assertIsNone(self.cache.get([0.0, 1.0], "v1", frozenset()))
+        self.assertEqual(self.cache.stats["misses"], 1)
+
+    def test_new_index_version_drops_answers(self) -> None:
+        """Answers cached against an older index version are not reused."""
+        self.cache.set([1.0, 0.0], "answer", "v1", frozenset())
+        self.assertIsNone(self.cache.get([1.0, 0.0], "v2", frozenset()))
+        self.assertEqual(self.cache.stats["entries"], 0)
+
+    def test_answers_of_a_replaced_version_are_not_cached(self) -> None:
+        """A request finishing after re-indexing leaves the newer answers in place."""
+        self.cache.set([1.0, 0.0], "old answer", "v1", frozenset())
+        self.cache.set([0.0, 1.0], "new answer", "v2", frozenset())
+        self.cache.set([1.0, 0.0], "late answer", "v1", frozenset())
+        self.assertIsNone(self.cache.get([1.0, 0.0], "v1", frozenset()))
+        self.assertIsNone(self.cache.get([1.0, 0.0], "v2", frozenset()))
+        self.assertEqual(self.cache.get([0.0, 1.0], "v2", frozenset()), "new answer")
+        self.assertEqual(self.cache.stats["entries"], 1)
+
+    def test_restored_version_is_cached_again(self) -> None:
+        """Re-indexing back to an earlier dataset caches its answers again."""
+        self.cache.set([1.0, 0.0], "answer", "v1", frozenset())
+        self.cache.set([1.0, 0.0], "answer", "v2", frozenset())
+        # Without Redis, only this process's cache is invalidated.
+        with self.assertLogs("rag.cache", "WARNING"):
+            self.cache.invalidate("v1")
+        self.cache.set([1.0, 0.0], "answer", "v1", frozenset())
+        self.assertEqual(self.cache.get([1.0, 0.0], "v1", frozenset()), "answer")
@@ -0,0 +1,42 @@
+from django.test import SimpleTestCase
+
+from rag.classifier import needs_dataset
+from rag.lexical import LexicalIndex
+
+INDEX = LexicalIndex.build(
+    [
+        ("emp-1", "Employee Record: Name: Employee_1, Department: IT, Salary: $50,000"),
+        ("emp-2", "Employee Record: Name: Ada Lovelace, Department: Finance"),
+    ],
+)
+
+
+class NeedsDatasetTests(SimpleTestCase):
+    def test_routes_domain_questions_to_the_dataset(self) -> None:
+        """Questions about pay, headcounts or staff need the dataset."""
+        for query in [
+            "What is the median salary?",
+            "How many people work here?",
+            "Which colleagues were hired recently?",
+        ]:
+            with self.subTest(query=query):
+                self.assertTrue(needs_dataset(query, INDEX))
+
+    def test_routes_questions_naming_indexed_words_to_the_dataset(self) -> None:
+        """A name or department from the chunks makes a question need the dataset."""
+        self.assertTrue(needs_dataset("Tell me about Ada Lovelace", INDEX))
+        self.assertTrue(needs_dataset("What does IT do?", INDEX))
+
+    def test_leaves_general_questions_to_the_llm(self) -> None:
+        """Questions sharing only function words or numbers with the chunks don't."""
+        for query in [
+            "What is the capital of France?",
+            "Can you explain what it is?",
+            "What is 50 times 2?",
+        ]:
+            with self.subTest(query=query):
+                self.assertFalse(needs_dataset(query, INDEX))
+
+    def test_routes_everything_to_the_dataset_without_an_index(self) -> None:
+        """Without a lexical index, no question can be ruled out."""
+        self.assertTrue(needs_dataset("What is the capital of France?", None))
@@ -0,0 +1,57 @@
+from django.test import SimpleTestCase
+
+from rag.context import CHUNK_SEPARATOR, ContextAssembler, TokenCounter
+
+
+def estimating_counter() -> TokenCounter:
+    """Return a counter estimating four characters per token, as without tiktoken."""
+    counter = TokenCounter.__new__(TokenCounter)
+    counter.encoding = None
+    return counter
+
+
+class TokenCounterTests(SimpleTestCase):
+    def test_estimates_tokens_without_tiktoken(self) -> None:
+        """Partial tokens count as whole ones, so estimates err on the safe side."""
+        counter = estimating_counter()
+        self.assertEqual(counter.count("abcd"), 1)
+        self.assertEqual(counter.count("abcde"), 2)
+        self.assertEqual(counter.truncate("abcdefghij", 2), "abcdefgh")
+
+
+class ContextAssemblerTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Create an assembler with a budget of 10 estimated tokens."""
+        self.counter = estimating_counter()
+        self.assembler = ContextAssembler(max_tokens=10, counter=self.counter)
+
+    def test_keeps_chunks_best_first_within_the_budget(self) -> None:
+        """A chunk that does not fit is skipped, and smaller later ones still fit."""
+        chunks = ["a" * 16, "b" * 40, "c" * 12]
+        context = self.assembler.assemble(chunks)
+        self.assertEqual(context, "a" * 16 + CHUNK_SEPARATOR + "c" * 12)
+        self.assertLessEqual(self.counter.count(context), 10)
+
+    def test_truncates_the_best_chunk_alone(self) -> None:
+        """The best chunk is cut to the budget rather than dropped."""
+        self.assertEqual(self.assembler.assemble(["x" * 100, "y"]), "x" * 40)
+
+    def test_drops_repeated_and_contained_chunks(self) -> None:
+        """Duplicates and chunks within a kept chunk add nothing to the context."""
+        chunks = ["IT salary", "  IT salary  ", "salary", "HR"]
+        self.assertEqual(self.assembler.assemble(chunks), f"IT salary{CHUNK_SEPARATOR}HR")
+
+    def test_drops_chunks_mostly_overlapping_a_kept_one(self) -> None:
+        """Chunks sharing most of their word trigrams with a kept chunk are dropped."""
+        assembler = ContextAssembler(max_tokens=1000, counter=self.counter)
+        kept = "one two three four five six seven eight nine ten eleven"
+        overlapping = "two three four five six seven eight nine ten eleven twelve"
+        distinct = "alpha beta gamma delta"
+        self.assertEqual(
+            assembler.assemble([kept, overlapping, distinct]),
+            f"{kept}{CHUNK_SEPARATOR}{distinct}",
+        )
+
+    def test_skips_empty_chunks(self) -> None:
+        """Blank chunks are not joined into the context."""
+        self.assertEqual(self.assembler.assemble(["", "  ", "HR"]), "HR")
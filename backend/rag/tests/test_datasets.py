@@ -0,0 +1,104 @@
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from rag.datasets import SalaryStats, SalaryStatsAccumulator, iter_dataset_blocks
+
+# Salaries tie for the maximum and the minimum across blocks of two rows.
+EMPLOYEES = pd.DataFrame(
+    {
+        "Name": [f"Employee_{i}" for i in range(1, 8)],
+        "Department": ["Sales", "IT", "IT", "Sales", "HR", "IT", "Sales"],
+        "Salary": [50000, 120000, 70000, 50000, 120000, 120000, 65000],
+    },
+)
+
+
+class IterDatasetBlocksTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Create a temporary directory for datasets."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_reads_csv_in_blocks(self) -> None:
+        """A CSV dataset is read in blocks of at most `block_size` rows."""
+        path = self.directory / "employees.csv"
+        EMPLOYEES.to_csv(path, index=False)
+        blocks = list(iter_dataset_blocks(path, block_size=3))
+        self.assertEqual([len(block) for block in blocks], [3, 3, 1])
+        pd.testing.assert_frame_equal(pd.concat(blocks), EMPLOYEES)
+
+    def test_reads_excel_in_blocks(self) -> None:
+        """An Excel dataset gives the same rows as the frame it was written from."""
+        path = self.directory / "employees.xlsx"
+        EMPLOYEES.to_excel(path, index=False)
+        blocks = list(iter_dataset_blocks(path, block_size=4))
+        self.assertEqual([len(block) for block in blocks], [4, 3])
+        self.assertEqual(pd.concat(blocks)["Name"].tolist(), EMPLOYEES["Name"].tolist())
+
+    def test_rejects_datasets_missing_a_column(self) -> None:
+        """A header without every employee column is rejected before reading rows."""
+        for suffix in [".csv", ".xlsx"]:
+            path = self.directory / f"employees{suffix}"
+            frame = EMPLOYEES.drop(columns="Salary")
+            if suffix == ".csv":
+                frame.to_csv(path, index=False)
+            else:
+                frame.to_excel(path, index=False)
+            with (
+                self.subTest(suffix=suffix),
+                self.assertRaisesMessage(ValueError, "missing required columns: Salary"),
+            ):
+                iter_dataset_blocks(path)
+
+    def test_rejects_unsupported_or_missing_files(self) -> None:
+        """Unknown formats and missing files fail upfront."""
+        with self.assertRaisesMessage(ValueError, "Unsupported dataset format '.json'"):
+            iter_dataset_blocks(self.directory / "employees.json")
+        with self.assertRaises(FileNotFoundError):
+            iter_dataset_blocks(self.directory / "employees.csv")
+
+
+class SalaryStatsAccumulatorTests(SimpleTestCase):
+    def accumulate(self, frame: pd.DataFrame, block_size: int) -> SalaryStatsAccumulator:
+        """Return the statistics of a frame fed in blocks of `block_size` rows."""
+        stats = SalaryStatsAccumulator()
+        for start in range(0, len(frame), block_size):
+            stats.update(frame.iloc[start : start + block_size])
+        return stats
+
+    def assert_stats_of(self, stats: SalaryStats, frame: pd.DataFrame) -> None:
+        """Assert that `stats` are those pandas computes over the whole frame."""
+        max_row = frame.loc[frame["Salary"].idxmax()]
+        min_row = frame.loc[frame["Salary"].idxmin()]
+        self.assertEqual(stats.employee_count, len(frame))
+        self.assertEqual(stats.total_salary, frame["Salary"].sum())
+        self.assertEqual(stats.median_salary, frame["Salary"].median())
+        self.assertEqual(stats.max_salary, max_row["Salary"])
+        self.assertEqual(stats.max_employee, max_row["Name"])
+        self.assertEqual(stats.min_salary, min_row["Salary"])
+        self.assertEqual(stats.min_employee, min_row["Name"])
+
+    def test_blocks_give_the_statistics_of_the_whole_dataset(self) -> None:
+        """Merged block statistics equal a single-frame computation, ties included."""
+        for block_size in [1, 2, 3, len(EMPLOYEES)]:
+            stats = self.accumulate(EMPLOYEES, block_size)
+            with self.subTest(block_size=block_size):
+                self.assert_stats_of(stats.overall(), EMPLOYEES)
+                self.assertEqual(stats.overall().max_dept, "IT")
+                for dept, group in EMPLOYEES.groupby("Department"):
+                    self.assert_stats_of(stats.departments[dept], group)
+
+    def test_counts_employees_without_a_department_overall(self) -> None:
+        """Rows without a department count overall but form no department."""
+        employees = EMPLOYEES.assign(
+            Department=EMPLOYEES["Department"].mask(EMPLOYEES["Name"] == "Employee_2"),
+        )
+        stats = self.accumulate(employees, block_size=2)
+        self.assertEqual(sorted(stats.departments), ["HR", "IT", "Sales"])
+        self.assert_stats_of(stats.overall(), employees)
+        self.assertTrue(np.isnan(stats.overall().max_dept))
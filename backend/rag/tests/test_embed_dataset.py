@@ -0,0 +1,251 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+from django.apps import apps
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from rag.clients import RAGClient
+from rag.fakes import DEFAULT_FAKE_DIMENSION, FakeOpenAIClient, FakePineconeClient
+from rag.management.commands.embed_dataset import Command
+from rag.manifest import EmbeddingManifest
+from rag.namespaces import DEFAULT_NAMESPACE
+
+COMMAND_LOGGER = "rag.management.commands.embed_dataset"
+EMPLOYEES = pd.DataFrame(
+    {
+        "Name": ["Employee_1", "Employee_2", "Employee_3", "Employee_4"],
+        "Department": ["Sales", "IT", "IT", "Sales"],
+        "Salary": [50000, 120000, 70000, 90000],
+    },
+)
+# One chunk per employee, plus the overall and the two department statistics.
+CHUNK_COUNT = len(EMPLOYEES) + 3
+
+
+class FlakyVectorStore(FakePineconeClient):
+    """Fake index failing the upserts of batches containing a given vector.
+
+    The first `failures` upserts of such a batch raise, and the later ones succeed.
+    """
+
+    def __init__(self, failing_id: str, failures: int) -> None:
+        """Initialize an empty index failing upserts of `failing_id`."""
+        super().__init__()
+        self.failing_id = failing_id
+        self.failures = failures
+        self.failed_upserts = 0
+
+    def upsert_vectors(self, vectors: list, namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """Raise for a batch containing the failing vector, until out of failures."""
+        ids = [vector_id for vector_id, *_ in vectors]
+        if self.failing_id in ids and self.failed_upserts < self.failures:
+            self.failed_upserts += 1
+            msg = "Upsert timed out."
+            raise ConnectionError(msg)
+        return super().upsert_vectors(vectors, namespace)
+
+
+class RecordingVectorStore(FakePineconeClient):
+    """Fake index recording the IDs of the vectors upserted and deleted."""
+
+    def __init__(self) -> None:
+        """Initialize an empty index with empty records."""
+        super().__init__()
+        self.upserted_ids = []
+        self.deleted_ids = []
+
+    def upsert_vectors(self, vectors: list, namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """Record and upsert vectors."""
+        self.upserted_ids.extend(vector_id for vector_id, *_ in vectors)
+        return super().upsert_vectors(vectors, namespace)
+
+    def delete_vectors(self, ids: list[str], namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """Record and delete vectors."""
+        self.deleted_ids.extend(ids)
+        return super().delete_vectors(ids, namespace)
+
+    def clear_records(self) -> None:
+        """Forget the vectors upserted and deleted so far."""
+        self.upserted_ids.clear()
+        self.deleted_ids.clear()
+
+
+class EmbedDatasetCommandTestCase(SimpleTestCase):
+    """Runs `embed_dataset` against the local fakes, in a temporary directory."""
+
+    def setUp(self) -> None:
+        """Write a small dataset and point the command's outputs at a temp dir."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.dataset_path = self.directory / "employees.csv"
+        self.manifest_path = self.directory / "employees.manifest.json"
+        EMPLOYEES.to_csv(self.dataset_path, index=False)
+
+        environment = mock.patch.dict(
+            os.environ,
+            {
+                "EMBEDDING_MODEL": "fake-embedding",
+                "EMBEDDING_CACHE_BACKEND": "none",
+                "RESPONSE_CACHE_ENABLED": "false",
+                "EMPLOYEE_TABLE_PATH": str(self.directory / "employee_table.npz"),
+                "LEXICAL_INDEX_PATH": str(self.directory / "lexical_index.npz"),
+            },
+        )
+        environment.start()
+        self.addCleanup(environment.stop)
+        no_backoff = mock.patch(
+            "rag.management.commands.embed_dataset.RETRY_BASE_DELAY_SECONDS",
+            0,
+        )
+        no_backoff.start()
+        self.addCleanup(no_backoff.stop)
+
+    def use_vector_store(self, vector_store: FakePineconeClient) -> None:
+        """Make the RAG app use the fake OpenAI client and `vector_store`."""
+        with self.assertLogs("rag", "INFO"):
+            self.rag_client = RAGClient(
+                openai=FakeOpenAIClient(),
+                vector_store=vector_store,
+            )
+        client = mock.patch.object(
+            apps.get_app_config("rag"),
+            "_rag_client",
+            self.rag_client,
+        )
+        client.start()
+        self.addCleanup(client.stop)
+
+    def embed(self, **options) -> list[str]:
+        """Run the command on the dataset, returning its log messages."""
+        with self.assertLogs(COMMAND_LOGGER, "INFO") as logs:
+            call_command(
+                "embed_dataset",
+                dataset=str(self.dataset_path),
+                manifest=str(self.manifest_path),
+                concurrency=1,
+                **options,
+            )
+        return logs.output
+
+
+class EmbedDatasetRetryTests(EmbedDatasetCommandTestCase):
+    def setUp(self) -> None:
+        """Fail the upserts of the batch with the first employee's vector."""
+        super().setUp()
+        self.failing_id = employee_vector_id("Employee_1")
+
+    def test_retries_a_flaky_upsert(self) -> None:
+        """A batch failing fewer times than the retry limit is upserted."""
+        vector_store = FlakyVectorStore(self.failing_id, failures=2)
+        self.use_vector_store(vector_store)
+        logs = self.embed(upsert_batch_size=2)
+        self.assertEqual(vector_store.failed_upserts, 2)
+        self.assertIn(self.failing_id, vector_store.list_ids())
+        self.assertEqual(vector_store.vector_count, CHUNK_COUNT)
+        self.assertTrue(any("failed (attempt 2/6)" in line for line in logs))
+
+    def test_fails_for_a_batch_failing_every_retry(self) -> None:
+        """The command fails with the number of chunks left out of the index."""
+        vector_store = FlakyVectorStore(self.failing_id, failures=3)
+        self.use_vector_store(vector_store)
+        with self.assertRaisesMessage(CommandError, "2 chunks failed to embed"):
+            self.embed(upsert_batch_size=2, max_retries=2)
+        self.assertEqual(vector_store.failed_upserts, 3)
+        self.assertNotIn(self.failing_id, vector_store.list_ids())
+        self.assertEqual(vector_store.vector_count, CHUNK_COUNT - 2)
+
+
+class IncrementalEmbeddingTests(EmbedDatasetCommandTestCase):
+    def setUp(self) -> None:
+        """Index the dataset with a full run."""
+        super().setUp()
+        self.vector_store = RecordingVectorStore()
+        self.use_vector_store(self.vector_store)
+        self.embed()
+        self.vector_store.clear_records()
+
+    def test_skips_unchanged_chunks(self) -> None:
+        """Without changes to the dataset, nothing is embedded or deleted."""
+        self.embed(incremental=True)
+        self.assertEqual(self.vector_store.upserted_ids, [])
+        self.assertEqual(self.vector_store.deleted_ids, [])
+        self.assertEqual(self.vector_store.vector_count, CHUNK_COUNT)
+
+    def test_reembeds_changed_rows_and_deletes_removed_ones(self) -> None:
+        """Only the changed row and the statistics it moved are embedded again."""
+        employees = EMPLOYEES.copy()
+        employees.loc[employees["Name"] == "Employee_2", "Salary"] = 125000
+        employees = employees[employees["Name"] != "Employee_4"]
+        employees.to_csv(self.dataset_path, index=False)
+
+        self.embed(incremental=True)
+        self.assertEqual(len(self.vector_store.upserted_ids), 4)
+        self.assertEqual(
+            set(self.vector_store.upserted_ids),
+            {
+                employee_vector_id("Employee_2"),
+                "row-overall-data-stats",
+                "row-dept-data-stats-IT",
+                "row-dept-data-stats-Sales",
+            },
+        )
+        self.assertEqual(self.vector_store.deleted_ids, [employee_vector_id("Employee_4")])
+        self.assertEqual(self.vector_store.vector_count, CHUNK_COUNT - 1)
+
+    def test_manifest_tracks_the_index(self) -> None:
+        """The manifest records every indexed vector and versions its content."""
+        manifest = EmbeddingManifest.load(self.manifest_path)
+        self.assertEqual(sorted(manifest.hashes), sorted(self.vector_store.list_ids()))
+        version = manifest.dataset_version
+
+        EMPLOYEES.assign(Salary=EMPLOYEES["Salary"] + 1).to_csv(
+            self.dataset_path,
+            index=False,
+        )
+        self.embed(incremental=True)
+        self.assertNotEqual(
+            EmbeddingManifest.load(self.manifest_path).dataset_version,
+            version,
+        )
+
+    def test_full_run_deletes_vectors_missing_from_the_manifest(self) -> None:
+        """Vectors of this command unknown to the manifest, e.g. row IDs, are stale."""
+        self.vector_store.upsert_vectors(
+            [
+                ("row-emp-7", [0.0] * DEFAULT_FAKE_DIMENSION, {}),
+                ("other-1", [0.0] * DEFAULT_FAKE_DIMENSION, {}),
+            ],
+        )
+        self.embed()
+        self.assertEqual(self.vector_store.deleted_ids, ["row-emp-7"])
+        self.assertIn("other-1", self.vector_store.list_ids())
+
+
+class EmployeeChunkIdTests(SimpleTestCase):
+    def test_ids_do_not_depend_on_row_positions(self) -> None:
+        """An employee keeps their chunk ID when rows are inserted before them."""
+        self.assertEqual(
+            Command.employee_chunk_id("Employee_1"),
+            Command.employee_chunk_id("Employee_1", occurrence=1),
+        )
+        self.assertNotEqual(
+            Command.employee_chunk_id("Employee_1"),
+            Command.employee_chunk_id("Employee_2"),
+        )
+
+    def test_tells_repeated_names_apart(self) -> None:
+        """Each occurrence of a repeated name gets its own stable ID."""
+        first = Command.employee_chunk_id("Employee_1")
+        second = Command.employee_chunk_id("Employee_1", occurrence=2)
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, f"{first}-2")
+
+
+def employee_vector_id(name: str) -> str:
+    """Return the vector ID of the first employee with a name."""
+    return Command.vector_id(Command.employee_chunk_id(name))
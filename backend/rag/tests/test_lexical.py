@@ -0,0 +1,72 @@
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from rag.lexical import LexicalIndex, LexicalIndexBuilder
+
+CHUNKS = [
+    ("emp-1", "Employee: employee_1, Department: Sales, Salary: $50,000.00"),
+    ("emp-2", "Employee: employee_2, Department: IT, Salary: $120,000.00"),
+    ("emp-3", "Employee: employee_3, Department: HR, Salary: $70,000.00"),
+    ("stats-it", "Department Statistics (IT): Median Salary: $105,000.00"),
+]
+
+
+class LexicalIndexBuilderTests(SimpleTestCase):
+    def test_adds_chunks_as_they_are_produced(self) -> None:
+        """Chunks added one at a time keep their IDs, texts and order."""
+        builder = LexicalIndexBuilder()
+        for doc_id, text in CHUNKS:
+            builder.add(doc_id, text)
+        self.assertEqual(len(builder), len(CHUNKS))
+        index = builder.build()
+        self.assertEqual(
+            [(index.doc_id(row), index.text(row)) for row in range(len(index))],
+            CHUNKS,
+        )
+
+    def test_builds_from_an_iterator(self) -> None:
+        """`LexicalIndex.build` reads its chunks from any iterable, once."""
+        index = LexicalIndex.build(iter(CHUNKS))
+        self.assertEqual(len(index), len(CHUNKS))
+        self.assertIn("employee_2", index)
+        self.assertNotIn("finance", index)
+
+    def test_keeps_non_ascii_text(self) -> None:
+        """Texts are stored as UTF-8 and decoded whole."""
+        index = LexicalIndex.build([("x", "Café Müller ✓")])
+        self.assertEqual(index.text(0), "Café Müller ✓")
+        self.assertIn("müller", index)
+
+    def test_builds_an_empty_index(self) -> None:
+        """An index without chunks finds nothing."""
+        index = LexicalIndexBuilder().build()
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.search("salary", 3), [])
+
+
+class LexicalIndexTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Build an index over a few employee and statistics chunks."""
+        self.index = LexicalIndex.build(CHUNKS)
+
+    def test_ranks_chunks_by_bm25(self) -> None:
+        """Chunks with more of the rarer query terms rank first."""
+        rows = self.index.search("IT department statistics", 2)
+        self.assertEqual([self.index.doc_id(row) for row in rows], ["stats-it", "emp-2"])
+
+    def test_finds_exact_entity_matches(self) -> None:
+        """Entity IDs in a query are matched to the chunks naming them."""
+        self.assertEqual(self.index.exact_matches("What does employee_3 earn?", 3), [2])
+        self.assertIsNone(self.index.exact_matches("What does employee_9 earn?", 3))
+        self.assertIsNone(self.index.exact_matches("median salary", 3))
+
+    def test_saves_and_loads(self) -> None:
+        """A saved index loads with the same chunks and rankings."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "lexical_index.npz"
+            self.index.save(path)
+            loaded = LexicalIndex.load(path)
+        self.assertEqual(loaded.text(3), CHUNKS[3][1])
+        self.assertEqual(loaded.search("HR", 3), self.index.search("HR", 3))
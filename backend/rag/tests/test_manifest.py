@@ -0,0 +1,48 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from rag.manifest import EmbeddingManifest, content_hash
+
+
+class EmbeddingManifestTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Create a manifest path in a temporary directory."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "employees.manifest.json"
+
+    def test_saves_and_loads(self) -> None:
+        """A saved manifest loads with the same hashes, leaving no temporary file."""
+        hashes = {"row-a": content_hash("a"), "row-b": content_hash("b")}
+        EmbeddingManifest(self.path, hashes).save()
+        self.assertEqual(EmbeddingManifest.load(self.path).hashes, hashes)
+        self.assertEqual(list(self.path.parent.iterdir()), [self.path])
+
+    def test_keeps_the_previous_manifest_if_a_save_fails(self) -> None:
+        """The manifest is only replaced once the new one is fully written."""
+        EmbeddingManifest(self.path, {"row-a": content_hash("a")}).save()
+        manifest = EmbeddingManifest(self.path, {"row-b": object()})
+        with self.assertRaises(TypeError):
+            manifest.save()
+        self.assertEqual(
+            EmbeddingManifest.load(self.path).hashes,
+            {"row-a": content_hash("a")},
+        )
+
+    def test_loads_missing_or_outdated_manifests_empty(self) -> None:
+        """Without a manifest of the current format, every chunk is new."""
+        self.assertEqual(EmbeddingManifest.load(self.path).hashes, {})
+        self.path.write_text(json.dumps({"format_version": 0, "chunks": {"row-a": "x"}}))
+        self.assertEqual(EmbeddingManifest.load(self.path).hashes, {})
+
+    def test_versions_the_embedded_content(self) -> None:
+        """The dataset version changes with any chunk, not with their order."""
+        hashes = {"row-a": content_hash("a"), "row-b": content_hash("b")}
+        version = EmbeddingManifest(self.path, hashes).dataset_version
+        reordered = dict(reversed(hashes.items()))
+        self.assertEqual(EmbeddingManifest(self.path, reordered).dataset_version, version)
+        changed = {**hashes, "row-b": content_hash("B")}
+        self.assertNotEqual(EmbeddingManifest(self.path, changed).dataset_version, version)
@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from rag.namespaces import DEFAULT_NAMESPACE, namespace_path, validate_namespace
+
+
+class ValidateNamespaceTests(SimpleTestCase):
+    def test_accepts_valid_names(self) -> None:
+        """The default namespace and short slugs are valid."""
+        for namespace in [DEFAULT_NAMESPACE, "acme", "Acme_2024-eu", "a" * 64]:
+            with self.subTest(namespace=namespace):
+                self.assertEqual(validate_namespace(namespace), namespace)
+
+    def test_rejects_invalid_names(self) -> None:
+        """Names that could escape a directory or are too long are rejected."""
+        for namespace in ["../acme", "acme/eu", "-acme", "ac me", "a" * 65]:
+            with self.subTest(namespace=namespace), self.assertRaises(ValueError):
+                validate_namespace(namespace)
+
+
+class NamespacePathTests(SimpleTestCase):
+    def test_keeps_the_default_namespace_path(self) -> None:
+        """Files of the default namespace stay where they were before namespaces."""
+        path = Path("data/employee_table.npz")
+        self.assertEqual(namespace_path(path, DEFAULT_NAMESPACE), path)
+
+    def test_puts_other_namespaces_in_their_own_directory(self) -> None:
+        """Each namespace gets a directory next to the default file."""
+        self.assertEqual(
+            namespace_path("data/employee_table.npz", "acme"),
+            Path("data/namespaces/acme/employee_table.npz"),
+        )
+
+    def test_rejects_invalid_namespaces(self) -> None:
+        """A namespace cannot point outside the namespaces directory."""
+        with self.assertRaises(ValueError):
+            namespace_path("data/employee_table.npz", "..")
@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from rag.resources import NamespaceCache
+
+TIMEOUT = 5
+
+
+class FakeLoader:
+    """Fake resource loader, giving every namespace `nbytes` bytes."""
+
+    def __init__(self, nbytes: int = 100) -> None:
+        """Start without loads."""
+        self.nbytes = nbytes
+        self.loads = []
+
+    def __call__(self, namespace: str) -> SimpleNamespace:
+        """Record a load and return the namespace's resources."""
+        self.loads.append(namespace)
+        return SimpleNamespace(namespace=namespace, nbytes=self.nbytes)
+
+
+class NamespaceCacheTests(SimpleTestCase):
+    def test_loads_each_namespace_once(self) -> None:
+        """Later queries of a namespace reuse its loaded resources."""
+        loader = FakeLoader()
+        cache = NamespaceCache(loader)
+        first = cache.get("acme")
+        self.assertIs(cache.get("acme"), first)
+        self.assertEqual(loader.loads, ["acme"])
+        self.assertEqual(cache.stats, {"hits": 1, "loads": 1, "evictions": 0})
+
+    def test_evicts_least_recently_used_namespaces_beyond_the_budget(self) -> None:
+        """Namespaces queried least recently are dropped first."""
+        cache = NamespaceCache(FakeLoader(nbytes=100), max_bytes=250)
+        cache.get("a")
+        cache.get("b")
+        cache.get("a")
+        with self.assertLogs("rag.resources", "INFO"):
+            cache.get("c")
+        self.assertEqual(list(cache._entries), ["a", "c"])  # noqa: SLF001
+        self.assertEqual(cache.nbytes, 200)
+        self.assertEqual(cache.stats["evictions"], 1)
+
+    def test_keeps_a_namespace_larger_than_the_budget(self) -> None:
+        """The namespace just loaded is kept, even on its own over the budget."""
+        cache = NamespaceCache(FakeLoader(nbytes=1000), max_bytes=250)
+        cache.get("a")
+        with self.assertLogs("rag.resources", "INFO"):
+            cache.get("b")
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get("b").namespace, "b")
+
+    def test_shares_one_load_between_concurrent_queries(self) -> None:
+        """Queries of a namespace being loaded wait for it, unlike other namespaces."""
+        started, release = threading.Event(), threading.Event()
+        loader = FakeLoader()
+
+        def slow_load(namespace: str) -> SimpleNamespace:
+            if namespace == "acme":
+                started.set()
+                release.wait(TIMEOUT)
+            return loader(namespace)
+
+        cache = NamespaceCache(slow_load)
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            first = executor.submit(cache.get, "acme")
+            started.wait(TIMEOUT)
+            others = [executor.submit(cache.get, "acme") for _ in range(3)]
+            warm = executor.submit(cache.get, "other")
+            self.assertEqual(warm.result(TIMEOUT).namespace, "other")
+            release.set()
+            results = [future.result(TIMEOUT) for future in [first, *others]]
+        self.assertEqual(loader.loads.count("acme"), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_retries_a_failed_load(self) -> None:
+        """A load error is raised and not cached, so the next query loads again."""
+        loader = FakeLoader()
+        failures = [OSError("disk")]
+
+        def flaky_load(namespace: str) -> SimpleNamespace:
+            if failures:
+                raise failures.pop()
+            return loader(namespace)
+
+        cache = NamespaceCache(flaky_load)
+        with self.assertRaises(OSError):
+            cache.get("acme")
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get("acme").namespace, "acme")
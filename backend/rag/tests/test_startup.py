@@ -0,0 +1,97 @@
+import json
+import os
+import subprocess
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from rag.apps import RagConfig
+
+IMPORT_TIMES = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        900 | django
+import time:        80 |        300 |   django.conf
+"""
+
+
+class StartupReportTests(SimpleTestCase):
+    def run_report(self, result: subprocess.CompletedProcess) -> str:
+        """Run the report with every startup returning `result`."""
+        output = StringIO()
+        with mock.patch(
+            "rag.management.commands.startup_report.subprocess.run",
+            return_value=result,
+        ):
+            call_command("startup_report", runs=2, stdout=output)
+        return output.getvalue()
+
+    def test_reports_startup_stages_and_imports(self) -> None:
+        """Stage timings and the slowest top-level imports are listed."""
+        stdout = json.dumps(
+            {"settings_ms": 10, "setup_ms": 50, "ready_ms": 1, "client_ms": None},
+        )
+        output = self.run_report(
+            subprocess.CompletedProcess([], 0, stdout=stdout, stderr=IMPORT_TIMES),
+        )
+        self.assertRegex(output, r"django.setup\(\) +50 +50")
+        self.assertNotIn("RAG client first use", output)
+        self.assertRegex(output, r"\n +django +1\n")
+        self.assertNotIn("django.conf", output)
+
+    def test_reports_the_error_of_a_failed_startup(self) -> None:
+        """A failed startup is reported by the last line of its traceback."""
+        stderr = f"{IMPORT_TIMES}Traceback (most recent call last):\nValueError: bad\n"
+        with self.assertRaisesMessage(CommandError, "Startup failed:\nValueError: bad"):
+            self.run_report(subprocess.CompletedProcess([], 1, stdout="", stderr=stderr))
+
+    def test_reports_the_exit_status_without_an_error(self) -> None:
+        """A startup killed without writing an error is reported by its status."""
+        for stderr in ["", IMPORT_TIMES]:
+            with (
+                self.subTest(stderr=stderr),
+                self.assertRaisesMessage(CommandError, "exit status -9"),
+            ):
+                self.run_report(subprocess.CompletedProcess([], -9, "", stderr))
+
+
+class LazyRagClientTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Create an app config of its own, constructing fake RAG clients."""
+        self.app_config = RagConfig("rag", apps.get_app_config("rag").module)
+        patcher = mock.patch("rag.clients.RAGClient")
+        self.rag_client_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        environment = mock.patch.dict(os.environ)
+        environment.start()
+        self.addCleanup(environment.stop)
+        os.environ.pop("RAG_CLIENT_EAGER", None)
+
+    def test_constructs_the_client_on_first_use(self) -> None:
+        """The app is ready without a client, which is built once when used."""
+        self.app_config.ready()
+        self.assertFalse(self.app_config.rag_client_loaded)
+        self.rag_client_class.assert_not_called()
+
+        with self.assertLogs("rag.apps", "INFO"):
+            rag_client = self.app_config.rag_client
+        self.assertIs(self.app_config.rag_client, rag_client)
+        self.assertTrue(self.app_config.rag_client_loaded)
+        self.rag_client_class.assert_called_once_with()
+
+    def test_constructs_the_client_when_ready_if_eager(self) -> None:
+        """With RAG_CLIENT_EAGER, the client is built before the first request."""
+        os.environ["RAG_CLIENT_EAGER"] = "true"
+        with self.assertLogs("rag.apps", "INFO"):
+            self.app_config.ready()
+        self.assertTrue(self.app_config.rag_client_loaded)
+        self.rag_client_class.assert_called_once_with()
+
+    def test_setter_replaces_the_client(self) -> None:
+        """A client set explicitly, e.g. with local fakes, is used as is."""
+        rag_client = mock.Mock()
+        self.app_config.rag_client = rag_client
+        self.assertIs(self.app_config.rag_client, rag_client)
+        self.rag_client_class.assert_not_called()
@@ -0,0 +1,137 @@
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from rag.structured import EmployeeTable, EmployeeTableBuilder, StructuredQueryRouter
+
+EMPLOYEES = pd.DataFrame(
+    {
+        "Name": ["Employee_1", "Employee_2", "Employee_3", "Employee_4", "Employee_5"],
+        "Department": ["Sales", "IT", "HR", "IT", "Sales"],
+        "Salary": [50000, 120000, 70000, 90000, 60000],
+    },
+)
+
+
+class EmployeeTableBuilderTests(SimpleTestCase):
+    def test_builds_the_table_block_by_block(self) -> None:
+        """Blocks give the same columns as the whole dataset, departments sorted."""
+        builder = EmployeeTableBuilder(capacity=1)
+        for start in range(0, len(EMPLOYEES), 2):
+            builder.add(EMPLOYEES.iloc[start : start + 2])
+        table = builder.build()
+        self.assertEqual(table.names.tolist(), EMPLOYEES["Name"].tolist())
+        self.assertEqual(table.departments.tolist(), ["HR", "IT", "Sales"])
+        self.assertEqual(table.dept_codes.tolist(), [2, 1, 0, 1, 2])
+        self.assertEqual(table.salaries.tolist(), EMPLOYEES["Salary"].tolist())
+
+    def test_widens_names_for_longer_ones(self) -> None:
+        """A name longer than those of earlier blocks is kept whole."""
+        builder = EmployeeTableBuilder()
+        builder.add(EMPLOYEES.iloc[:2])
+        builder.add(pd.DataFrame({"Name": ["A much longer name"], **_row("HR", 1)}))
+        self.assertEqual(builder.build().names[-1], "A much longer name")
+
+    def test_builds_an_empty_table(self) -> None:
+        """A dataset without rows gives an empty table with no statistics."""
+        table = EmployeeTable.from_blocks([])
+        self.assertEqual(len(table), 0)
+        self.assertIsNone(table.aggregate("count"))
+
+
+class StructuredQueryRouterTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Save a small employee table for the router to load."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / "employee_table.npz"
+        EmployeeTable.from_blocks([EMPLOYEES]).save(path)
+        self.router = StructuredQueryRouter(path)
+
+    def test_answers_department_statistics(self) -> None:
+        """Statistics over a department are computed exactly."""
+        self.assertEqual(
+            self.router.answer("What is the median salary in IT?"),
+            "The median salary in IT is $105,000.00.",
+        )
+        self.assertEqual(
+            self.router.answer("How many employees are in Sales?"),
+            "There are 2 employees in Sales.",
+        )
+
+    def test_answers_overall_statistics(self) -> None:
+        """Statistics without a department are computed over everyone."""
+        self.assertEqual(
+            self.router.answer("Who has the highest salary?"),
+            "The highest salary overall is $120,000.00, earned by Employee_2 (IT).",
+        )
+
+    def test_answers_employee_lookups(self) -> None:
+        """Questions about a named employee get their department and salary."""
+        self.assertEqual(
+            self.router.answer("What does Employee_3 earn?"),
+            "Employee_3 works in HR with a salary of $70,000.00.",
+        )
+
+    def test_leaves_questions_with_conditions_to_the_llm(self) -> None:
+        """Conditions the router does not parse are not silently ignored."""
+        for query in [
+            "How many employees earn more than $100,000?",
+            "How many employees are not in IT?",
+            "What is the median salary outside of HR?",
+            "How many employees were hired in 2020?",
+            "What is the maximum salary for a Manager?",
+            "What is the average salary of employees under 30?",
+            "What does Employee_3 earn if promoted?",
+        ]:
+            with self.subTest(query=query):
+                self.assertIsNone(self.router.answer(query))
+
+    def test_answers_possessive_lookups(self) -> None:
+        """A possessive name is read as the employee it names."""
+        self.assertEqual(
+            self.router.answer("What is Employee_4's salary?"),
+            "Employee_4 works in IT with a salary of $90,000.00.",
+        )
+
+    def test_answers_who_earns_the_most_or_least(self) -> None:
+        """Most and least ending a question or before a pay term ask for extremes."""
+        self.assertEqual(
+            self.router.answer("Who earns the least?"),
+            "The lowest salary overall is $50,000.00, earned by Employee_1 (Sales).",
+        )
+        self.assertEqual(
+            self.router.answer("Who is the most paid in IT?"),
+            "The highest salary in IT is $120,000.00, earned by Employee_2.",
+        )
+
+    def test_leaves_counts_of_employees_by_salary_to_the_llm(self) -> None:
+        """Counting employees with a given salary is not a headcount."""
+        for query in [
+            "How many employees earn the highest salary?",
+            "How many employees earn the maximum salary in IT?",
+            "How many employees have the lowest pay?",
+            "What do most employees earn?",
+            "What do the least senior employees earn?",
+        ]:
+            with self.subTest(query=query):
+                self.assertIsNone(self.router.answer(query))
+
+    def test_counts_employees_in_total(self) -> None:
+        """Total in a headcount question does not ask for a salary statistic."""
+        self.assertEqual(
+            self.router.answer("How many employees are there in total?"),
+            "There are 5 employees overall.",
+        )
+
+    def test_leaves_unknown_departments_to_the_llm(self) -> None:
+        """A group missing from the dataset does not get the overall answer."""
+        self.assertIsNone(self.router.answer("What is the median salary in Legal?"))
+
+
+def _row(department: str, salary: float) -> dict:
+    """Return the department and salary columns of a one-row block."""
+    return {"Department": [department], "Salary": np.array([salary])}
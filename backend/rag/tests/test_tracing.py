@@ -0,0 +1,160 @@
+import os
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from rag.tracing import (
+    Counter,
+    Histogram,
+    Trace,
+    activate,
+    render_metrics,
+    stage_slos_from_env,
+    timed_stage,
+)
+from rag.views import PROMETHEUS_CONTENT_TYPE
+
+
+class HistogramTests(SimpleTestCase):
+    def test_renders_cumulative_buckets(self) -> None:
+        """Buckets count the values up to their bound, in the Prometheus format."""
+        histogram = Histogram("test_seconds", "Test durations.", ("stage",), (0.1, 1.0))
+        for value in [0.05, 0.1, 0.5, 5.0]:
+            histogram.observe(("embedding",), value)
+        self.assertEqual(
+            histogram.render(),
+            [
+                "# HELP test_seconds Test durations.",
+                "# TYPE test_seconds histogram",
+                'test_seconds_bucket{stage="embedding",le="0.1"} 2',
+                'test_seconds_bucket{stage="embedding",le="1.0"} 3',
+                'test_seconds_bucket{stage="embedding",le="+Inf"} 4',
+                'test_seconds_sum{stage="embedding"} 5.65',
+                'test_seconds_count{stage="embedding"} 4',
+            ],
+        )
+
+    def test_renders_a_series_per_label_value(self) -> None:
+        """Each combination of label values is a series, sorted."""
+        histogram = Histogram("test_seconds", "Test durations.", ("stage",), (1.0,))
+        histogram.observe(("retrieval",), 0.5)
+        histogram.observe(("embedding",), 0.5)
+        buckets = [line for line in histogram.render() if 'le="1.0"' in line]
+        self.assertEqual(
+            buckets,
+            [
+                'test_seconds_bucket{stage="embedding",le="1.0"} 1',
+                'test_seconds_bucket{stage="retrieval",le="1.0"} 1',
+            ],
+        )
+
+
+class CounterTests(SimpleTestCase):
+    def test_renders_escaped_labels(self) -> None:
+        """Quotes, backslashes and newlines in label values are escaped."""
+        counter = Counter("test_total", "Test events.", ("stage",))
+        counter.inc(('a"b\\c\n',))
+        counter.inc(('a"b\\c\n',))
+        self.assertEqual(counter.render()[-1], r'test_total{stage="a\"b\\c\n"} 2')
+
+
+class StageSlosTests(SimpleTestCase):
+    def test_reads_objectives_in_milliseconds(self) -> None:
+        """RAG_STAGE_SLOS_MS gives stage objectives, converted to seconds."""
+        with mock.patch.dict(
+            os.environ,
+            {"RAG_STAGE_SLOS_MS": "time_to_first_token=1500, embedding=300,"},
+        ):
+            self.assertEqual(
+                stage_slos_from_env(),
+                {"time_to_first_token": 1.5, "embedding": 0.3},
+            )
+
+    def test_rejects_unknown_stages(self) -> None:
+        """A typo in a stage name fails loudly instead of never matching."""
+        with (
+            mock.patch.dict(os.environ, {"RAG_STAGE_SLOS_MS": "embeding=300"}),
+            self.assertRaisesMessage(ValueError, "Unknown stage 'embeding'"),
+        ):
+            stage_slos_from_env()
+
+
+class TraceTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Record traces in fresh metrics, with an embedding SLO of 100 ms."""
+        self.stage_durations = Histogram("stages", "", ("stage",), (0.1, 1.0))
+        self.token_rates = Histogram("rates", "", ("source",), (10, 100))
+        self.slo_violations = Counter("violations", "", ("stage",))
+        for name, value in [
+            ("stage_durations", self.stage_durations),
+            ("token_rates", self.token_rates),
+            ("slo_violations", self.slo_violations),
+            ("stage_slos", {"embedding": 0.1}),
+        ]:
+            patcher = mock.patch(f"rag.tracing.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_keeps_only_well_formed_request_ids(self) -> None:
+        """Client request IDs are reused unless they could inject into logs."""
+        self.assertEqual(Trace("abc-123").request_id, "abc-123")
+        self.assertNotEqual(Trace("bad id\n").request_id, "bad id\n")
+
+    def test_records_stages_and_slo_violations_once(self) -> None:
+        """Finishing records every stage, and counts stages over their SLO."""
+        trace = Trace()
+        trace.add("embedding", 0.05)
+        trace.update({"embedding": 0.1, "vector_query": 0.02})
+        trace.add("generation", 2.0)
+        trace.tokens = 41
+        with self.assertLogs("rag.tracing", "INFO") as logs:
+            trace.finish()
+            trace.finish()
+        self.assertIn("exceeded the embedding SLO: 150 ms > 100 ms", logs.output[0])
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(
+            self.slo_violations.render()[-1],
+            'violations{stage="embedding"} 1',
+        )
+        self.assertIn('stages_count{stage="request"} 1', self.stage_durations.render())
+        self.assertIn('rates_sum{source="llm"} 20.0', self.token_rates.render())
+
+    def test_times_stages_of_the_active_trace(self) -> None:
+        """Timed stages go to the active trace, or to the histogram without one."""
+        trace = Trace()
+        with activate(trace), timed_stage("embedding"):
+            pass
+        self.assertIn("embedding", trace.stages)
+        with timed_stage("vector_query"):
+            pass
+        self.assertIn(
+            'stages_count{stage="vector_query"} 1',
+            self.stage_durations.render(),
+        )
+        self.assertNotIn("vector_query", trace.stages)
+
+    def test_renders_slos_with_the_metrics(self) -> None:
+        """The exported metrics include the objectives as a gauge."""
+        self.slo_violations.inc(("embedding",))
+        metrics = render_metrics()
+        self.assertIn('violations{stage="embedding"} 1\n', metrics)
+        self.assertIn('rag_stage_slo_seconds{stage="embedding"} 0.1\n', metrics)
+
+
+@override_settings(METRICS_ALLOWED_IPS=["10.0.0.5"])
+class MetricsViewTests(SimpleTestCase):
+    def test_serves_allowed_addresses(self) -> None:
+        """Allowed addresses get the metrics in the Prometheus text format."""
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.5")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], PROMETHEUS_CONTENT_TYPE)
+        self.assertIn(b"# TYPE rag_stage_duration_seconds histogram", response.content)
+
+    def test_forbids_other_addresses(self) -> None:
+        """Other addresses, even local ones, are refused without metrics."""
+        for address in ["10.0.0.6", "127.0.0.1"]:
+            with self.subTest(address=address), self.assertLogs("django.request"):
+                response = self.client.get(reverse("metrics"), REMOTE_ADDR=address)
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(response.content, b"")
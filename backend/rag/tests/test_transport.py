@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import os
+import time
+from unittest import mock
+
+import httpx
+from django.test import SimpleTestCase
+from urllib3 import PoolManager
+from urllib3.connection import HTTPSConnection
+
+from rag.transport import (
+    CallLatencies,
+    TimedHTTPSConnection,
+    TimedHTTPSConnectionPool,
+    TransportSettings,
+    async_http_client_options,
+    http_client_options,
+    reset_urllib3_connect_ms,
+    time_urllib3_connects,
+    urllib3_connect_ms,
+)
+
+TRANSPORT_VARIABLES = [
+    "HTTP2",
+    "HTTP_MAX_CONNECTIONS",
+    "HTTP_MAX_KEEPALIVE_CONNECTIONS",
+    "HTTP_KEEPALIVE_EXPIRY",
+    "HTTP_CONNECT_TIMEOUT",
+    "OPENAI_EMBEDDING_TIMEOUT",
+    "OPENAI_CHAT_TIMEOUT",
+    "PINECONE_QUERY_TIMEOUT",
+    "PINECONE_UPSERT_TIMEOUT",
+]
+CONNECT_SECONDS = 0.02
+SERVER_SECONDS = 0.03
+
+
+class TransportSettingsTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Unset the transport variables of the environment."""
+        environment = mock.patch.dict(os.environ)
+        environment.start()
+        self.addCleanup(environment.stop)
+        for variable in TRANSPORT_VARIABLES:
+            os.environ.pop(variable, None)
+
+    def test_defaults(self) -> None:
+        """Without variables, the settings are the defaults."""
+        with mock.patch("rag.transport.importlib.util.find_spec", return_value=None):
+            self.assertEqual(TransportSettings.from_env(), TransportSettings())
+
+    def test_reads_the_environment(self) -> None:
+        """Pool sizes, keep-alive and timeouts are read from their variables."""
+        os.environ.update(
+            HTTP_MAX_CONNECTIONS="10",
+            HTTP_MAX_KEEPALIVE_CONNECTIONS="4",
+            HTTP_KEEPALIVE_EXPIRY="30",
+            HTTP_CONNECT_TIMEOUT="1.5",
+            OPENAI_EMBEDDING_TIMEOUT="2",
+            OPENAI_CHAT_TIMEOUT="20",
+            PINECONE_QUERY_TIMEOUT="3",
+            PINECONE_UPSERT_TIMEOUT="15",
+            HTTP2="false",
+        )
+        settings = TransportSettings.from_env()
+        self.assertEqual(
+            settings,
+            TransportSettings(
+                max_connections=10,
+                max_keepalive_connections=4,
+                keepalive_expiry=30.0,
+                http2=False,
+                connect_timeout=1.5,
+                embedding_timeout=2.0,
+                chat_timeout=20.0,
+                query_timeout=3.0,
+                upsert_timeout=15.0,
+            ),
+        )
+        self.assertEqual(settings.limits.keepalive_expiry, 30.0)
+        self.assertEqual(settings.timeout(2.0), httpx.Timeout(2.0, connect=1.5))
+        self.assertEqual(settings.request_timeout(3.0), (1.5, 3.0))
+
+    def test_enables_http2_when_h2_is_installed(self) -> None:
+        """HTTP2=auto enables HTTP/2 only if the `h2` package can be imported."""
+        for spec, http2 in [(object(), True), (None, False)]:
+            with (
+                self.subTest(h2_installed=spec is not None),
+                mock.patch("rag.transport.importlib.util.find_spec", return_value=spec),
+            ):
+                self.assertIs(TransportSettings.from_env().http2, http2)
+
+    def test_explicit_http2_overrides_detection(self) -> None:
+        """HTTP2=true or false is used whether or not `h2` is installed."""
+        with mock.patch("rag.transport.importlib.util.find_spec", return_value=None):
+            os.environ["HTTP2"] = "TRUE"
+            self.assertTrue(TransportSettings.from_env().http2)
+            os.environ["HTTP2"] = "false"
+            self.assertFalse(TransportSettings.from_env().http2)
+
+
+def respond_after_connecting(request: httpx.Request) -> httpx.Response:
+    """Emit the trace events of httpcore for a new connection, then respond."""
+    trace = request.extensions.get("trace")
+    if trace is not None:
+        trace("connection.connect_tcp.started", {})
+        time.sleep(CONNECT_SECONDS)
+        trace("connection.start_tls.complete", {})
+        trace("http11.send_request_headers.started", {})
+    time.sleep(SERVER_SECONDS)
+    return httpx.Response(200, json={})
+
+
+async def arespond_after_connecting(request: httpx.Request) -> httpx.Response:
+    """Asynchronous version of `respond_after_connecting`."""
+    trace = request.extensions.get("trace")
+    if trace is not None:
+        await trace("connection.connect_tcp.started", {})
+        await asyncio.sleep(CONNECT_SECONDS)
+        await trace("connection.start_tls.complete", {})
+        await trace("http11.send_request_headers.started", {})
+    await asyncio.sleep(SERVER_SECONDS)
+    return httpx.Response(200, json={})
+
+
+class CallLatencyTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Record the latencies of API calls in a fresh `CallLatencies`."""
+        # httpx logs every request at INFO.
+        logging.disable(logging.INFO)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.latencies = CallLatencies()
+        patcher = mock.patch("rag.transport.call_latencies", self.latencies)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.options = http_client_options(TransportSettings())
+        del self.options["limits"], self.options["http2"]
+
+    def assert_recorded(self, call: str) -> None:
+        """Assert that one call was recorded with its connect and server times."""
+        [(connect_ms, server_ms)] = self.latencies.samples[call]
+        self.assertGreaterEqual(connect_ms, CONNECT_SECONDS * 1000)
+        self.assertGreaterEqual(server_ms, SERVER_SECONDS * 1000)
+        self.assertLess(connect_ms, server_ms + CONNECT_SECONDS * 1000)
+
+    def test_records_api_calls(self) -> None:
+        """Embedding calls are split into connect and server time."""
+        transport = httpx.MockTransport(respond_after_connecting)
+        with httpx.Client(transport=transport, **self.options) as client:
+            client.post("https://api.openai.com/v1/embeddings")
+        self.assert_recorded("embedding")
+        self.assertEqual(self.latencies.summary()["embedding"]["new_connection_ratio"], 1)
+
+    async def test_records_asynchronous_api_calls(self) -> None:
+        """The hooks of the asynchronous client record chat completions."""
+        options = async_http_client_options(TransportSettings())
+        del options["limits"], options["http2"]
+        transport = httpx.MockTransport(arespond_after_connecting)
+        async with httpx.AsyncClient(transport=transport, **options) as client:
+            await client.post("https://api.openai.com/v1/chat/completions")
+        self.assert_recorded("chat")
+
+    def test_ignores_other_requests(self) -> None:
+        """Requests other than API calls are not traced."""
+        transport = httpx.MockTransport(respond_after_connecting)
+        with httpx.Client(transport=transport, **self.options) as client:
+            client.get("https://api.openai.com/v1/models")
+        self.assertEqual(self.latencies.count, 0)
+
+    def test_summarizes_percentiles(self) -> None:
+        """The summary gives the share of new connections and server percentiles."""
+        for server_ms in range(1, 101):
+            self.latencies.record("chat", 10.0 if server_ms <= 25 else 0.0, server_ms)
+        summary = self.latencies.summary()["chat"]
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual(summary["new_connection_ratio"], 0.25)
+        self.assertAlmostEqual(summary["server_p50_ms"], 50.5)
+
+
+class TimedHTTPSConnectionTests(SimpleTestCase):
+    def test_records_the_connect_time_of_the_thread(self) -> None:
+        """Connect times of urllib3 connections add up until reset."""
+
+        def connect(_connection: HTTPSConnection) -> None:
+            time.sleep(CONNECT_SECONDS)
+
+        reset_urllib3_connect_ms()
+        with mock.patch.object(HTTPSConnection, "connect", connect):
+            TimedHTTPSConnection("pinecone.example").connect()
+            TimedHTTPSConnection("pinecone.example").connect()
+        self.assertGreaterEqual(urllib3_connect_ms(), 2 * CONNECT_SECONDS * 1000)
+        reset_urllib3_connect_ms()
+        self.assertEqual(urllib3_connect_ms(), 0.0)
+
+    def test_times_the_https_pools_of_a_pool_manager(self) -> None:
+        """A timed pool manager opens HTTPS connections with timed connections."""
+        pool_manager = PoolManager()
+        time_urllib3_connects(pool_manager)
+        pool = pool_manager.connection_from_url("https://pinecone.example")
+        self.assertIsInstance(pool, TimedHTTPSConnectionPool)
+        self.assertIs(pool.ConnectionCls, TimedHTTPSConnection)
@@ -0,0 +1,203 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from rag.namespaces import namespace_path
+from rag.vector_stores import IVF_RETRAIN_GROWTH, LocalVectorStore, normalize_rows
+
+DIMENSION = 8
+
+
+class LocalVectorStoreTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Open an empty store in a temporary directory."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "vectors"
+        self.store = LocalVectorStore(self.path, DIMENSION)
+        self.rng = np.random.default_rng(0)
+
+    def vectors(self, count: int) -> np.ndarray:
+        """Return `count` random vectors."""
+        return self.rng.standard_normal((count, DIMENSION)).astype(np.float32)
+
+    def upsert(self, ids: list[str], vectors: np.ndarray, namespace: str = "") -> None:
+        """Upsert vectors, with their ID as metadata."""
+        self.store.upsert_vectors(
+            [
+                (vector_id, vector.tolist(), {"id": vector_id})
+                for vector_id, vector in zip(ids, vectors, strict=True)
+            ],
+            namespace=namespace,
+        )
+
+    def test_finds_upserted_vectors(self) -> None:
+        """A stored vector is its own best match, with its metadata."""
+        vectors = self.vectors(3)
+        self.upsert(["a", "b", "c"], vectors)
+        [match] = self.store.query_index(vectors[1].tolist(), top_k=1)
+        self.assertEqual((match.id, match.metadata), ("b", {"id": "b"}))
+        self.assertAlmostEqual(match.score, 1.0, places=5)
+
+    def test_overwrites_vectors_with_the_same_id(self) -> None:
+        """Upserting an existing ID replaces its vector in place."""
+        first, second = self.vectors(2)
+        self.upsert(["a"], [first])
+        self.upsert(["a"], [second])
+        self.assertEqual(self.store.vector_count, 1)
+        [match] = self.store.query_index(second.tolist(), top_k=3)
+        self.assertAlmostEqual(match.score, 1.0, places=5)
+
+    def test_deletes_vectors_and_reuses_their_rows(self) -> None:
+        """Deleted vectors are never matched, and their rows are recycled."""
+        vectors = self.vectors(3)
+        self.upsert(["a", "b", "c"], vectors)
+        self.store.delete_vectors(["b", "missing"])
+        matches = self.store.query_index(vectors[1].tolist(), top_k=3)
+        self.assertEqual(sorted(match.id for match in matches), ["a", "c"])
+        self.upsert(["d"], self.vectors(1))
+        self.assertEqual(self.store.vector_count, 3)
+        self.store.flush()
+        index = json.loads((self.path / LocalVectorStore.index_file).read_text())
+        self.assertEqual(index["size"], 3)
+
+    def test_keeps_namespaces_apart(self) -> None:
+        """Each namespace is a store of its own, in its own directory."""
+        vectors = self.vectors(2)
+        self.upsert(["a"], vectors[:1])
+        self.upsert(["b"], vectors[1:], namespace="acme")
+        matches = self.store.query_index(vectors[1].tolist(), top_k=3)
+        self.assertEqual([match.id for match in matches], ["a"])
+        matches = self.store.query_index(vectors[1].tolist(), top_k=3, namespace="acme")
+        self.assertEqual([match.id for match in matches], ["b"])
+        self.assertEqual(self.store.list_ids(namespace="acme"), ["b"])
+        self.assertEqual(
+            self.store.namespace("acme").path,
+            namespace_path(self.path, "acme"),
+        )
+
+    def test_lists_ids_by_prefix(self) -> None:
+        """Only the IDs starting with the prefix are listed."""
+        self.upsert(["row-a", "row-b", "other"], self.vectors(3))
+        self.assertEqual(sorted(self.store.list_ids(prefix="row-")), ["row-a", "row-b"])
+        self.assertEqual(len(self.store.list_ids()), 3)
+
+    def test_persists_across_reopening(self) -> None:
+        """Flushed vectors, IDs and metadata are read back by a new store."""
+        vectors = self.vectors(3)
+        self.upsert(["a", "b", "c"], vectors)
+        self.upsert(["b", "d"], self.vectors(2), namespace="acme")
+        self.store.delete_vectors(["c"])
+        self.store.flush()
+        self.assertTrue((self.path / LocalVectorStore.index_file).exists())
+
+        reopened = LocalVectorStore(self.path, DIMENSION)
+        self.assertEqual(sorted(reopened.list_ids()), ["a", "b"])
+        [match] = reopened.query_index(vectors[0].tolist(), top_k=1)
+        self.assertEqual((match.id, match.metadata), ("a", {"id": "a"}))
+        self.assertEqual(sorted(reopened.list_ids(namespace="acme")), ["b", "d"])
+
+    def test_rejects_a_store_of_another_dimension(self) -> None:
+        """Opening a store with the wrong dimension fails instead of misreading it."""
+        self.upsert(["a"], self.vectors(1))
+        self.store.flush()
+        with self.assertRaisesMessage(ValueError, f"has dimension {DIMENSION}"):
+            LocalVectorStore(self.path, DIMENSION + 1)
+
+    def test_scores_every_row_block_by_block(self) -> None:
+        """Exact search over several blocks gives the brute-force top k."""
+        vectors = self.vectors(50)
+        self.upsert([f"v{i}" for i in range(50)], vectors)
+        self.store.delete_vectors(["v7", "v21"])
+        queries = self.vectors(4)
+        with mock.patch("rag.vector_stores.QUERY_BLOCK_ROWS", 7):
+            results = self.store.query_many(queries.tolist(), top_k=5)
+
+        scores = normalize_rows(queries) @ normalize_rows(vectors).T
+        scores[:, [7, 21]] = -np.inf
+        for query_scores, matches in zip(scores, results, strict=True):
+            expected = [f"v{row}" for row in np.argsort(-query_scores)[:5]]
+            self.assertEqual([match.id for match in matches], expected)
+
+    def test_returns_fewer_matches_than_top_k_when_small(self) -> None:
+        """Queries on a store smaller than `top_k` return every vector."""
+        self.upsert(["a", "b"], self.vectors(2))
+        self.assertEqual(len(self.store.query_index(self.vectors(1)[0].tolist(), 5)), 2)
+
+
+class IVFIndexTests(SimpleTestCase):
+    def setUp(self) -> None:
+        """Open an IVF store holding clustered vectors, and train its index."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "vectors"
+        self.rng = np.random.default_rng(0)
+        self.store = LocalVectorStore(self.path, DIMENSION, index_type="ivf", nlist=16)
+        self.upsert(self.clustered_vectors(2000))
+        self.store.train_index()
+
+    def clustered_vectors(self, count: int) -> np.ndarray:
+        """Return `count` vectors scattered around a few cluster centers."""
+        centers = self.rng.standard_normal((20, DIMENSION))
+        labels = self.rng.integers(len(centers), size=count)
+        noise = 0.3 * self.rng.standard_normal((count, DIMENSION))
+        return (centers[labels] + noise).astype(np.float32)
+
+    def upsert(self, vectors: np.ndarray) -> None:
+        """Upsert vectors with IDs following those already stored."""
+        start = self.store.vector_count
+        self.store.upsert_vectors(
+            [(f"v{start + i}", vector.tolist()) for i, vector in enumerate(vectors)],
+        )
+
+    def top_ids(self, queries: np.ndarray, *, exact: bool = False) -> list[list[str]]:
+        """Return the IDs of the top 10 matches of each query."""
+        results = self.store.query_many(queries.tolist(), top_k=10, exact=exact)
+        return [[match.id for match in matches] for matches in results]
+
+    def test_probing_every_partition_is_exact(self) -> None:
+        """With `nprobe` equal to the partition count, IVF returns the exact top k."""
+        queries = self.clustered_vectors(20)
+        self.store.ivf.nprobe = self.store.ivf.nlist
+        self.assertEqual(self.top_ids(queries), self.top_ids(queries, exact=True))
+
+    def test_recall_at_the_default_nprobe(self) -> None:
+        """Probing the default partitions finds nearly all of the exact top k."""
+        queries = self.clustered_vectors(50)
+        approximate = self.top_ids(queries)
+        exact = self.top_ids(queries, exact=True)
+        found = sum(
+            len(set(ids) & set(exact_ids))
+            for ids, exact_ids in zip(approximate, exact, strict=True)
+        )
+        self.assertGreaterEqual(found / (10 * len(queries)), 0.9)
+
+    def test_trains_on_flush_from_the_minimum_size(self) -> None:
+        """A store is trained on flush once it holds `IVF_MIN_TRAIN_SIZE` vectors."""
+        store = LocalVectorStore(self.path / "other", DIMENSION, index_type="ivf")
+        store.upsert_vectors([("a", self.clustered_vectors(1)[0].tolist())])
+        with mock.patch("rag.vector_stores.IVF_MIN_TRAIN_SIZE", 2):
+            store.flush()
+            self.assertFalse(store.ivf.is_trained)
+            store.upsert_vectors([("b", self.clustered_vectors(1)[0].tolist())])
+            store.flush()
+        self.assertTrue(store.ivf.is_trained)
+        self.assertEqual(store.ivf.trained_size, 2)
+
+    def test_retrains_once_the_store_outgrows_the_index(self) -> None:
+        """Flushing retrains the index after the store grows past its training size."""
+        self.store.flush()
+        self.assertEqual(self.store.ivf.trained_size, 2000)
+        self.upsert(self.clustered_vectors(1000))
+        self.store.flush()
+        self.assertEqual(self.store.ivf.trained_size, 2000)
+        self.upsert(self.clustered_vectors(2000 * (IVF_RETRAIN_GROWTH - 1) - 1000))
+        self.store.flush()
+        self.assertEqual(self.store.ivf.trained_size, 2000 * IVF_RETRAIN_GROWTH)
+
+        reopened = LocalVectorStore(self.path, DIMENSION, index_type="ivf", nlist=16)
+        self.assertEqual(reopened.ivf.trained_size, 2000 * IVF_RETRAIN_GROWTH)
@@ -0,0 +1,315 @@
+"""Per-stage latency tracing of chat requests, exported as Prometheus histograms."""
+
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Request IDs sent by clients are kept only if they look like IDs.
+REQUEST_ID_PATTERN = re.compile(r"[\w.:-]{1,64}")
+
+# Upper bounds, in seconds, of the stage duration buckets.
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)  # fmt: skip
+# Upper bounds, in tokens per second, of the generation rate buckets.
+TOKEN_RATE_BUCKETS = (5, 10, 20, 30, 40, 50, 60, 80, 100, 150, 200)
+
+# Stages of a chat request, in the order they happen.
+STAGES = {
+    "db_write": "Saving the user message.",
+    "ready_lookup": "Looking up a structured or cached answer.",
+    "enqueue": "Submitting the retrieval, e.g. publishing the Celery task.",
+    "queue_wait": "From submitting the retrieval until a worker starts it.",
+    "embedding": "Embedding the query.",
+    "vector_query": "Querying the vector store.",
+    "retrieval": "Retrieving and assembling the context, in the worker.",
+    "polling_delay": "From the context being ready until the view receives it.",
+    "context_wait": "From submitting the retrieval until the view receives it.",
+    "time_to_first_token": "From the request until the first answer token.",
+    "generation": "From the first answer token until the last one.",
+    "db_write_response": "Saving the answer.",
+    "request": "The whole request, until the stream ends.",
+}
+
+
+class Histogram:
+    """Cumulative histogram with one series per combination of label values."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...],
+        buckets: tuple[float, ...],
+    ) -> None:
+        """Initialize an empty histogram with the given bucket upper bounds."""
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: tuple[str, ...], value: float) -> None:
+        """Record a value in the series of `label_values`."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self) -> list[str]:
+        """Return the histogram in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = {
+                label_values: (list(counts), count, total)
+                for label_values, (counts, count, total) in sorted(self._series.items())
+            }
+        for label_values, (counts, count, total) in series.items():
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts, strict=True):
+                cumulative += bucket_count
+                lines.append(
+                    f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}',
+                )
+            lines.extend(
+                (
+                    f'{self.name}_bucket{{{labels},le="+Inf"}} {count}',
+                    f"{self.name}_sum{{{labels}}} {total}",
+                    f"{self.name}_count{{{labels}}} {count}",
+                ),
+            )
+        return lines
+
+
+class Counter:
+    """Monotonic counter with one series per combination of label values."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...]) -> None:
+        """Initialize a counter with no series."""
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values: tuple[str, ...]) -> None:
+        """Increment the series of `label_values`."""
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + 1
+
+    def render(self) -> list[str]:
+        """Return the counter in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            series = sorted(self._series.items())
+        lines.extend(
+            f"{self.name}{{{_format_labels(self.labels, label_values)}}} {value}"
+            for label_values, value in series
+        )
+        return lines
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    """Format label pairs, escaping the values."""
+    return ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"),
+        )
+        for name, value in zip(names, values, strict=True)
+    )
+
+
+def stage_slos_from_env() -> dict[str, float]:
+    """Return the stage latency objectives, in seconds, set by RAG_STAGE_SLOS_MS.
+
+    The variable lists `stage=milliseconds` pairs separated by commas, e.g.
+    `time_to_first_token=1500,embedding=300`.
+    """
+    slos = {}
+    for item in os.getenv("RAG_STAGE_SLOS_MS", "").split(","):
+        if not item.strip():
+            continue
+        stage, _, threshold = item.partition("=")
+        stage = stage.strip()
+        if stage not in STAGES:
+            msg = f"Unknown stage '{stage}' in RAG_STAGE_SLOS_MS."
+            raise ValueError(msg)
+        slos[stage] = float(threshold) / 1000
+    return slos
+
+
+stage_durations = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each stage of a chat request.",
+    ("stage",),
+    DURATION_BUCKETS,
+)
+token_rates = Histogram(
+    "rag_generation_tokens_per_second",
+    "Rate at which answer tokens were generated, after the first one.",
+    ("source",),
+    TOKEN_RATE_BUCKETS,
+)
+api_call_durations = Histogram(
+    "rag_api_call_duration_seconds",
+    "Time spent connecting to the OpenAI and Pinecone APIs, and waiting on them.",
+    ("call", "phase"),
+    DURATION_BUCKETS,
+)
+slo_violations = Counter(
+    "rag_stage_slo_violations_total",
+    "Requests in which a stage took longer than its latency objective.",
+    ("stage",),
+)
+stage_slos = stage_slos_from_env()
+
+
+class Trace:
+    """Stage timings of one request, identified by its request ID.
+
+    The view owns the trace of a request and records it once the response ends.
+    Retrieval gets a trace of its own, in the Celery worker or pool thread, and
+    its stages are sent back with the context and added to the request's trace.
+    """
+
+    def __init__(self, request_id: str | None = None) -> None:
+        """Initialize a trace starting now, generating a request ID if needed."""
+        if request_id is None or not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.started_at = time.perf_counter()
+        self.stages = {}
+        self.tokens = 0
+        self._finished = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the code run within the block as a stage."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started_at)
+
+    def add(self, name: str, seconds: float) -> None:
+        """Add time to a stage."""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def update(self, stages: dict[str, float]) -> None:
+        """Add the stages of another trace, e.g. of the retrieval."""
+        for name, seconds in stages.items():
+            self.add(name, seconds)
+
+    def elapsed(self) -> float:
+        """Return the seconds since the request started."""
+        return time.perf_counter() - self.started_at
+
+    def finish(self, source: str = "llm") -> None:
+        """Record the stages in the histograms, checking them against their SLOs.
+
+        Only the first call records anything, so a trace can be finished from a
+        `finally` block that may run again on disconnect.
+        """
+        if self._finished:
+            return
+        self._finished = True
+        self.add("request", self.elapsed())
+        for name, seconds in self.stages.items():
+            stage_durations.observe((name,), seconds)
+            slo = stage_slos.get(name)
+            if slo is not None and seconds > slo:
+                slo_violations.inc((name,))
+                logger.warning(
+                    "Request %s exceeded the %s SLO: %.0f ms > %.0f ms.",
+                    self.request_id,
+                    name,
+                    seconds * 1000,
+                    slo * 1000,
+                )
+        generation = self.stages.get("generation")
+        if generation and self.tokens > 1:
+            token_rates.observe((source,), (self.tokens - 1) / generation)
+
+        logger.info(
+            "Request %s: %s.",
+            self.request_id,
+            ", ".join(
+                f"{name} {self.stages[name] * 1000:.0f} ms"
+                for name in STAGES
+                if name in self.stages
+            ),
+        )
+
+
+_current_trace = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def activate(trace: Trace) -> Iterator[Trace]:
+    """Make `trace` receive the stages timed by `timed_stage` within the block."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def timed_stage(name: str) -> Iterator[None]:
+    """Time a stage of the active trace.
+
+    Without one, e.g. in a batch of several requests' queries, the time is
+    recorded in the stage histogram directly.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        with trace.stage(name):
+            yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_durations.observe((name,), time.perf_counter() - started_at)
+
+
+def render_metrics() -> str:
+    """Return all metrics of this process in the Prometheus text format."""
+    lines = []
+    for metric in (stage_durations, token_rates, api_call_durations, slo_violations):
+        lines.extend(metric.render())
+    lines.extend(
+        (
+            "# HELP rag_stage_slo_seconds Latency objective of each stage.",
+            "# TYPE rag_stage_slo_seconds gauge",
+        ),
+    )
+    lines.extend(
+        f"rag_stage_slo_seconds{{{_format_labels(('stage',), (stage,))}}} {slo}"
+        for stage, slo in stage_slos.items()
+    )
+    return "\n".join(lines) + "\n"
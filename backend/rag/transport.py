@@ -0,0 +1,287 @@
+"""Pooled HTTP transports for the API clients, and per-call latency breakdowns."""
+
+import importlib.util
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+
+import httpx
+import numpy as np
+from urllib3 import PoolManager
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
+
+from rag.tracing import api_call_durations
+
+logger = logging.getLogger(__name__)
+
+# Calls kept per type for the latency breakdown, and how often it is logged.
+LATENCY_WINDOW = 1000
+LATENCY_LOG_EVERY = 500
+
+# API paths, by suffix, and the call type their latencies are recorded under.
+CALL_TYPES = {"/embeddings": "embedding", "/chat/completions": "chat"}
+
+
+@dataclass
+class TransportSettings:
+    """Connection pool, keep-alive and timeout settings of the API clients.
+
+    httpx closes connections idle for 5 seconds by default, so a request after a
+    short pause pays for a new TCP and TLS handshake. Keeping them for
+    `keepalive_expiry` seconds avoids that on hot paths with bursty traffic.
+    """
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 120.0
+    http2: bool = False
+    connect_timeout: float = 5.0
+    embedding_timeout: float = 10.0
+    chat_timeout: float = 60.0
+    query_timeout: float = 5.0
+    upsert_timeout: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "TransportSettings":
+        """Build the settings configured by the HTTP_* and *_TIMEOUT variables.
+
+        HTTP2 is `auto` by default, enabling HTTP/2 when the `h2` package is
+        installed. Pinecone's client only speaks HTTP/1.1.
+        """
+        http2 = os.getenv("HTTP2", "auto").lower()
+        if http2 == "auto":
+            http2 = importlib.util.find_spec("h2") is not None
+        else:
+            http2 = http2 == "true"
+        defaults = cls()
+        return cls(
+            max_connections=int(
+                os.getenv("HTTP_MAX_CONNECTIONS", defaults.max_connections),
+            ),
+            max_keepalive_connections=int(
+                os.getenv(
+                    "HTTP_MAX_KEEPALIVE_CONNECTIONS",
+                    defaults.max_keepalive_connections,
+                ),
+            ),
+            keepalive_expiry=float(
+                os.getenv("HTTP_KEEPALIVE_EXPIRY", defaults.keepalive_expiry),
+            ),
+            http2=http2,
+            connect_timeout=float(
+                os.getenv("HTTP_CONNECT_TIMEOUT", defaults.connect_timeout),
+            ),
+            embedding_timeout=float(
+                os.getenv("OPENAI_EMBEDDING_TIMEOUT", defaults.embedding_timeout),
+            ),
+            chat_timeout=float(os.getenv("OPENAI_CHAT_TIMEOUT", defaults.chat_timeout)),
+            query_timeout=float(
+                os.getenv("PINECONE_QUERY_TIMEOUT", defaults.query_timeout),
+            ),
+            upsert_timeout=float(
+                os.getenv("PINECONE_UPSERT_TIMEOUT", defaults.upsert_timeout),
+            ),
+        )
+
+    @property
+    def limits(self) -> httpx.Limits:
+        """Return the connection pool limits of the httpx clients."""
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self, read: float) -> httpx.Timeout:
+        """Return the timeout of a call type, reading for at most `read` seconds."""
+        return httpx.Timeout(read, connect=self.connect_timeout)
+
+    def request_timeout(self, read: float) -> tuple[float, float]:
+        """Return the `(connect, read)` timeout of a call type for urllib3."""
+        return self.connect_timeout, read
+
+
+class CallLatencies:
+    """Latency breakdowns of recent API calls, per call type.
+
+    Each call is split into the time spent connecting (TCP and TLS, zero on a
+    reused connection) and the server time, from sending the request to receiving
+    the response headers. For streamed chat completions, the server time is the
+    time to the first byte of the stream. Calls are also recorded in the
+    `rag_api_call_duration_seconds` histogram.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        """Initialize latencies keeping the last `window` calls per type."""
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, call: str, connect_ms: float, server_ms: float) -> None:
+        """Record a call, logging a summary every so often."""
+        api_call_durations.observe((call, "connect"), connect_ms / 1000)
+        api_call_durations.observe((call, "server"), server_ms / 1000)
+        with self._lock:
+            self.samples[call].append((connect_ms, server_ms))
+            self.count += 1
+            log_summary = self.count % LATENCY_LOG_EVERY == 0
+        if log_summary:
+            for summary_call, summary in self.summary().items():
+                logger.info(
+                    "%s calls over %d requests: %.0f%% new connections, connect p99 "
+                    "%.0f ms; server p50 %.0f ms, p99 %.0f ms.",
+                    summary_call,
+                    summary["count"],
+                    summary["new_connection_ratio"] * 100,
+                    summary["connect_p99_ms"],
+                    summary["server_p50_ms"],
+                    summary["server_p99_ms"],
+                )
+
+    def summary(self) -> dict[str, dict]:
+        """Return the count, share of new connections and percentiles per type."""
+        with self._lock:
+            samples = {call: list(samples) for call, samples in self.samples.items()}
+        summary = {}
+        for call, call_samples in samples.items():
+            connects = np.array([connect for connect, _ in call_samples])
+            servers = np.array([server for _, server in call_samples])
+            summary[call] = {
+                "count": len(call_samples),
+                "new_connection_ratio": float(np.mean(connects > 0)),
+                "connect_p50_ms": float(np.percentile(connects, 50)),
+                "connect_p99_ms": float(np.percentile(connects, 99)),
+                "server_p50_ms": float(np.percentile(servers, 50)),
+                "server_p99_ms": float(np.percentile(servers, 99)),
+            }
+        return summary
+
+
+call_latencies = CallLatencies()
+
+
+class RequestTrace:
+    """Collects httpcore trace events of a request into a latency breakdown."""
+
+    def __init__(self) -> None:
+        """Initialize an empty trace."""
+        self.connect_ms = 0.0
+        self.sent_at = None
+        self._connect_started_at = None
+
+    def __call__(self, event: str, _info: dict) -> None:
+        """Handle a trace event from a synchronous transport."""
+        now = time.perf_counter()
+        if event == "connection.connect_tcp.started":
+            self._connect_started_at = now
+        elif event in ("connection.start_tls.complete", "connection.connect_tcp.complete"):
+            if self._connect_started_at is not None:
+                self.connect_ms = (now - self._connect_started_at) * 1000
+        elif event.endswith(".send_request_headers.started") and self.sent_at is None:
+            self.sent_at = now
+
+    async def atrace(self, event: str, info: dict) -> None:
+        """Handle a trace event from an asynchronous transport."""
+        self(event, info)
+
+    def server_ms(self) -> float:
+        """Return the time from sending the request until now."""
+        if self.sent_at is None:
+            return 0.0
+        return (time.perf_counter() - self.sent_at) * 1000
+
+
+def _call_type(request: httpx.Request) -> str | None:
+    """Return the call type of an API request, if its latency is recorded."""
+    for suffix, call in CALL_TYPES.items():
+        if request.url.path.endswith(suffix):
+            return call
+    return None
+
+
+def _start_trace(request: httpx.Request, *, asynchronous: bool) -> None:
+    """Attach a trace to a request whose latency is recorded."""
+    if _call_type(request) is not None:
+        trace = RequestTrace()
+        request.extensions["trace"] = trace.atrace if asynchronous else trace
+        request.extensions["latency_trace"] = trace
+
+
+def _finish_trace(response: httpx.Response) -> None:
+    """Record the latency breakdown of a request once its headers arrived."""
+    trace = response.request.extensions.get("latency_trace")
+    if trace is not None:
+        call_latencies.record(
+            _call_type(response.request),
+            trace.connect_ms,
+            trace.server_ms(),
+        )
+
+
+def http_client_options(settings: TransportSettings) -> dict:
+    """Return the options of a synchronous httpx client for the OpenAI SDK."""
+    return {
+        "limits": settings.limits,
+        "http2": settings.http2,
+        "event_hooks": {
+            "request": [lambda request: _start_trace(request, asynchronous=False)],
+            "response": [_finish_trace],
+        },
+    }
+
+
+def async_http_client_options(settings: TransportSettings) -> dict:
+    """Return the options of an asynchronous httpx client for the OpenAI SDK."""
+
+    async def start_trace(request: httpx.Request) -> None:
+        _start_trace(request, asynchronous=True)
+
+    async def finish_trace(response: httpx.Response) -> None:
+        _finish_trace(response)
+
+    return {
+        "limits": settings.limits,
+        "http2": settings.http2,
+        "event_hooks": {"request": [start_trace], "response": [finish_trace]},
+    }
+
+
+# Time spent opening connections by the urllib3 calls of the current thread.
+_urllib3_connects = threading.local()
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    """urllib3 connection recording the time spent connecting in this thread."""
+
+    def connect(self) -> None:
+        """Open the connection, including the TLS handshake."""
+        started_at = time.perf_counter()
+        super().connect()
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        _urllib3_connects.ms = urllib3_connect_ms() + elapsed_ms
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+def time_urllib3_connects(pool_manager: PoolManager) -> None:
+    """Make a urllib3 pool manager record the time its HTTPS connections take."""
+    pool_manager.pool_classes_by_scheme = {
+        **pool_manager.pool_classes_by_scheme,
+        "https": TimedHTTPSConnectionPool,
+    }
+
+
+def urllib3_connect_ms() -> float:
+    """Return the time the current thread spent opening urllib3 connections."""
+    return getattr(_urllib3_connects, "ms", 0.0)
+
+
+def reset_urllib3_connect_ms() -> None:
+    """Reset the connect time of the current thread, before a call."""
+    _urllib3_connects.ms = 0.0
@@ -0,0 +1,591 @@
+"""Vector store interface and a local, in-process implementation."""
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from rag.namespaces import DEFAULT_NAMESPACE, namespace_path
+
+# Rows scored at a time, bounding the memory of a brute-force query.
+QUERY_BLOCK_ROWS = 65_536
+INITIAL_CAPACITY = 1024
+# Single queries run at once by stores without a batch query.
+MAX_CONCURRENT_QUERIES = 64
+
+DEFAULT_IVF_NPROBE = 8
+# Below this many vectors, exact search is fast enough and IVF is not trained.
+IVF_MIN_TRAIN_SIZE = 10_000
+# The IVF index is retrained once the store grows this many times past its training.
+IVF_RETRAIN_GROWTH = 2
+IVF_TRAINING_POINTS_PER_LIST = 64
+KMEANS_ITERATIONS = 10
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Return the vectors scaled to unit length."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+@dataclass
+class VectorMatch:
+    """A query match, mirroring the fields of a Pinecone match."""
+
+    id: str
+    score: float
+    metadata: dict = field(default_factory=dict)
+
+
+class BaseVectorStore:
+    """Interface shared by the vector stores that back `RAGClient`.
+
+    Vectors are scoped by namespace: queries only match vectors upserted to the
+    same namespace.
+    """
+
+    def query_index(
+        self,
+        vector: list[float],
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> list:
+        """Return the `top_k` matches closest to `vector`, best first."""
+        raise NotImplementedError
+
+    def query_many(
+        self,
+        vectors: list[list[float]],
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> list[list]:
+        """Return the `top_k` matches for each query vector.
+
+        Stores without a batch query run the single queries concurrently.
+        """
+        if len(vectors) == 1:
+            return [self.query_index(vectors[0], top_k=top_k, namespace=namespace)]
+        workers = min(len(vectors), MAX_CONCURRENT_QUERIES)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(
+                    lambda v: self.query_index(v, top_k=top_k, namespace=namespace),
+                    vectors,
+                ),
+            )
+
+    def upsert_vectors(self, vectors: list, namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """Insert or update `(id, values, metadata)` vectors."""
+        raise NotImplementedError
+
+    def delete_vectors(self, ids: list[str], namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """Delete vectors by ID."""
+        raise NotImplementedError
+
+    def list_ids(self, prefix: str = "", namespace: str = DEFAULT_NAMESPACE) -> list[str]:
+        """Return the IDs of the vectors starting with `prefix`.
+
+        Stores that can't list their vectors raise NotImplementedError.
+        """
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Persist pending writes. Remote stores persist on every write."""
+
+    def create_index(self) -> bool:
+        """Create the index if the store needs one, returning whether it did.
+
+        Stores that create their storage on first write need no bootstrap.
+        """
+        return False
+
+
+class IVFIndex:
+    """Inverted file (IVF) index over the rows of a `LocalVectorStore`.
+
+    Rows are partitioned by their nearest spherical k-means centroid. A query only
+    scores the rows of its `nprobe` closest partitions, so raising `nprobe` trades
+    latency for recall. New rows are assigned to the nearest existing centroid, so
+    `LocalVectorStore` retrains the index once it outgrows its training size.
+    """
+
+    index_file = "ivf.npz"
+
+    def __init__(self, nlist: int | None = None, nprobe: int = DEFAULT_IVF_NPROBE) -> None:
+        """Initialize an untrained index.
+
+        Without `nlist`, the number of partitions is derived from the training size.
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = None
+        self.assignments = np.full(0, -1, dtype=np.int32)
+        self.trained_size = 0
+        self._lists = None
+
+    @property
+    def is_trained(self) -> bool:
+        """Whether the centroids have been trained."""
+        return self.centroids is not None
+
+    def resize(self, capacity: int) -> None:
+        """Grow the row assignments to `capacity` rows."""
+        if capacity > len(self.assignments):
+            self.assignments = np.concatenate(
+                [
+                    self.assignments,
+                    np.full(capacity - len(self.assignments), -1, dtype=np.int32),
+                ],
+            )
+
+    def train(self, vectors: np.ndarray, seed: int = 0) -> None:
+        """Train the centroids with spherical k-means on a sample of `vectors`."""
+        rng = np.random.default_rng(seed)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        sample_size = min(len(vectors), nlist * IVF_TRAINING_POINTS_PER_LIST)
+        sample = np.asarray(
+            vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))],
+        )
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            labels = self._nearest(sample, centroids)
+            counts = np.bincount(labels, minlength=nlist)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(
+                sample[np.argsort(labels, kind="stable")],
+                starts[filled],
+                axis=0,
+            )
+            # Re-seed empty partitions with random sample points.
+            sums[~filled] = sample[rng.choice(len(sample), int((~filled).sum()))]
+            centroids = normalize_rows(sums)
+
+        self.centroids = centroids.astype(np.float32)
+        self.trained_size = len(vectors)
+        self.assignments[:] = -1
+        self._lists = None
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Assign rows to the partition of their nearest centroid."""
+        self.assignments[rows] = self._nearest(vectors, self.centroids)
+        self._lists = None
+
+    def remove(self, rows: list[int]) -> None:
+        """Remove rows from their partitions."""
+        self.assignments[rows] = -1
+        self._lists = None
+
+    def candidates(self, query: np.ndarray, nprobe: int | None = None) -> np.ndarray:
+        """Return the rows of the partitions closest to a normalized query."""
+        lists = self._partition_lists()
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([lists[probe] for probe in probes])
+
+    def save(self, path: Path) -> None:
+        """Write the centroids and row assignments to `path`."""
+        index_path = path / self.index_file
+        tmp_path = index_path.with_name(f"{index_path.name}.tmp")
+        with tmp_path.open("wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                assignments=self.assignments,
+                trained_size=self.trained_size,
+            )
+        tmp_path.replace(index_path)
+
+    def load(self, path: Path, capacity: int) -> None:
+        """Load the centroids and row assignments from `path`, if they exist."""
+        try:
+            with np.load(path / self.index_file) as index:
+                self.centroids = index["centroids"]
+                self.assignments = index["assignments"]
+                self.trained_size = (
+                    int(index["trained_size"])
+                    if "trained_size" in index
+                    else int((self.assignments >= 0).sum())
+                )
+        except FileNotFoundError:
+            self.centroids = None
+            self.assignments = np.full(0, -1, dtype=np.int32)
+            self.trained_size = 0
+        self.resize(capacity)
+        self._lists = None
+
+    def _partition_lists(self) -> list[np.ndarray]:
+        """Return the rows of each partition, rebuilding them after writes."""
+        if self._lists is None:
+            rows = np.flatnonzero(self.assignments >= 0)
+            labels = self.assignments[rows]
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=len(self.centroids))
+            self._lists = np.split(rows[order], np.cumsum(counts)[:-1])
+        return self._lists
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Return the index of the nearest centroid for each vector."""
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), QUERY_BLOCK_ROWS):
+            block = np.asarray(vectors[start : start + QUERY_BLOCK_ROWS])
+            labels[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return labels
+
+
+class LocalVectorStore(BaseVectorStore):
+    """NumPy-backed vector store persisted to a directory.
+
+    Vectors are L2-normalized and stored as float32 rows of a memory-mapped file, so
+    cosine similarity is a dot product. IDs and metadata are kept in memory and
+    written next to the vectors by `flush`. Deleted rows are recycled by later
+    upserts. Readers reload the store when another process flushes it.
+
+    Queries are exact by default. With `index_type="ivf"`, an `IVFIndex` is trained
+    on flush once the store holds `IVF_MIN_TRAIN_SIZE` vectors and then serves
+    approximate queries. It is retrained on flush whenever the store has grown
+    `IVF_RETRAIN_GROWTH` times past the size it was trained at.
+
+    The path holds the default namespace. Every other namespace is a store of its
+    own, in `namespaces/<namespace>/` next to it, opened on first use.
+    """
+
+    vectors_file = "vectors.f32"
+    index_file = "index.json"
+
+    def __init__(
+        self,
+        path: str | Path,
+        dimension: int,
+        index_type: str = "flat",
+        nlist: int | None = None,
+        nprobe: int = DEFAULT_IVF_NPROBE,
+    ) -> None:
+        """Open the store at `path`, creating it if it does not exist."""
+        if index_type not in ("flat", "ivf"):
+            msg = f"Unknown local vector index type '{index_type}'."
+            raise ValueError(msg)
+        self.path = Path(path)
+        self.dimension = dimension
+        self.index_type = index_type
+        self.ivf = IVFIndex(nlist=nlist, nprobe=nprobe) if index_type == "ivf" else None
+        self._namespaces = {}
+        self._lock = threading.RLock()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    @property
+    def vector_count(self) -> int:
+        """Number of stored (non-deleted) vectors."""
+        return len(self._positions)
+
+    def namespace(self, namespace: str) -> "LocalVectorStore":
+        """Return the store of a namespace, opening it on first use."""
+        if namespace == DEFAULT_NAMESPACE:
+            return self
+        with self._lock:
+            store = self._namespaces.get(namespace)
+            if store is None:
+                store = self._namespaces[namespace] = LocalVectorStore(
+                    namespace_path(self.path, namespace),
+                    self.dimension,
+                    index_type=self.index_type,
+                    nlist=self.ivf.nlist if self.ivf is not None else None,
+                    nprobe=self.ivf.nprobe if self.ivf is not None else DEFAULT_IVF_NPROBE,
+                )
+            return store
+
+    def query_index(
+        self,
+        vector: list[float],
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> list[VectorMatch]:
+        """Return the `top_k` matches with the highest cosine similarity."""
+        return self.query_many([vector], top_k=top_k, namespace=namespace)[0]
+
+    def query_many(
+        self,
+        vectors: list[list[float]],
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+        *,
+        exact: bool = False,
+    ) -> list[list[VectorMatch]]:
+        """Return the `top_k` matches for each query vector.
+
+        Uses the IVF index when it is trained, unless `exact` is set.
+        """
+        if namespace != DEFAULT_NAMESPACE:
+            return self.namespace(namespace).query_many(vectors, top_k, exact=exact)
+        self._reload_if_changed()
+        queries = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            if self.ivf is not None and self.ivf.is_trained and not exact:
+                scores, rows = self._ivf_top_k(queries, top_k)
+            else:
+                scores, rows = self._exact_top_k(queries, top_k)
+            return [
+                [
+                    VectorMatch(
+                        id=self._ids[row],
+                        score=float(score),
+                        metadata=self._metadata[row],
+                    )
+                    for score, row in zip(query_scores, query_rows, strict=True)
+                    if row >= 0
+                ]
+                for query_scores, query_rows in zip(scores, rows, strict=True)
+            ]
+
+    def upsert_vectors(self, vectors: list, namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """Insert or update `(id, values, metadata)` vectors."""
+        if namespace != DEFAULT_NAMESPACE:
+            return self.namespace(namespace).upsert_vectors(vectors)
+        ids = [vector[0] for vector in vectors]
+        values = normalize_rows(np.asarray([vector[1] for vector in vectors], np.float32))
+        metadata = [vector[2] if len(vector) > 2 else {} for vector in vectors]  # noqa: PLR2004
+        with self._lock:
+            rows = []
+            for vector_id, row_values, row_metadata in zip(
+                ids,
+                values,
+                metadata,
+                strict=True,
+            ):
+                row = self._positions.get(vector_id)
+                if row is None:
+                    row = self._allocate_row()
+                    self._positions[vector_id] = row
+                    self._ids[row] = vector_id
+                    self._alive[row] = True
+                self._vectors[row] = row_values
+                self._metadata[row] = row_metadata
+                rows.append(row)
+            if self.ivf is not None and self.ivf.is_trained:
+                self.ivf.add(np.asarray(rows), values)
+            self._dirty = True
+        return {"upserted_count": len(vectors)}
+
+    def delete_vectors(self, ids: list[str], namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """Delete vectors by ID, freeing their rows for reuse."""
+        if namespace != DEFAULT_NAMESPACE:
+            return self.namespace(namespace).delete_vectors(ids)
+        with self._lock:
+            rows = []
+            for vector_id in ids:
+                row = self._positions.pop(vector_id, None)
+                if row is None:
+                    continue
+                self._alive[row] = False
+                self._ids[row] = None
+                self._metadata[row] = None
+                self._free_rows.append(row)
+                rows.append(row)
+            if self.ivf is not None:
+                self.ivf.remove(rows)
+            self._dirty = True
+        return {}
+
+    def list_ids(self, prefix: str = "", namespace: str = DEFAULT_NAMESPACE) -> list[str]:
+        """Return the IDs of the vectors starting with `prefix`."""
+        if namespace != DEFAULT_NAMESPACE:
+            return self.namespace(namespace).list_ids(prefix)
+        with self._lock:
+            return [
+                vector_id for vector_id in self._positions if vector_id.startswith(prefix)
+            ]
+
+    def flush(self) -> None:
+        """Write vectors and the ID/metadata index to disk, in every open namespace.
+
+        The IVF index, if enabled, is trained here once the store is large enough,
+        and retrained once the store outgrows it.
+        """
+        with self._lock:
+            for store in self._namespaces.values():
+                store.flush()
+            if not self._dirty:
+                return
+            if self.ivf is not None:
+                if self._ivf_needs_training():
+                    self.train_index()
+                if self.ivf.is_trained:
+                    self.ivf.save(self.path)
+            self._vectors.flush()
+            index_path = self.path / self.index_file
+            tmp_path = index_path.with_name(f"{index_path.name}.tmp")
+            with tmp_path.open("w") as f:
+                json.dump(
+                    {
+                        "dimension": self.dimension,
+                        "size": self._size,
+                        "ids": self._ids[: self._size],
+                        "metadata": self._metadata[: self._size],
+                    },
+                    f,
+                )
+            tmp_path.replace(index_path)
+            self._index_mtime = index_path.stat().st_mtime_ns
+            self._dirty = False
+
+    def sample_vectors(self, count: int, seed: int = 0) -> np.ndarray:
+        """Return up to `count` randomly chosen stored vectors."""
+        rng = np.random.default_rng(seed)
+        with self._lock:
+            rows = np.flatnonzero(self._alive[: self._size])
+            rows = np.sort(rng.choice(rows, min(count, len(rows)), replace=False))
+            return np.asarray(self._vectors[rows])
+
+    def train_index(self) -> None:
+        """(Re)train the IVF index on the stored vectors and assign every row."""
+        if self.ivf is None:
+            msg = "The local vector store was not configured with an IVF index."
+            raise ValueError(msg)
+        with self._lock:
+            rows = np.flatnonzero(self._alive[: self._size])
+            self.ivf.resize(len(self._vectors))
+            self.ivf.train(self._vectors[rows])
+            for start in range(0, len(rows), QUERY_BLOCK_ROWS):
+                block_rows = rows[start : start + QUERY_BLOCK_ROWS]
+                self.ivf.add(block_rows, self._vectors[block_rows])
+            self._dirty = True
+
+    def _ivf_needs_training(self) -> bool:
+        """Whether the IVF index is untrained or outgrown by the store."""
+        if not self.ivf.is_trained:
+            return self.vector_count >= IVF_MIN_TRAIN_SIZE
+        return self.vector_count >= IVF_RETRAIN_GROWTH * self.ivf.trained_size
+
+    def _load(self) -> None:
+        """Load the index and map the vectors file."""
+        index_path = self.path / self.index_file
+        try:
+            with index_path.open() as f:
+                index = json.load(f)
+            self._index_mtime = index_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            index = {"dimension": self.dimension, "size": 0, "ids": [], "metadata": []}
+            self._index_mtime = None
+        if index["dimension"] != self.dimension:
+            msg = (
+                f"Local vector store at {self.path} has dimension {index['dimension']}, "
+                f"expected {self.dimension}."
+            )
+            raise ValueError(msg)
+
+        self._size = index["size"]
+        self._map_vectors(max(self._size, INITIAL_CAPACITY))
+        capacity = len(self._vectors)
+        self._ids = index["ids"] + [None] * (capacity - self._size)
+        self._metadata = index["metadata"] + [None] * (capacity - self._size)
+        self._alive = np.array([vector_id is not None for vector_id in self._ids])
+        self._positions = {
+            vector_id: row for row, vector_id in enumerate(self._ids) if vector_id
+        }
+        self._free_rows = [row for row in range(self._size) if not self._alive[row]]
+        if self.ivf is not None:
+            self.ivf.load(self.path, capacity)
+        self._dirty = False
+
+    def _reload_if_changed(self) -> None:
+        """Reload the store if another process has flushed it since it was loaded."""
+        try:
+            mtime = (self.path / self.index_file).stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._index_mtime:
+            with self._lock:
+                if not self._dirty:
+                    self._load()
+
+    def _map_vectors(self, capacity: int) -> None:
+        """Memory-map the vectors file with room for `capacity` rows."""
+        vectors_path = self.path / self.vectors_file
+        row_bytes = self.dimension * np.dtype(np.float32).itemsize
+        with vectors_path.open("ab") as f:
+            if f.tell() < capacity * row_bytes:
+                f.truncate(capacity * row_bytes)
+        capacity = vectors_path.stat().st_size // row_bytes
+        self._vectors = np.memmap(
+            vectors_path,
+            dtype=np.float32,
+            mode="r+",
+            shape=(capacity, self.dimension),
+        )
+
+    def _allocate_row(self) -> int:
+        """Return a free row, growing the vectors file when it is full."""
+        if self._free_rows:
+            return self._free_rows.pop()
+        if self._size == len(self._vectors):
+            capacity = 2 * len(self._vectors)
+            self._vectors.flush()
+            self._map_vectors(capacity)
+            self._ids.extend([None] * (capacity - len(self._ids)))
+            self._metadata.extend([None] * (capacity - len(self._metadata)))
+            self._alive = np.concatenate(
+                [self._alive, np.zeros(capacity - len(self._alive), dtype=bool)],
+            )
+            if self.ivf is not None:
+                self.ivf.resize(capacity)
+        self._size += 1
+        return self._size - 1
+
+    def _ivf_top_k(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Score only the rows of each query's closest IVF partitions."""
+        best_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), top_k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            rows = self.ivf.candidates(query)
+            if not len(rows):
+                continue
+            scores = self._vectors[rows] @ query
+            k = min(top_k, len(rows))
+            keep = np.argpartition(-scores, k - 1)[:k]
+            keep = keep[np.argsort(-scores[keep])]
+            best_scores[i, :k] = scores[keep]
+            best_rows[i, :k] = rows[keep]
+        return best_scores, best_rows
+
+    def _exact_top_k(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Score every stored row against the queries and keep the best `top_k`.
+
+        Rows are scored in blocks and reduced with `argpartition`, so memory stays
+        bounded regardless of the store size. Missing results have row -1.
+        """
+        best_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), top_k), -1, dtype=np.int64)
+        for start in range(0, self._size, QUERY_BLOCK_ROWS):
+            stop = min(start + QUERY_BLOCK_ROWS, self._size)
+            block_scores = queries @ self._vectors[start:stop].T
+            block_scores[:, ~self._alive[start:stop]] = -np.inf
+            block_rows = np.broadcast_to(np.arange(start, stop), block_scores.shape)
+
+            scores = np.concatenate([best_scores, block_scores], axis=1)
+            rows = np.concatenate([best_rows, block_rows], axis=1)
+            keep = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_rows[np.isneginf(best_scores)] = -1
+        return best_scores, best_rows
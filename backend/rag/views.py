@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+
+from rag.tracing import render_metrics
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Export the latency metrics of this process in the Prometheus text format.
+
+    Only addresses in METRICS_ALLOWED_IPS, local ones by default, may read them.
+    """
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponse(status=403)
+    return HttpResponse(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
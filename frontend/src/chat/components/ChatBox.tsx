@@ -11,17 +11,30 @@ interface ChatBoxProps {
 export function ChatBox({ activeHistoryId }: ChatBoxProps) {
   const [messages, setMessages] = useState<Message[]>([]);
   const [inputValue, setInputValue] = useState('');
+  const [olderPageUrl, setOlderPageUrl] = useState<string | null>(null);
 
-  useEffect(() => {
-    if (activeHistoryId) {
-      fetch(`${import.meta.env.VITE_API_BASE_URL}${API.CHAT_API.histories.messages(activeHistoryId)}`)
-        .then(res => res.json())
-        .then(data => setMessages(data.map((msg: any) => ({
+  // Loads a page of messages and prepends it, keeping the link to the page before it.
+  const loadMessages = (url: string) => {
+    fetch(url)
+      .then(res => {
+        const prevLink = res.headers.get('Link')?.match(/<([^>]+)>;\s*rel="prev"/);
+        setOlderPageUrl(prevLink ? prevLink[1] : null);
+        return res.json();
+      })
+      .then(data => setMessages(prev => [
+        ...data.map((msg: any) => ({
           content: msg.content,
           sender: msg.role === 'user' ? 'user' : 'bot'
-        }))));
-    } else {
-      setMessages([]);
+        })),
+        ...prev
+      ]));
+  };
+
+  useEffect(() => {
+    setMessages([]);
+    setOlderPageUrl(null);
+    if (activeHistoryId) {
+      loadMessages(`${import.meta.env.VITE_API_BASE_URL}${API.CHAT_API.histories.messages(activeHistoryId)}`);
     }
   }, [activeHistoryId]);
 
@@ -76,8 +89,26 @@ export function ChatBox({ activeHistoryId }: ChatBoxProps) {
     };
 
     eventSource.onerror = (error) => {
-      console.error("SSE Error:", error);
-      eventSource.close();
+      // An `error` event sent by the server ends a stream whose answer failed.
+      if (error instanceof MessageEvent) {
+        eventSource.close();
+        setMessages(prev => {
+          const updated = [...prev];
+          const lastMessage = updated[updated.length - 1];
+          if (lastMessage?.sender === 'bot' && !lastMessage.content) {
+            lastMessage.content = error.data;
+          } else {
+            updated.push({ content: error.data, sender: 'bot' });
+          }
+          return updated;
+        });
+        return;
+      }
+      // Unless the stream was closed, the browser reconnects and resumes it from
+      // the last event received.
+      if (eventSource.readyState === EventSource.CLOSED) {
+        console.error("SSE Error:", error);
+      }
     };
     setInputValue('');
   };
@@ -85,6 +116,16 @@ export function ChatBox({ activeHistoryId }: ChatBoxProps) {
   return (
     <Box style={{ display: 'flex', flexDirection: 'column', minHeight: '100vh' }}>
       <ScrollArea style={{ flexGrow: 1, paddingBottom: '120px' }}>
+        {olderPageUrl && (
+          <Button
+            onClick={() => loadMessages(olderPageUrl)}
+            variant="subtle"
+            fullWidth
+            mb="md"
+          >
+            Load earlier messages
+          </Button>
+        )}
         {messages.map((msg, idx) => (
           <Box
             key={idx}
@@ -1,6 +1,7 @@
+import { Button } from '@mantine/core';
 import { useEffect, useState } from 'react';
 import { ChatRow } from './ChatRow';
-import { ChatHistory } from '../types';
+import { ChatHistory, ChatHistoryPage } from '../types';
 import { API } from '../../constants/api';
 
 interface ChatHistoryListProps {
@@ -15,11 +16,22 @@ export function ChatHistoryList({
     searchQuery
 }: ChatHistoryListProps) {
     const [histories, setHistories] = useState<ChatHistory[]>([]);
+    const [nextPageUrl, setNextPageUrl] = useState<string | null>(null);
+    const [isLoading, setIsLoading] = useState(false);
 
-    useEffect(() => {
-        fetch(`${import.meta.env.VITE_API_BASE_URL}${API.CHAT_API.histories.list}`)
+    const loadPage = (url: string, append: boolean) => {
+        setIsLoading(true);
+        fetch(url)
             .then(res => res.json())
-            .then(data => setHistories(data));
+            .then((data: ChatHistoryPage) => {
+                setHistories(prev => append ? [...prev, ...data.results] : data.results);
+                setNextPageUrl(data.next);
+            })
+            .finally(() => setIsLoading(false));
+    };
+
+    useEffect(() => {
+        loadPage(`${import.meta.env.VITE_API_BASE_URL}${API.CHAT_API.histories.list}`, false);
     }, []);
 
     const filteredHistories = histories.filter(history =>
@@ -36,6 +48,16 @@ export function ChatHistoryList({
                     onClick={() => onHistorySelect(chat.id)}
                 />
             ))}
+            {nextPageUrl && (
+                <Button
+                    onClick={() => loadPage(nextPageUrl, true)}
+                    variant="subtle"
+                    fullWidth
+                    loading={isLoading}
+                >
+                    Load more
+                </Button>
+            )}
         </>
     );
 }
@@ -9,3 +9,9 @@ export interface ChatHistory {
   created_at: string;
   updated_at: string;
 }
+
+export interface ChatHistoryPage {
+  next: string | null;
+  previous: string | null;
+  results: ChatHistory[];
+}